@@ -10,16 +10,32 @@ import time
 import random
 import subprocess
 import shutil
+import multiprocessing
 from typing import List, Dict, Any, Optional, Tuple, Callable
 from dataclasses import dataclass
+from contextlib import contextmanager, nullcontext, ExitStack
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from gpt_request import *
 from prompts import *
 from utils import *
 from scope_refine import *
 from external_assets import process_storyboard_with_assets
+from render_server import RenderJob, build_render_config, get_render_server, run_probe
+from render_server import get_render_profile, profile_quality_dir, profile_cli_flags
+from render_cache import RenderCache, compute_render_key
+from block_render import manifest_path_for, load_manifest, plan_incremental_render, save_manifest
+from block_render import split_animation_blocks, plan_split_ranges, concat_videos
+from render_cost import RenderCostEstimate, estimate_render_cost, log_render_time
+from render_slots import RenderSlots
+from memory_admission import MemoryAdmission
+from glyph_cache import launcher_cmd as glyph_launcher_cmd, prebuild_glyphs
+from async_gpt_request import ASYNC_COUNTERPARTS, submit
+from video_proxy import proxy_video
+from manim_autofix import ManimAutoFixer
+from manim_api_index import get_api_validator
+from fix_knowledge_base import get_fix_knowledge_base
 
 
 @dataclass
@@ -58,6 +74,38 @@ class RunConfig:
     max_regenerate_tries: int = 10
     max_feedback_gen_code_tries: int = 3
     max_mllm_fix_bugs_tries: int = 3
+    use_render_server: bool = False
+    render_server_workers: int = 1
+    render_worker_max_jobs: int = 50
+    incremental_render: bool = False
+    use_probe: bool = False
+    use_render_profiles: bool = False
+    final_resolution: str = "1920,1080"
+    final_fps: int = 30
+    use_render_cache: bool = False
+    render_cache_dir: str = ""
+    render_cache_max_mb: int = 5000
+    use_cost_scheduling: bool = False
+    use_render_slots: bool = False
+    render_slots: int = 0
+    render_slot_dir: str = ""
+    stream_sections: bool = False
+    use_memory_admission: bool = False
+    render_memory_reserve_mb: int = 1024
+    split_render: bool = False
+    use_glyph_cache: bool = False
+    glyph_cache_dir: str = ""
+    glyph_cache_max_mb: int = 2000
+    prebuild_glyphs: bool = False
+    use_async_llm: bool = False
+    llm_cache: str = "off"
+    hedge_requests: bool = False
+    use_autofix: bool = False
+    use_api_validator: bool = False
+    use_fix_memo: bool = False
+    speculative_fixes: int = 0
+    use_fix_kb: bool = False
+    fix_kb_path: str = ""
 
 
 class TeachingVideoAgent:
@@ -87,6 +135,23 @@ class TeachingVideoAgent:
         self.max_regenerate_tries = cfg.max_regenerate_tries
         self.max_feedback_gen_code_tries = cfg.max_feedback_gen_code_tries
         self.max_mllm_fix_bugs_tries = cfg.max_mllm_fix_bugs_tries
+        self.use_render_server = cfg.use_render_server
+        self.render_cache = (
+            RenderCache(cfg.render_cache_dir or None, max_size_mb=cfg.render_cache_max_mb) if cfg.use_render_cache else None
+        )
+        self.render_slots = (
+            RenderSlots(cfg.render_slots or None, cfg.render_slot_dir or None) if cfg.use_render_slots else None
+        )
+        self.render_slot_wait = {}
+        self.glyph_cache = (
+            {"cache_dir": cfg.glyph_cache_dir or None, "max_size_mb": cfg.glyph_cache_max_mb} if cfg.use_glyph_cache else None
+        )
+        if cfg.llm_cache != "off":
+            # gpt_request reads the mode per call; the environment also carries it into worker processes
+            os.environ["LLM_CACHE_MODE"] = cfg.llm_cache
+        if cfg.hedge_requests:
+            os.environ["HEDGING_ENABLED"] = "1"
+        self.memory_admission = MemoryAdmission(reserve_mb=cfg.render_memory_reserve_mb) if cfg.use_memory_admission else None
 
         """2. Path for output"""
         self.output_dir = get_output_dir(idx=idx, knowledge_point=self.learning_topic, base_dir=folder)
@@ -96,7 +161,16 @@ class TeachingVideoAgent:
         self.assets_dir.mkdir(exist_ok=True)
 
         """3. ScopeRefine & Anchor Visual"""
-        self.scope_refine_fixer = ScopeRefineFixer(self.API, self.max_code_token_length)
+        self.scope_refine_fixer = ScopeRefineFixer(
+            self.API,
+            self.max_code_token_length,
+            probe_func=self._probe_scene if cfg.use_probe else None,
+            api_validator=get_api_validator() if cfg.use_api_validator else None,
+            use_fix_memo=cfg.use_fix_memo,
+            speculative_fixes=cfg.speculative_fixes,
+            fix_kb=get_fix_knowledge_base(cfg.fix_kb_path or None) if cfg.use_fix_kb else None,
+        )
+        self.autofixer = ManimAutoFixer(self.scope_refine_fixer.analyzer) if cfg.use_autofix else None
         self.extractor = GridPositionExtractor()
 
         """4. External Database"""
@@ -119,25 +193,28 @@ class TeachingVideoAgent:
         self.video_feedbacks = {}
 
         """6. For Efficiency"""
-        self.token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cache_hits": 0, "cache_misses": 0}
 
     def _request_api_and_track_tokens(self, prompt, max_tokens=10000):
         """packages API requests and automatically accumulates token usage"""
         response, usage = self.API(prompt, max_tokens=max_tokens)
+        self._track_usage(usage)
+        return response
+
+    def _track_usage(self, usage):
         if usage:
             self.token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
             self.token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
             self.token_usage["total_tokens"] += usage.get("total_tokens", 0)
-        return response
+            self.token_usage["cache_hits"] += usage.get("cache_hits", 0)
+            self.token_usage["cache_misses"] += usage.get("cache_misses", 0)
 
     def _request_video_api_and_track_tokens(self, prompt, video_path):
         """Wraps video API requests and accumulates token usage automatically"""
-        response, usage = request_gemini_video_img_token(prompt=prompt, video_path=video_path, image_path=self.GRID_IMG_PATH)
-
-        if usage:
-            self.token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
-            self.token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
-            self.token_usage["total_tokens"] += usage.get("total_tokens", 0)
+        response, usage = request_gemini_video_img_token(
+            prompt=prompt, video_path=proxy_video(video_path, "layout"), image_path=self.GRID_IMG_PATH
+        )
+        self._track_usage(usage)
         return response
 
     def get_serializable_state(self):
@@ -303,6 +380,15 @@ class TeachingVideoAgent:
 
     def generate_section_code(self, section: Section, attempt: int = 1, feedback_improvements=None) -> str:
         """Generate Manim code for a single section"""
+        code_gen_prompt, code = self._section_code_prompt(section, attempt, feedback_improvements)
+        if code_gen_prompt is None:
+            return code
+
+        response = self._request_api_and_track_tokens(code_gen_prompt, max_tokens=self.max_code_token_length)
+        return self._finish_section_code(section, response)
+
+    def _section_code_prompt(self, section: Section, attempt: int = 1, feedback_improvements=None) -> Tuple[Optional[str], Optional[str]]:
+        """(prompt, None) when the LLM has to write the code, (None, code) when it is already settled"""
         code_file = self.output_dir / f"{section.id}.py"
 
         if attempt == 1 and code_file.exists() and not feedback_improvements:
@@ -310,7 +396,7 @@ class TeachingVideoAgent:
             with open(code_file, "r", encoding="utf-8") as f:
                 code = f.read()
                 self.section_codes[section.id] = code
-                return code
+                return None, code
         # print(f"💻 正在为 {section.id} 生成 Manim 代码 (尝试 {attempt}/{self.max_regenerate_tries})...")
         regenerate_note = ""
         if attempt > 1:
@@ -327,7 +413,7 @@ class TeachingVideoAgent:
                     f.write(modified_code)
 
                 self.section_codes[section.id] = modified_code
-                return modified_code
+                return None, modified_code
             except Exception as e:
                 print(f"⚠️ GridCodeModifier 失败，回退到原始代码: {e}")
                 code_gen_prompt = get_feedback_improve_code(
@@ -336,8 +422,10 @@ class TeachingVideoAgent:
 
         else:
             code_gen_prompt = get_prompt3_code(regenerate_note=regenerate_note, section=section, base_class=base_class)
+        return code_gen_prompt, None
 
-        response = self._request_api_and_track_tokens(code_gen_prompt, max_tokens=self.max_code_token_length)
+    def _finish_section_code(self, section: Section, response) -> str:
+        code_file = self.output_dir / f"{section.id}.py"
         if response is None:
             print(f"❌ 通过 API 生成 {section.id} 代码失败。")
             return ""
@@ -364,7 +452,7 @@ class TeachingVideoAgent:
         self.section_codes[section.id] = code
         return code
 
-    def debug_and_fix_code(self, section_id: str, max_fix_attempts: int = 3) -> bool:
+    def debug_and_fix_code(self, section_id: str, max_fix_attempts: int = 3, profile: str = "preview") -> bool:
         """Enhanced debug and fix code method"""
         if section_id not in self.section_codes:
             code_file = self.output_dir / f"{section_id}.py"
@@ -375,32 +463,45 @@ class TeachingVideoAgent:
             else:
                 return False
 
+        autofixed = None  # (rules applied, error they targeted), judged by the next render
+        llm_fixed = None  # (code before, error, code after) of the last fix_code_smart fix, learned from the next render
         for fix_attempt in range(max_fix_attempts):
             print(f"🔧 {self.learning_topic} 正在调试 {section_id} (尝试 {fix_attempt + 1}/{max_fix_attempts})")
 
             try:
                 scene_name = f"{section_id.title().replace('_', '')}Scene"
                 code_file = f"{section_id}.py"
-                cmd = ["manim", "-ql", str(code_file), scene_name]
-
-                result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.output_dir, timeout=300)
-
-                if result.returncode == 0:
-                    video_patterns = [
-                        self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / "480p15" / f"{scene_name}.mp4",
-                        self.output_dir / "media" / "videos" / "480p15" / f"{scene_name}.mp4",
-                        self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / "1080p60" / f"{scene_name}.mp4",
-                        self.output_dir / "media" / "videos" / "1080p60" / f"{scene_name}.mp4",
-                    ]
 
-                    for video_path in video_patterns:
-                        if video_path.exists():
-                            self.section_videos[section_id] = str(video_path)
-                            print(f"✅ {self.learning_topic} {section_id} 完成")
-                            return True
+                success, video_path, error_msg = self._render_checked(section_id, code_file, scene_name, profile)
+                if autofixed is not None:
+                    self.autofixer.record_outcome(*autofixed, None if success else error_msg)
+                    autofixed = None
+                if llm_fixed is not None:
+                    self.scope_refine_fixer.learn_fix(*llm_fixed, None if success else error_msg)
+                    llm_fixed = None
+                if success:
+                    self.section_videos[section_id] = video_path
+                    print(f"✅ {self.learning_topic} {section_id} 完成")
+                    return True
 
                 current_code = self.section_codes[section_id]
-                fixed_code = self.scope_refine_fixer.fix_code_smart(section_id, current_code, result.stderr, self.output_dir)
+                memo = self.scope_refine_fixer.fix_memo(section_id)
+                fixed_code, applied = self.autofixer.fix(current_code, error_msg) if self.autofixer else (None, [])
+                if fixed_code:
+                    # Mechanical API drift: rewritten without an LLM round-trip
+                    print(f"🩹 {self.learning_topic} {section_id} 规则修复: {', '.join(applied)}")
+                    autofixed = (applied, error_msg)
+                elif memo is not None and not memo.start_fix_round(error_msg):
+                    print(f"🛑 {self.learning_topic} {section_id} 同一错误已修复多轮仍未解决，转为重新生成")
+                    break
+                else:
+                    fixed_code = self.scope_refine_fixer.fix_code_smart(section_id, current_code, error_msg, self.output_dir)
+                    if fixed_code:
+                        llm_fixed = (current_code, error_msg, fixed_code)
+
+                if fixed_code and memo is not None and memo.is_cycle(fixed_code):
+                    print(f"🔁 {self.learning_topic} {section_id} 修复结果是已失败过的代码版本，转为重新生成")
+                    break
 
                 if fixed_code:
                     self.section_codes[section_id] = fixed_code
@@ -418,6 +519,326 @@ class TeachingVideoAgent:
 
         return False
 
+    def _render_checked(self, section_id: str, code_file: str, scene_name: str, profile: str) -> Tuple[bool, Optional[str], str]:
+        """_render_scene, skipped when the fix memo or the static check already knows the code fails"""
+        code = self.section_codes[section_id]
+        memo = self.scope_refine_fixer.fix_memo(section_id)
+        stage = f"render:{profile}"
+        known = memo.lookup(code, stage) if memo is not None else None
+        if known is not None and not known.ok:
+            print(f"♻️ {self.learning_topic} {section_id} 该版本代码已渲染失败过，复用错误信息")
+            return False, None, known.error_msg
+
+        if self.scope_refine_fixer.api_validator is not None:
+            static_ok, error_msg = self.scope_refine_fixer.validate_code_syntax(code)
+            if not static_ok:
+                # Undefined names / bad attributes / bad keywords: no need to launch manim to learn that
+                print(f"🧪 {self.learning_topic} {section_id} 静态检查未通过，跳过渲染")
+                if memo is not None:
+                    memo.record(code, "static", False, error_msg)
+                return False, None, error_msg
+
+        success, video_path, error_msg = self._render_scene(code_file, scene_name, profile=profile)
+        if memo is not None and not success:
+            memo.record(code, stage, False, error_msg)
+        return success, video_path, error_msg
+
+    def _probe_scene(self, code_file: str, scene_name: str, cwd=None, timeout: Optional[int] = None) -> Tuple[bool, str]:
+        """Run construct() without writing frames or encoding; returns (ok, error_msg).
+
+        The probe gets the render's timeout: a slow construct() (many MathTex on a cold LaTeX
+        cache) is not a code error, so a probe that times out is inconclusive and counts as passed.
+        """
+        cwd = Path(cwd or self.output_dir)
+        if timeout is None:
+            timeout = self._default_render_timeout((cwd / code_file).read_text(encoding="utf-8"))
+        server = get_render_server(self.cfg.render_server_workers, self.cfg.render_worker_max_jobs) if self.use_render_server else None
+        with self._render_slot(Path(code_file).stem):
+            result = run_probe(code_file, scene_name, cwd, timeout=timeout, server=server, glyph_cache=self.glyph_cache)
+        if result.error_type == "TimeoutExpired":
+            print(f"⌛ {self.learning_topic} {Path(code_file).stem} 探测运行超过 {timeout}s，交由完整渲染判断")
+            return True, ""
+        return result.success, result.stderr
+
+    def _default_render_timeout(self, code: str, profile: str = "preview") -> int:
+        if self.cfg.use_cost_scheduling:
+            return estimate_render_cost(code, self._render_profile(profile)).timeout()
+        return 300
+
+    @contextmanager
+    def _render_slot(self, section_id: str):
+        """Hold a host-wide render slot while manim runs"""
+        if self.render_slots is None:
+            yield
+            return
+        with self.render_slots.acquire() as waited:
+            self.render_slot_wait[section_id] = self.render_slot_wait.get(section_id, 0.0) + waited
+            if waited >= 1:
+                print(f"⏳ {self.learning_topic} {section_id} 等待渲染槽位 {waited:.1f}s")
+            yield
+
+    def _extra_render_slots(self, stack: ExitStack, wanted: int) -> int:
+        """Take up to `wanted` further render slots without waiting, held until the stack closes"""
+        if self.render_slots is None:
+            return wanted
+        held = 0
+        while held < wanted and stack.enter_context(self.render_slots.acquire_nowait()):
+            held += 1
+        return held
+
+    def _render_profile(self, profile: str) -> Dict[str, Any]:
+        return get_render_profile(profile, final_resolution=self.cfg.final_resolution, final_fps=self.cfg.final_fps)
+
+    def _estimate_render_cost(self, section_id: str, profile: str = "preview") -> RenderCostEstimate:
+        code = self.section_codes.get(section_id)
+        if code is None:
+            code_file = self.output_dir / f"{section_id}.py"
+            code = code_file.read_text(encoding="utf-8") if code_file.exists() else ""
+        return estimate_render_cost(code, self._render_profile(profile))
+
+    def _render_scene(
+        self, code_file: str, scene_name: str, timeout: Optional[int] = None, profile: str = "preview"
+    ) -> Tuple[bool, Optional[str], str]:
+        """Render one scene with a render profile (or fetch it from the render cache); returns (success, video_path, error_msg)"""
+        settings = self._render_profile(profile)
+        section_id = Path(code_file).stem
+        estimate = self._estimate_render_cost(section_id, profile) if self.cfg.use_cost_scheduling else None
+        if timeout is None:
+            timeout = estimate.timeout() if estimate is not None else 300
+        cache_key = None
+        if self.render_cache is not None:
+            with open(self.output_dir / code_file, "r", encoding="utf-8") as f:
+                code = f.read()
+            cache_key = compute_render_key(code, scene_name, settings, self.output_dir)
+            dest_path = (
+                self.output_dir / "media" / "videos" / Path(code_file).stem / profile_quality_dir(settings) / f"{scene_name}.mp4"
+            )
+            cached_video = self.render_cache.get(cache_key, dest_path)
+            if cached_video:
+                print(f"♻️ {self.learning_topic} {Path(code_file).stem} 命中渲染缓存")
+                return True, cached_video, ""
+
+        # Cheap probe first: a real encode only happens once construct() runs through
+        if self.cfg.use_probe:
+            probe_ok, probe_error = self._probe_scene(code_file, scene_name, timeout=timeout)
+            if not probe_ok:
+                print(f"🔍 {self.learning_topic} {Path(code_file).stem} 探测运行失败，跳过渲染")
+                return False, None, probe_error
+
+        success, video_path, error_msg = self._render_scene_admitted(code_file, scene_name, timeout, profile, estimate)
+
+        if success and cache_key is not None:
+            self.render_cache.put(cache_key, video_path)
+        return success, video_path, error_msg
+
+    def _render_scene_timed(
+        self, code_file: str, scene_name: str, timeout: int, profile: str, estimate: Optional[RenderCostEstimate], tracker=None
+    ) -> Tuple[bool, Optional[str], str]:
+        """_render_scene_uncached, logging its own wall time (no slot or memory waits) for cost calibration"""
+        if estimate is None:
+            return self._render_scene_uncached(code_file, scene_name, timeout, profile, tracker)
+        log_path = self.output_dir / "render_times.jsonl"
+        section_id = Path(code_file).stem
+        start = time.time()
+        try:
+            success, video_path, error_msg = self._render_scene_uncached(code_file, scene_name, timeout, profile, tracker)
+        except subprocess.TimeoutExpired:
+            log_render_time(log_path, section_id, profile, estimate, time.time() - start, False)
+            raise
+        aborted = tracker is not None and tracker.killed_for_pressure
+        log_render_time(log_path, section_id, profile, estimate, time.time() - start, success, aborted=aborted)
+        return success, video_path, error_msg
+
+    def _render_scene_admitted(
+        self,
+        code_file: str,
+        scene_name: str,
+        timeout: int = 300,
+        profile: str = "preview",
+        estimate: Optional[RenderCostEstimate] = None,
+        max_requeues: int = 3,
+    ) -> Tuple[bool, Optional[str], str]:
+        """Render once memory admission lets the scene in, then under a render slot; renders killed for memory pressure are requeued.
+
+        Memory is admitted before the slot is taken, so a render waiting for memory never keeps a
+        slot idle that a render fitting in memory could use.
+        """
+        section_id = Path(code_file).stem
+        if self.memory_admission is None:
+            with self._render_slot(section_id):
+                return self._render_scene_timed(code_file, scene_name, timeout, profile, estimate)
+
+        key = f"{topic_to_safe_name(self.learning_topic)}/{scene_name}/{profile}"
+        for requeue in range(max_requeues + 1):
+            with self.memory_admission.admit(key) as tracker:
+                if tracker.waited >= 1:
+                    print(f"🧠 {self.learning_topic} {section_id} 等待内存 {tracker.waited:.1f}s")
+                with self._render_slot(section_id):
+                    success, video_path, error_msg = self._render_scene_timed(code_file, scene_name, timeout, profile, estimate, tracker)
+            if not tracker.killed_for_pressure:
+                return success, video_path, error_msg
+            print(f"🧠 {self.learning_topic} {section_id} 内存不足，渲染已中止并重新排队 ({requeue + 1}/{max_requeues})")
+        return False, None, "Render aborted repeatedly under host memory pressure"
+
+    def _render_scene_split(
+        self, code_file: str, scene_name: str, timeout: int, settings: Dict[str, Any], tracker=None
+    ) -> Optional[Tuple[bool, Optional[str], str]]:
+        """Render a long scene as parallel sub-renders cut at lecture-line blocks, then concat them.
+
+        Every sub-render runs construct() from the start with the animations before its range
+        skipped, so the state its blocks depend on is rebuilt without encoding. Returns None when
+        the scene is not worth splitting.
+        """
+        server = get_render_server(self.cfg.render_server_workers, self.cfg.render_worker_max_jobs)
+        cwd = str(self.output_dir)
+        section_id = Path(code_file).stem
+        with open(self.output_dir / code_file, "r", encoding="utf-8") as f:
+            block_lines = split_animation_blocks(f.read(), scene_name).block_lines
+        if len(block_lines) < 2:
+            return None
+
+        probe = server.render(
+            RenderJob(
+                code_file,
+                scene_name,
+                cwd,
+                config=build_render_config(code_file, scene_name, cwd, quality="l"),
+                timeout=timeout,
+                mode="probe",
+                incremental={"block_lines": block_lines, "start_animation": 0, "reuse_partials": []},
+                glyph_cache=self.glyph_cache,
+            ),
+            track=tracker.track if tracker is not None else None,
+        )
+        if probe.error_type == "TimeoutExpired":
+            return None  # inconclusive: leave it to the whole-scene render
+        if not probe.success:
+            return False, None, probe.stderr
+        ranges = plan_split_ranges(probe.block_of_play, server.num_workers)
+        if len(ranges) < 2:
+            return None
+
+        video_dir = self.output_dir / "media" / "videos" / section_id / profile_quality_dir(settings)
+        jobs = []
+        for idx, (first, last) in enumerate(ranges):
+            overrides = {
+                "output_file": f"{scene_name}_part{idx}",
+                "partial_movie_dir": str(video_dir / "partial_movie_files" / f"{scene_name}_part{idx}"),
+                "from_animation_number": first,
+            }
+            if idx < len(ranges) - 1:
+                overrides["upto_animation_number"] = last
+            config = build_render_config(code_file, scene_name, cwd, **{**settings, **overrides})
+            jobs.append(RenderJob(code_file, scene_name, cwd, config=config, timeout=timeout, glyph_cache=self.glyph_cache))
+        print(f"✂️ {self.learning_topic} {section_id} 拆分为 {len(jobs)} 段并行渲染: {ranges}")
+
+        def render_lane(lane):
+            return [(idx, server.render(job, track=tracker.track if tracker is not None else None)) for idx, job in lane]
+
+        results = [None] * len(jobs)
+        with ExitStack() as stack:
+            # Waiting for more slots while holding one deadlocks once every slot belongs to a split
+            # section; parts that get no free slot run one after another under the section's own slot
+            extra = self._extra_render_slots(stack, len(jobs) - 1)
+            indexed = list(enumerate(jobs))
+            lanes = [indexed[:1] + indexed[1 + extra :]] + [[part] for part in indexed[1 : 1 + extra]]
+            with ThreadPoolExecutor(max_workers=len(lanes)) as executor:
+                for lane_results in executor.map(render_lane, lanes):
+                    for idx, result in lane_results:
+                        results[idx] = result
+
+        for result in results:
+            if result.error_type == "TimeoutExpired":
+                raise subprocess.TimeoutExpired(cmd=f"render {code_file} {scene_name}", timeout=timeout)
+            if not (result.success and result.video_path and os.path.exists(result.video_path)):
+                return False, None, result.stderr
+
+        output_path = video_dir / f"{scene_name}.mp4"
+        if not concat_videos([r.video_path for r in results], output_path):
+            print(f"⚠️ {self.learning_topic} {section_id} 分段视频拼接失败，改为整段渲染")
+            return None
+        return True, str(output_path), ""
+
+    def _render_scene_uncached(
+        self, code_file: str, scene_name: str, timeout: int = 300, profile: str = "preview", tracker=None
+    ) -> Tuple[bool, Optional[str], str]:
+        """`tracker` is the memory admission sampler; the processes running this render are registered with it"""
+        settings = self._render_profile(profile)
+        if self.use_render_server and self.cfg.split_render and self.cfg.render_server_workers > 1:
+            split_result = self._render_scene_split(code_file, scene_name, timeout, settings, tracker)
+            if split_result is not None:
+                return split_result
+
+        if self.use_render_server:
+            server = get_render_server(self.cfg.render_server_workers, self.cfg.render_worker_max_jobs)
+            config = build_render_config(code_file, scene_name, str(self.output_dir), **settings)
+            job = RenderJob(
+                code_file, scene_name, str(self.output_dir), config=config, timeout=timeout, glyph_cache=self.glyph_cache
+            )
+
+            # Reuse the partial movies of unchanged leading animation blocks
+            config_key = json.dumps(settings, sort_keys=True)
+            if self.cfg.incremental_render:
+                with open(self.output_dir / code_file, "r", encoding="utf-8") as f:
+                    code = f.read()
+                manifest = load_manifest(manifest_path_for(self.output_dir, scene_name))
+                job.incremental = plan_incremental_render(code, scene_name, manifest, config_key)
+                if job.incremental["start_animation"] > 0:
+                    print(
+                        f"⏩ {self.learning_topic} {Path(code_file).stem} 复用前 {job.incremental['start_animation']} 个动画，"
+                        f"从第 {job.incremental['first_changed_block'] + 1} 个讲解块开始渲染"
+                    )
+
+            result = server.render(job, track=tracker.track if tracker is not None else None)
+            if result.error_type == "TimeoutExpired":
+                raise subprocess.TimeoutExpired(cmd=f"render {code_file} {scene_name}", timeout=timeout)
+            if result.success and result.video_path and os.path.exists(result.video_path):
+                if job.incremental is not None and result.partial_movie_files:
+                    try:
+                        save_manifest(
+                            self.output_dir,
+                            scene_name,
+                            config_key,
+                            job.incremental["fingerprints"],
+                            result.block_of_play,
+                            result.partial_movie_files,
+                        )
+                    except OSError as e:
+                        print(f"⚠️ 增量渲染清单保存失败: {e}")
+                return True, result.video_path, ""
+            return False, None, result.stderr
+
+        quality_flags = ["-ql"] if profile == "preview" else profile_cli_flags(settings)
+        cmd = ["manim", *quality_flags, str(code_file), scene_name]
+        if self.glyph_cache is not None:
+            cmd = glyph_launcher_cmd(self.glyph_cache, cmd[1:])
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=self.output_dir) as proc:
+            with tracker.track(proc.pid) if tracker is not None else nullcontext():
+                try:
+                    stdout, stderr = proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.communicate()
+                    raise
+        result = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+        if result.returncode == 0:
+            quality_dir = profile_quality_dir(settings)
+            video_patterns = [
+                self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / quality_dir / f"{scene_name}.mp4",
+                self.output_dir / "media" / "videos" / quality_dir / f"{scene_name}.mp4",
+                self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / "480p15" / f"{scene_name}.mp4",
+                self.output_dir / "media" / "videos" / "480p15" / f"{scene_name}.mp4",
+                self.output_dir / "media" / "videos" / f"{code_file.replace('.py', '')}" / "1080p60" / f"{scene_name}.mp4",
+                self.output_dir / "media" / "videos" / "1080p60" / f"{scene_name}.mp4",
+            ]
+
+            for video_path in video_patterns:
+                if video_path.exists():
+                    return True, str(video_path), ""
+
+        return False, None, result.stderr
+
     def get_mllm_feedback(self, section: Section, video_path: str, round_number: int = 1) -> VideoFeedback:
         print(f"🤖 {self.learning_topic} 使用 MLLM 分析视频 ({round_number}/{self.feedback_rounds}): {section.id}")
 
@@ -454,7 +875,9 @@ class TeachingVideoAgent:
             return has_layout_issues, suggested_improvements
 
         try:
-            response = request_gemini_video_img(prompt=analysis_prompt, video_path=video_path, image_path=self.GRID_IMG_PATH)
+            response = request_gemini_video_img(
+                prompt=analysis_prompt, video_path=proxy_video(video_path, "layout"), image_path=self.GRID_IMG_PATH
+            )
             feedback_content = extract_answer_from_response(response)
             has_layout_issues, suggested_improvements = _parse_layout(feedback_content)
             feedback = VideoFeedback(
@@ -512,9 +935,12 @@ class TeachingVideoAgent:
             self.generate_section_code(
                 section=section, attempt=attempt + 1, feedback_improvements=feedback.suggested_improvements
             )
-            success = self.debug_and_fix_code(section.id, max_fix_attempts=self.max_mllm_fix_bugs_tries)
+            fix_profile = self._fix_profile()
+            success = self.debug_and_fix_code(section.id, max_fix_attempts=self.max_mllm_fix_bugs_tries, profile=fix_profile)
             
             if success:
+                if fix_profile != "preview":
+                    self._render_preview(section.id)
                 optimized_output_dir = self.output_dir / "optimized_videos"
                 optimized_output_dir.mkdir(exist_ok=True)
                 optimized_video_path = optimized_output_dir / f"{section.id}_optimized.mp4"
@@ -567,6 +993,8 @@ class TeachingVideoAgent:
     def generate_codes(self) -> Dict[str, str]:
         if not self.sections:
             raise ValueError(f"{self.learning_topic} 请先生成教学小节")
+        if self.cfg.use_async_llm and self.API in ASYNC_COUNTERPARTS:
+            return self._generate_codes_async()
 
         def task(section):
             try:
@@ -584,9 +1012,64 @@ class TeachingVideoAgent:
 
         return self.section_codes
 
+    def _generate_codes_async(self) -> Dict[str, str]:
+        """All code generation requests in flight at once on the shared event loop, no thread per request"""
+        async_api = ASYNC_COUNTERPARTS[self.API]
+        pending = {}
+        for section in self.sections:
+            prompt, _ = self._section_code_prompt(section, attempt=1)
+            if prompt is not None:
+                pending[section.id] = (section, submit(async_api(prompt, max_tokens=self.max_code_token_length)))
+
+        for section_id, (section, future) in pending.items():
+            try:
+                response, usage = future.result()
+                self._track_usage(usage)
+                self._finish_section_code(section, response)
+            except Exception as e:
+                print(f"❌ {self.learning_topic} {section_id} 代码生成失败: {e}")
+
+        return self.section_codes
+
+    def prebuild_section_glyphs(self, section_ids: Optional[List[str]] = None) -> Dict[str, int]:
+        """Compile every literal MathTex/Tex/Text of the generated sections (or of `section_ids`) into the shared glyph cache up front"""
+        label = f"{self.learning_topic} {', '.join(section_ids)}" if section_ids else self.learning_topic
+        print(f"🔤 {label} 预构建公式与文字字形...")
+        start = time.time()
+        # list(): streaming codegen threads may add sections meanwhile
+        codes = [code for sid, code in list(self.section_codes.items()) if section_ids is None or sid in section_ids]
+        report = prebuild_glyphs(
+            {str(self.output_dir): codes},
+            cache_dir=self.glyph_cache["cache_dir"],
+            max_size_mb=self.glyph_cache["max_size_mb"],
+            render_slots=self.render_slots,
+        )
+        print(
+            f"🔤 {label} 字形预构建完成 ({time.time() - start:.1f}s): "
+            f"{report['unique']} 个不同字形，新编译 {report['compiled']}，已缓存 {report['already_cached']}，"
+            f"失败 {report['failed']}，节省 {report['saved']} 次渲染时编译"
+        )
+        return report
+
+    def _fix_profile(self) -> str:
+        # The retry path renders cheap drafts; expensive encodes are left to preview / promotion
+        return "draft" if self.cfg.use_render_profiles else "preview"
+
+    def _render_preview(self, section_id: str) -> bool:
+        """One preview-quality render of code the fix loop validated as a draft, for MLLM feedback"""
+        scene_name = f"{section_id.title().replace('_', '')}Scene"
+        preview_ok, preview_video, _ = self._render_scene(f"{section_id}.py", scene_name, profile="preview")
+        if preview_ok:
+            self.section_videos[section_id] = preview_video
+        else:
+            print(f"⚠️ {self.learning_topic} {section_id} 预览渲染失败，使用草稿视频进行 MLLM 反馈")
+        return preview_ok
+
     def render_section(self, section: Section) -> bool:
         section_id = section.id
 
+        fix_profile = self._fix_profile()
+
         try:
             success = False
             for regenerate_attempt in range(self.max_regenerate_tries):
@@ -594,7 +1077,10 @@ class TeachingVideoAgent:
                 try:
                     if regenerate_attempt > 0:
                         self.generate_section_code(section, attempt=regenerate_attempt + 1)
-                    success = self.debug_and_fix_code(section_id, max_fix_attempts=self.max_fix_bug_tries)
+                        memo = self.scope_refine_fixer.fix_memo(section_id)
+                        if memo is not None:
+                            memo.new_generation()
+                    success = self.debug_and_fix_code(section_id, max_fix_attempts=self.max_fix_bug_tries, profile=fix_profile)
                     if success:
                         break
                     else:
@@ -602,12 +1088,19 @@ class TeachingVideoAgent:
                 except Exception as e:
                     print(f"⚠️ {section_id} 第 {regenerate_attempt + 1} 次尝试抛出异常: {str(e)}")
                     continue
+            memo = self.scope_refine_fixer.fix_memo(section_id)
+            if memo is not None and (memo.skipped_checks or memo.cycles):
+                print(
+                    f"♻️ {self.learning_topic} {section_id} 修复记忆: 跳过 {memo.skipped_checks} 次重复验证/渲染, 检测到 {memo.cycles} 次循环"
+                )
             if not success:
                 print(f"❌ {self.learning_topic} {section_id} 全部失败，跳过该小节")
                 return False
 
             # MLLM feedback
             if self.use_feedback:
+                if fix_profile != "preview":
+                    self._render_preview(section_id)
                 try:
                     for round in range(self.feedback_rounds):
                         current_video = self.section_videos.get(section_id)
@@ -640,18 +1133,7 @@ class TeachingVideoAgent:
             return False
 
     def render_section_worker(self, section_data) -> Tuple[str, bool, Optional[str]]:
-        section_id = "unknown"
-        try:
-            section, agent_class, kwargs = section_data
-            section_id = section.id
-            agent = agent_class(**kwargs)
-            success = agent.render_section(section)
-            video_path = agent.section_videos.get(section.id) if success else None
-            return section_id, success, video_path
-
-        except Exception as e:
-            print(f"❌ {self.learning_topic} {section_id} 渲染过程异常: {str(e)}")
-            return section_id, False, None
+        return render_section_task(section_data)
 
     def render_all_sections(self, max_workers: int = 6) -> Dict[str, str]:
         print(f"🎥 开始并行渲染所有分节视频 (最多 {max_workers} 个进程)...")
@@ -669,6 +1151,13 @@ class TeachingVideoAgent:
             print("❌ 没有有效任务可执行")
             return {}
 
+        # Longest processing time first: the most expensive sections must not be the last ones to start
+        if self.cfg.use_cost_scheduling:
+            fix_profile = self._fix_profile()
+            costs = {task[0].id: self._estimate_render_cost(task[0].id, fix_profile).estimated_seconds for task in tasks}
+            tasks.sort(key=lambda task: costs[task[0].id], reverse=True)
+            print("📐 按预估渲染耗时排序: " + ", ".join(f"{task[0].id}≈{costs[task[0].id]:.0f}s" for task in tasks))
+
         results = {}
         successful_count = 0
         failed_count = 0
@@ -705,8 +1194,13 @@ class TeachingVideoAgent:
         except Exception as e:
             print(f"❌ 并行渲染过程中出现严重错误: {str(e)}")
 
+        return self._finish_render(results, successful_count, failed_count, max_workers)
+
+    def _finish_render(self, results: Dict[str, str], successful_count: int, failed_count: int, max_workers: int) -> Dict[str, str]:
         # 更新结果并输出统计信息
         self.section_videos.update(results)
+        if self.cfg.use_render_profiles and results:
+            self.promote_sections(max_workers=max_workers)
 
         total_sections = len(self.sections)
         print(f"\n📊 渲染统计:")
@@ -724,6 +1218,132 @@ class TeachingVideoAgent:
 
         return results
 
+    def generate_and_render_sections(self, max_workers: int = 6) -> Dict[str, str]:
+        """Streaming variant of generate_codes() + render_all_sections(): each section is handed to
+        the render pool as soon as its code is written, so renders overlap the remaining LLM calls.
+
+        Glyph prebuild runs per section right after its code is written. With cost scheduling,
+        sections whose code is ready queue here and the most expensive one takes the next free
+        render worker (longest-first among the sections available at that moment).
+        """
+        if not self.sections:
+            raise ValueError(f"{self.learning_topic} 请先生成教学小节")
+        print(f"🌊 {self.learning_topic} 流式生成与渲染 {len(self.sections)} 个小节 (最多 {max_workers} 个渲染进程)...")
+
+        def codegen(section):
+            try:
+                self.generate_section_code(section, attempt=1)
+            except Exception as e:
+                return section, e
+            if self.glyph_cache is not None and self.cfg.prebuild_glyphs:
+                try:
+                    self.prebuild_section_glyphs([section.id])
+                except Exception as e:
+                    print(f"⚠️ {self.learning_topic} {section.id} 字形预构建失败: {e}")
+            return section, None
+
+        results = {}
+        successful_count = 0
+        failed_count = 0
+        ready = []
+        costs = {}
+
+        try:
+            # spawn: forking while codegen threads hold HTTP clients and locks can deadlock the children
+            with ThreadPoolExecutor(max_workers=6) as codegen_pool, ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            ) as render_pool:
+                codegen_futures = {codegen_pool.submit(codegen, section) for section in self.sections}
+                render_futures = {}
+                while codegen_futures or ready or render_futures:
+                    while ready and len(render_futures) < max_workers:
+                        section = ready.pop(0)
+                        try:
+                            task = (section, self.__class__, self.get_serializable_state())
+                            render_futures[render_pool.submit(render_section_task, task)] = section.id
+                            print(f"📤 {self.learning_topic} {section.id} 已进入渲染队列")
+                        except Exception as e:
+                            print(f"⚠️ 提交 {section.id} 任务时出错: {str(e)}")
+                            failed_count += 1
+                    if not codegen_futures and not render_futures:
+                        continue
+
+                    done, _ = wait(codegen_futures | set(render_futures), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in codegen_futures:
+                            codegen_futures.discard(future)
+                            section, err = future.result()
+                            if err:
+                                # render_section still gets its regenerate attempts
+                                print(f"❌ {self.learning_topic} {section.id} 代码生成失败: {err}")
+                            ready.append(section)
+                            if self.cfg.use_cost_scheduling:
+                                costs[section.id] = self._estimate_render_cost(section.id, self._fix_profile()).estimated_seconds
+                                ready.sort(key=lambda s: costs[s.id], reverse=True)
+                            continue
+
+                        section_id = render_futures.pop(future)
+                        try:
+                            sid, success, video_path = future.result()
+                            if success and video_path:
+                                results[sid] = video_path
+                                successful_count += 1
+                                print(f"✅ {sid} 视频渲染成功: {video_path}")
+                            else:
+                                failed_count += 1
+                                print(f"⚠️ {sid} 视频渲染失败")
+                        except Exception as e:
+                            failed_count += 1
+                            print(f"❌ {section_id} 视频渲染过程错误: {str(e)}")
+
+        except Exception as e:
+            print(f"❌ 流式渲染过程中出现严重错误: {str(e)}")
+
+        return self._finish_render(results, successful_count, failed_count, max_workers)
+
+    def promote_section_worker(self, task_data) -> Tuple[str, bool, Optional[str]]:
+        section_id, agent_class, kwargs = task_data
+        try:
+            agent = agent_class(**kwargs)
+            scene_name = f"{section_id.title().replace('_', '')}Scene"
+            timeout = None if agent.cfg.use_cost_scheduling else 1200
+            success, video_path, error_msg = agent._render_scene(f"{section_id}.py", scene_name, timeout=timeout, profile="final")
+            if not success:
+                print(f"⚠️ {self.learning_topic} {section_id} 最终画质渲染失败: {error_msg[-500:]}")
+            return section_id, success, video_path
+        except Exception as e:
+            print(f"❌ {self.learning_topic} {section_id} 最终画质渲染异常: {str(e)}")
+            return section_id, False, None
+
+    def promote_sections(self, max_workers: int = 6) -> bool:
+        """Re-render the frozen, validated code of every finished section at final quality in one batch"""
+        section_ids = [s.id for s in self.sections if s.id in self.section_videos]
+        if self.cfg.use_cost_scheduling:
+            section_ids.sort(key=lambda sid: self._estimate_render_cost(sid, "final").estimated_seconds, reverse=True)
+        print(f"🏁 {self.learning_topic} 以最终画质重新渲染 {len(section_ids)} 个小节...")
+
+        promoted = {}
+        tasks = [(section_id, self.__class__, self.get_serializable_state()) for section_id in section_ids]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.promote_section_worker, task) for task in tasks]
+            for future in as_completed(futures):
+                try:
+                    section_id, success, video_path = future.result()
+                except Exception as e:
+                    print(f"❌ 最终画质渲染过程错误: {str(e)}")
+                    continue
+                if success and video_path:
+                    promoted[section_id] = video_path
+
+        # Sections are concatenated with `-c copy`, so never mix resolutions
+        if len(promoted) != len(section_ids):
+            print(f"⚠️ {self.learning_topic} {len(section_ids) - len(promoted)} 个小节最终画质渲染失败，保留预览画质视频")
+            return False
+
+        self.section_videos.update(promoted)
+        print(f"✅ {self.learning_topic} 所有小节已提升为最终画质")
+        return True
+
     def merge_videos(self, output_filename: str = None) -> str:
         """Step 5: Merge all section videos"""
         if not self.section_videos:
@@ -780,8 +1400,13 @@ class TeachingVideoAgent:
         try:
             self.generate_outline()
             self.generate_storyboard()
-            self.generate_codes()
-            self.render_all_sections()
+            if self.cfg.stream_sections:
+                self.generate_and_render_sections()
+            else:
+                self.generate_codes()
+                if self.glyph_cache is not None and self.cfg.prebuild_glyphs:
+                    self.prebuild_section_glyphs()
+                self.render_all_sections()
             final_video = self.merge_videos()
             if final_video:
                 print(f"🎉 视频生成成功: {final_video}")
@@ -794,6 +1419,27 @@ class TeachingVideoAgent:
             return None
 
 
+def render_section_task(section_data) -> Tuple[str, bool, Optional[str]]:
+    """Render one section in a pool worker with a single agent built from the serialized state.
+
+    Module-level so submitting it does not pickle the parent agent while codegen threads mutate it.
+    """
+    section_id, topic = "unknown", ""
+    try:
+        section, agent_class, kwargs = section_data
+        section_id, topic = section.id, kwargs.get("knowledge_point", "")
+        agent = agent_class(**kwargs)
+        success = agent.render_section(section)
+        video_path = agent.section_videos.get(section.id) if success else None
+        if agent.render_slots is not None:
+            print(f"⏳ {agent.learning_topic} {section_id} 渲染槽位累计等待 {agent.render_slot_wait.get(section_id, 0.0):.1f}s")
+        return section_id, success, video_path
+
+    except Exception as e:
+        print(f"❌ {topic} {section_id} 渲染过程异常: {str(e)}")
+        return section_id, False, None
+
+
 def process_knowledge_point(idx, kp, folder_path: Path, cfg: RunConfig):
     print(f"\n🚀 正在处理知识点: {kp}")
     start_time = time.time()
@@ -808,6 +1454,8 @@ def process_knowledge_point(idx, kp, folder_path: Path, cfg: RunConfig):
 
     duration_minutes = (time.time() - start_time) / 60
     total_tokens = agent.token_usage["total_tokens"]
+    if agent.token_usage["cache_hits"]:
+        print(f"💾 知识点 '{kp}' LLM 缓存命中 {agent.token_usage['cache_hits']} 次, 未命中 {agent.token_usage['cache_misses']} 次")
 
     print(f"✅ 知识点 '{kp}' 处理完成。耗时: {duration_minutes:.2f} 分钟, Token 使用: {total_tokens}")
     return kp, video_path, duration_minutes, total_tokens
@@ -821,7 +1469,8 @@ def process_batch(batch_data, cfg: RunConfig):
 
     for local_idx, (idx, kp) in enumerate(kp_batch):
         try:
-            if local_idx > 0:
+            # With configured RPM / TPM limits every call already waits for quota
+            if local_idx > 0 and RATE_LIMITER is None:
                 delay = random.uniform(3, 6)
                 print(f"⏳ 第 {batch_idx + 1} 批次在处理 {kp} 前等待 {delay:.1f} 秒...")
                 time.sleep(delay)
@@ -836,6 +1485,9 @@ def run_Code2Video(
     knowledge_points: List[str], folder_path: Path, parallel=True, batch_size=3, max_workers=8, cfg: RunConfig = RunConfig()
 ):
     all_results = []
+    # Counters live in the shared store; the difference over this call is this run's share
+    fix_kb = get_fix_knowledge_base(cfg.fix_kb_path or None) if cfg.use_fix_kb else None
+    fix_kb_before = fix_kb.counters() if fix_kb is not None else None
 
     if parallel:
         batches = []
@@ -879,6 +1531,11 @@ def run_Code2Video(
     print(f"   成功处理: {num_successful} ({num_successful/total_runs*100:.1f}%)")
     print(f"   平均耗时 [分]: {total_duration/num_successful:.2f} 分钟/知识点")
     print(f"   平均 Token 消耗: {total_tokens_consumed/num_successful:,.0f} tokens/知识点")
+    if fix_kb is not None:
+        after = fix_kb.counters()
+        lookups, hits = after["lookups"] - fix_kb_before["lookups"], after["hits"] - fix_kb_before["hits"]
+        hit_rate = hits / lookups * 100 if lookups else 0.0
+        print(f"   修复知识库: 命中 {hits}/{lookups} ({hit_rate:.1f}%), 节省 LLM 修复调用 {hits} 次")
     print("=" * 50)
 
 
@@ -933,9 +1590,109 @@ def build_and_parse_args():
     parser.add_argument("--max_concepts", type=int, help="Limit # concepts for a quick run, -1 for all", default=-1)
     parser.add_argument("--knowledge_point", type=str, help="if knowledge_file not given, can ignore", default=None)
     
+    parser.add_argument(
+        "--use_async_llm", action="store_true", default=False, help="issue code generation requests on one asyncio event loop"
+    )
+
+    parser.add_argument(
+        "--llm_cache",
+        type=str,
+        default="off",
+        choices=["off", "readwrite", "replay"],
+        help="persistent LLM response cache; replay is read-only and fails on unrecorded prompts",
+    )
+
+    parser.add_argument(
+        "--hedge_requests",
+        action="store_true",
+        default=False,
+        help="duplicate LLM calls slower than their usual p95 (budget: ~5%% extra requests)",
+    )
+
+    parser.add_argument(
+        "--use_autofix",
+        action="store_true",
+        default=False,
+        help="apply rule-based fixes for known Manim API errors before asking the LLM",
+    )
+    parser.add_argument(
+        "--use_api_validator",
+        action="store_true",
+        default=False,
+        help="check scene code against an index of the installed manim API before rendering",
+    )
+    parser.add_argument(
+        "--use_fix_memo",
+        action="store_true",
+        default=False,
+        help="remember fix-loop outcomes by code hash; cycles and repeated errors go straight to regeneration",
+    )
+    parser.add_argument(
+        "--speculative_fixes",
+        type=int,
+        default=0,
+        help="request K fix candidates at once and keep the first that validates (0/1 = one at a time)",
+    )
+    parser.add_argument(
+        "--use_fix_kb",
+        action="store_true",
+        default=False,
+        help="reuse patches that fixed the same error in earlier topics before asking the LLM",
+    )
+    parser.add_argument("--fix_kb_path", type=str, default="", help="fix knowledge base (default: CASES/fix_knowledge_base.sqlite)")
+
     # 新增参数：最大并行工作进程数
     parser.add_argument("--max_workers", type=int, default=None, help="Force specific number of workers, overriding auto-detection")
 
+    # Rendering
+    parser.add_argument(
+        "--stream_sections", action="store_true", default=False, help="render each section as soon as its code is generated"
+    )
+    parser.add_argument("--use_render_server", action="store_true", default=False, help="render in persistent manim workers")
+    parser.add_argument("--render_server_workers", type=int, default=1, help="# persistent render workers per section process")
+    parser.add_argument("--render_worker_max_jobs", type=int, default=50, help="recycle a render worker after N jobs")
+    parser.add_argument(
+        "--incremental_render", action="store_true", default=False, help="re-render only from the first changed animation block"
+    )
+    parser.add_argument(
+        "--split_render",
+        action="store_true",
+        default=False,
+        help="render long sections as parallel block ranges (needs --use_render_server, --render_server_workers > 1)",
+    )
+    parser.add_argument("--use_probe", action="store_true", default=False, help="run construct() without encoding before renders")
+    parser.add_argument(
+        "--use_render_profiles", action="store_true", default=False, help="draft renders in the fix loop, final quality at the end"
+    )
+    parser.add_argument("--final_resolution", type=str, default="1920,1080", help="W,H of the promoted section videos")
+    parser.add_argument("--final_fps", type=int, default=30)
+    parser.add_argument("--use_render_cache", action="store_true", default=False, help="reuse videos of identical scene code")
+    parser.add_argument("--render_cache_dir", type=str, default="", help="shared render cache dir (default: CASES/render_cache)")
+    parser.add_argument("--render_cache_max_mb", type=int, default=5000)
+    parser.add_argument(
+        "--use_glyph_cache", action="store_true", default=False, help="share compiled MathTex/Text glyphs across topics and runs"
+    )
+    parser.add_argument("--glyph_cache_dir", type=str, default="", help="shared glyph cache dir (default: CASES/glyph_cache)")
+    parser.add_argument("--glyph_cache_max_mb", type=int, default=2000)
+    parser.add_argument(
+        "--prebuild_glyphs", action="store_true", default=False, help="compile all literal glyphs before rendering (needs --use_glyph_cache)"
+    )
+    parser.add_argument(
+        "--use_render_slots", action="store_true", default=False, help="cap concurrent manim processes host-wide"
+    )
+    parser.add_argument("--render_slots", type=int, default=0, help="# host-wide render slots, 0 = auto (cores, bounded by RAM)")
+    parser.add_argument("--render_slot_dir", type=str, default="", help="lock dir shared by all runs on this host")
+    parser.add_argument(
+        "--use_memory_admission", action="store_true", default=False, help="admit renders only if their learned memory peak fits"
+    )
+    parser.add_argument("--render_memory_reserve_mb", type=int, default=1024, help="host memory kept free by admission control")
+    parser.add_argument(
+        "--use_cost_scheduling",
+        action="store_true",
+        default=False,
+        help="longest-estimated-first section order and per-section render timeouts",
+    )
+
     return parser.parse_args()
 
 
@@ -978,6 +1735,38 @@ if __name__ == "__main__":
         max_feedback_gen_code_tries=args.max_feedback_gen_code_tries,
         max_mllm_fix_bugs_tries=args.max_mllm_fix_bugs_tries,
         feedback_rounds=args.feedback_rounds,
+        use_render_server=args.use_render_server,
+        render_server_workers=args.render_server_workers,
+        render_worker_max_jobs=args.render_worker_max_jobs,
+        incremental_render=args.incremental_render,
+        use_probe=args.use_probe,
+        use_render_profiles=args.use_render_profiles,
+        final_resolution=args.final_resolution,
+        final_fps=args.final_fps,
+        use_render_cache=args.use_render_cache,
+        render_cache_dir=args.render_cache_dir,
+        render_cache_max_mb=args.render_cache_max_mb,
+        use_cost_scheduling=args.use_cost_scheduling,
+        use_render_slots=args.use_render_slots,
+        render_slots=args.render_slots,
+        render_slot_dir=args.render_slot_dir,
+        stream_sections=args.stream_sections,
+        use_memory_admission=args.use_memory_admission,
+        render_memory_reserve_mb=args.render_memory_reserve_mb,
+        split_render=args.split_render,
+        use_glyph_cache=args.use_glyph_cache,
+        glyph_cache_dir=args.glyph_cache_dir,
+        glyph_cache_max_mb=args.glyph_cache_max_mb,
+        prebuild_glyphs=args.prebuild_glyphs,
+        use_async_llm=args.use_async_llm,
+        llm_cache=args.llm_cache,
+        hedge_requests=args.hedge_requests,
+        use_autofix=args.use_autofix,
+        use_api_validator=args.use_api_validator,
+        use_fix_memo=args.use_fix_memo,
+        speculative_fixes=args.speculative_fixes,
+        use_fix_kb=args.use_fix_kb,
+        fix_kb_path=args.fix_kb_path,
     )
     
     # 优先使用命令行参数指定的 workers，否则自动计算
@@ -0,0 +1,400 @@
+import os
+import asyncio
+import threading
+import concurrent.futures
+from typing import Dict, Any, List, Optional, Awaitable
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from rate_limiter import estimate_tokens, MAX_POLL
+from llm_cache import get_llm_cache, cache_counters, cache_key
+from retry_policy import RetryPolicy, breaker, record_outcome
+from media_encoding import encoded_data_url
+from hedging import acall_hedged
+from gpt_request import (
+    cfg,
+    generate_log_id,
+    HTTP_POOL_LIMITS,
+    RATE_LIMITER,
+    request_claude_token,
+    request_gemini_token,
+    request_gpt4o_token,
+    request_o4mini_token,
+    request_gpt5_token,
+    request_gpt41_token,
+)
+
+
+DEFAULT_MAX_CONCURRENCY = 64  # in-flight requests per provider; override with "<svc>": {"max_concurrency": N}
+
+_CLIENTS: Dict[Any, Any] = {}
+_SEMAPHORES: Dict[Any, asyncio.Semaphore] = {}
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _reset_after_fork():
+    global _CLIENTS, _SEMAPHORES, _LOOP, _LOOP_LOCK
+    _CLIENTS, _SEMAPHORES, _LOOP = {}, {}, None
+    _LOOP_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_async_client(base_url, api_key, timeout=None, api_version=None):
+    """Async client with a keep-alive pool; httpx async clients are bound to one event loop"""
+    loop = asyncio.get_running_loop()
+    key = (id(loop), base_url, api_key, timeout, api_version)
+    client = _CLIENTS.get(key)
+    if client is None:
+        kwargs = {"api_key": api_key, "http_client": openai.DefaultAsyncHttpxClient(limits=httpx.Limits(**HTTP_POOL_LIMITS))}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if api_version is not None:
+            client = openai.AsyncAzureOpenAI(azure_endpoint=base_url, api_version=api_version, **kwargs)
+        else:
+            client = AsyncOpenAI(base_url=base_url, **kwargs)
+        _CLIENTS[key] = client
+    return client
+
+
+def _limiter(svc: str) -> asyncio.Semaphore:
+    key = (id(asyncio.get_running_loop()), svc)
+    if key not in _SEMAPHORES:
+        _SEMAPHORES[key] = asyncio.Semaphore(int(cfg(svc, "max_concurrency", DEFAULT_MAX_CONCURRENCY)))
+    return _SEMAPHORES[key]
+
+
+def _usage(completion) -> Dict[str, int]:
+    usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    if completion is not None and completion.usage:
+        usage_info["prompt_tokens"] = completion.usage.prompt_tokens
+        usage_info["completion_tokens"] = completion.usage.completion_tokens
+        usage_info["total_tokens"] = completion.usage.total_tokens
+    usage_info.update(cache_counters())
+    return usage_info
+
+
+async def _acreate_guarded(svc: str, client, **create_kwargs):
+    ticket = breaker(svc).before_call()
+    try:
+        completion = await client.chat.completions.create(**create_kwargs)
+    except Exception as e:
+        record_outcome(svc, ticket, e)
+        raise
+    except BaseException:
+        # Cancelled (the losing side of a hedged request): says nothing about the provider, but a
+        # cancelled half-open trial must not keep the breaker waiting for an outcome forever
+        breaker(svc).release(ticket)
+        raise
+    record_outcome(svc, ticket)
+    return completion
+
+
+async def _wait_for_quota(svc: str, model: str, tokens: int):
+    # The bucket lives behind a file lock; touch it from a worker thread so the loop never blocks
+    wait = await asyncio.to_thread(RATE_LIMITER.try_acquire, svc, model, tokens)
+    while wait > 0:
+        await asyncio.sleep(min(wait, MAX_POLL))
+        wait = await asyncio.to_thread(RATE_LIMITER.try_acquire, svc, model, tokens)
+
+
+async def _acreate_hedged(svc: str, client, **create_kwargs):
+    """Async twin of gpt_request._create_completion_hedged; the losing request is cancelled"""
+    key = (svc, create_kwargs.get("model"), create_kwargs.get("max_tokens"))
+
+    async def hedge(hedge_svc):
+        if hedge_svc == svc:
+            return await _acreate_limited(svc, client, **create_kwargs)
+        hedge_client = get_async_client(cfg(hedge_svc, "base_url"), cfg(hedge_svc, "api_key"), timeout=300.0)
+        return await _acreate_limited(hedge_svc, hedge_client, **dict(create_kwargs, model=cfg(hedge_svc, "model")))
+
+    return await acall_hedged(cfg, svc, key, lambda: _acreate_limited(svc, client, **create_kwargs), hedge)
+
+
+async def _acreate_limited(svc: str, client, **create_kwargs):
+    """Async twin of gpt_request._create_completion: waits for host-wide RPM / TPM quota first"""
+    if RATE_LIMITER is None or svc not in RATE_LIMITER.limits:
+        return await _acreate_guarded(svc, client, **create_kwargs)
+
+    model = create_kwargs.get("model")
+    reserved = estimate_tokens(create_kwargs.get("messages")) + (create_kwargs.get("max_tokens") or 0)
+    await _wait_for_quota(svc, model, reserved)
+    used = 0
+    try:
+        completion = await _acreate_guarded(svc, client, **create_kwargs)
+        usage = getattr(completion, "usage", None)
+        used = usage.total_tokens if usage else reserved
+        return completion
+    finally:
+        await asyncio.to_thread(RATE_LIMITER.settle, svc, model, reserved, used)
+
+
+async def _acreate_cached(svc: str, client, **create_kwargs):
+    """Async twin of gpt_request._create_completion: LLM response cache in front of the limited call"""
+    cache = get_llm_cache(cfg)
+    if cache is None:
+        return await _acreate_hedged(svc, client, **create_kwargs)
+
+    key = cache_key(svc, create_kwargs)
+    body = cache.record(svc, create_kwargs, key, await asyncio.to_thread(cache.get, key))
+    if body is not None:
+        completion = ChatCompletion.model_validate_json(body)
+        completion.usage = None
+        return completion
+    completion = await _acreate_hedged(svc, client, **create_kwargs)
+    if completion is not None and completion.choices:
+        await asyncio.to_thread(cache.put, key, svc, create_kwargs.get("model"), completion.model_dump_json())
+    return completion
+
+
+async def _acreate(
+    svc: str,
+    client,
+    max_retries: int,
+    backoff: float = 0.1,
+    log_id=None,
+    **create_kwargs,
+):
+    """chat.completions.create under the provider's concurrency limit, with the same retry policy as gpt_request"""
+    extra_headers = {"X-TT-LOGID": log_id or generate_log_id()}
+    retry = RetryPolicy(svc, max_retries, base_delay=backoff)
+    while retry.pending():
+        try:
+            async with _limiter(svc):
+                return await _acreate_cached(svc, client, extra_headers=extra_headers, **create_kwargs)
+        except Exception as e:
+            delay = retry.next_delay(e)
+            if delay is None:
+                raise Exception(retry.give_up_message(e)) from e
+            await asyncio.sleep(delay)
+    return None
+
+
+def _text_content(prompt):
+    return [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+
+
+def _read_data_url(path, mime: str) -> str:
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"File not found: {path}")
+    return encoded_data_url(path, mime)
+
+
+async def _data_url(path, mime: str) -> str:
+    # Encoding a video takes a while; keep it off the event loop
+    return await asyncio.to_thread(_read_data_url, path, mime)
+
+
+# ---------------------------------------------------------------- text
+
+async def arequest_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
+    client = get_async_client(cfg("claude", "base_url"), cfg("claude", "api_key"))
+    completion = await _acreate(
+        "claude", client, max_retries, log_id=log_id, model="claude-4-opus", messages=_text_content(prompt), max_tokens=max_tokens
+    )
+    return completion, _usage(completion)
+
+
+async def arequest_gemini(prompt, log_id=None, max_tokens=8000, max_retries=10):
+    client = get_async_client(cfg("gemini", "base_url"), cfg("gemini", "api_key"), timeout=300.0)
+    return await _acreate(
+        "gemini",
+        client,
+        max_retries,
+        log_id=log_id,
+        model=cfg("gemini", "model"),
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+    )
+
+
+async def arequest_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=10):
+    completion = await arequest_gemini(prompt, log_id=log_id, max_tokens=max_tokens, max_retries=max_retries)
+    return completion, _usage(completion)
+
+
+async def arequest_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
+    client = get_async_client(cfg("gpt4o", "base_url"), cfg("gpt4o", "api_key"), timeout=300.0)
+    completion = await _acreate(
+        "gpt4o", client, max_retries, log_id=log_id, model=cfg("gpt4o", "model"), messages=_text_content(prompt), max_tokens=max_tokens
+    )
+    return completion, _usage(completion)
+
+
+async def arequest_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking=False):
+    client = get_async_client(
+        cfg("gpt4omini", "base_url"), cfg("gpt4omini", "api_key"), api_version=cfg("gpt4omini", "api_version")
+    )
+    completion = await _acreate(
+        "gpt4omini",
+        client,
+        max_retries,
+        log_id=log_id,
+        model=cfg("gpt4omini", "model"),
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        extra_body={"thinking": {"type": "enabled", "budget_tokens": 2000}} if thinking else None,
+    )
+    return completion, _usage(completion)
+
+
+async def arequest_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=10):
+    client = get_async_client(cfg("gpt5", "base_url"), cfg("gpt5", "api_key"), timeout=300.0)
+    completion = await _acreate(
+        "gpt5",
+        client,
+        max_retries,
+        log_id=log_id,
+        model=cfg("gpt5", "model"),
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+    )
+    return completion, _usage(completion)
+
+
+async def arequest_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
+    client = get_async_client(cfg("gpt41", "base_url"), cfg("gpt41", "api_key"), timeout=300.0)
+    completion = await _acreate(
+        "gpt41",
+        client,
+        max_retries,
+        log_id=log_id,
+        model=cfg("gpt41", "model"),
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+    )
+    return completion, _usage(completion)
+
+
+# ---------------------------------------------------------------- image / video
+
+async def arequest_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_retries=10):
+    client = get_async_client(cfg("gpt5", "base_url"), cfg("gpt5", "api_key"), timeout=300.0)
+    if image_path:
+        image_url = await _data_url(image_path, "image/png")
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}},
+                ],
+            }
+        ]
+    else:
+        messages = [{"role": "user", "content": prompt}]
+    return await _acreate(
+        "gpt5", client, max_retries, backoff=1.0, log_id=log_id, model=cfg("gpt5", "model"), messages=messages, max_tokens=max_tokens
+    )
+
+
+async def arequest_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 10):
+    client = get_async_client(cfg("gemini", "base_url"), cfg("gemini", "api_key"), timeout=300.0)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    video_url = await _data_url(video_path, "video/mp4")
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": video_url, "detail": "high"}, "media_type": "video/mp4"},
+            ],
+        }
+    ]
+    return await _acreate(
+        "gemini", client, max_retries, backoff=0.2, log_id=log_id, model=cfg("gemini", "model"), messages=messages, max_tokens=max_tokens
+    )
+
+
+async def arequest_gemini_video_img_token(
+    prompt: str, video_path: str, image_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 10
+):
+    client = get_async_client(cfg("gemini", "base_url"), cfg("gemini", "api_key"), timeout=300.0)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    video_url, image_url = await asyncio.gather(_data_url(video_path, "video/mp4"), _data_url(image_path, "image/png"))
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": video_url, "detail": "high"}, "media_type": "video/mp4"},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}, "media_type": "image/png"},
+            ],
+        }
+    ]
+    completion = await _acreate(
+        "gemini", client, max_retries, backoff=0.2, log_id=log_id, model=cfg("gemini", "model"), messages=messages, max_tokens=max_tokens
+    )
+    return completion, _usage(completion)
+
+
+async def arequest_gpt5_video_img_token(
+    prompt: str, video_path: str, image_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 10
+):
+    client = get_async_client(cfg("gpt5", "base_url"), cfg("gpt5", "api_key"), timeout=600.0)
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    video_url, image_url = await asyncio.gather(_data_url(video_path, "video/mp4"), _data_url(image_path, "image/png"))
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": video_url, "detail": "high"}},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": "high"}},
+            ],
+        }
+    ]
+    completion = await _acreate(
+        "gpt5", client, max_retries, backoff=0.5, log_id=log_id, model=cfg("gpt5", "model"), messages=messages, max_tokens=max_tokens
+    )
+    return completion, _usage(completion)
+
+
+# Async counterpart of each RunConfig.api choice
+ASYNC_COUNTERPARTS = {
+    request_claude_token: arequest_claude_token,
+    request_gemini_token: arequest_gemini_token,
+    request_gpt4o_token: arequest_gpt4o_token,
+    request_o4mini_token: arequest_o4mini_token,
+    request_gpt5_token: arequest_gpt5_token,
+    request_gpt41_token: arequest_gpt41_token,
+}
+
+
+# ---------------------------------------------------------------- sync bridge
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Per-process event loop on a daemon thread, shared by all sync callers so clients and limits are shared too"""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+def submit(coro: Awaitable) -> concurrent.futures.Future:
+    """Schedule a request coroutine from synchronous code; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run_all(coros: List[Awaitable]) -> List[Any]:
+    """Run many request coroutines concurrently from synchronous code; exceptions are returned in place"""
+    futures = [submit(coro) for coro in coros]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
@@ -0,0 +1,251 @@
+import os
+import re
+import ast
+import sys
+import json
+import shutil
+import hashlib
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple, Optional, Dict, Any
+
+
+# Same marker ManimCodeErrorAnalyzer._extract_animation_section relies on
+BLOCK_MARKER = re.compile(r"\s*# === Animation for Lecture Line \d+ ===")
+
+
+@dataclass
+class SceneBlocks:
+    header: List[str]
+    blocks: List[List[str]]
+    trailer: List[str]
+    block_lines: List[Tuple[int, int]] = field(default_factory=list)  # 1-indexed, inclusive
+
+
+def split_animation_blocks(code: str, scene_name: Optional[str] = None) -> SceneBlocks:
+    """Split the scene source at the lecture-line markers inside construct()"""
+    lines = code.split("\n")
+    construct_start, construct_end = 1, len(lines)
+    try:
+        for node in ast.walk(ast.parse(code)):
+            if isinstance(node, ast.ClassDef) and (scene_name is None or node.name == scene_name):
+                for item in node.body:
+                    if isinstance(item, ast.FunctionDef) and item.name == "construct":
+                        construct_start, construct_end = item.lineno, item.end_lineno
+    except SyntaxError:
+        pass
+
+    markers = [
+        i + 1 for i, line in enumerate(lines) if construct_start <= i + 1 <= construct_end and BLOCK_MARKER.match(line)
+    ]
+    if not markers:
+        return SceneBlocks(header=lines, blocks=[], trailer=[])
+
+    block_lines = []
+    for idx, start in enumerate(markers):
+        end = markers[idx + 1] - 1 if idx + 1 < len(markers) else construct_end
+        block_lines.append((start, end))
+
+    return SceneBlocks(
+        header=lines[: markers[0] - 1],
+        blocks=[lines[start - 1 : end] for start, end in block_lines],
+        trailer=lines[construct_end:],
+        block_lines=block_lines,
+    )
+
+
+def block_fingerprints(code: str, scene_name: Optional[str] = None, config_key: str = "") -> List[str]:
+    """Fingerprint of block i covers everything block i can depend on: header, trailer and blocks 0..i"""
+    parts = split_animation_blocks(code, scene_name)
+    digest = hashlib.sha256()
+    digest.update(config_key.encode("utf-8"))
+    for line in parts.header + ["# --- trailer ---"] + parts.trailer:
+        digest.update(line.rstrip().encode("utf-8") + b"\n")
+
+    fingerprints = []
+    for block in parts.blocks:
+        for line in block:
+            digest.update(line.rstrip().encode("utf-8") + b"\n")
+        fingerprints.append(digest.copy().hexdigest())
+    return fingerprints
+
+
+def manifest_path_for(output_dir: Path, scene_name: str) -> Path:
+    return Path(output_dir) / "media" / "block_manifests" / f"{scene_name}.json"
+
+
+def load_manifest(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def plan_incremental_render(code: str, scene_name: str, manifest: Optional[Dict[str, Any]], config_key: str) -> Dict[str, Any]:
+    """Decide which leading animations can be reused from the previous render of this scene.
+
+    Returns the job spec for the render worker: block line ranges, the first animation
+    to actually render and the partial movie files that stand in for the skipped ones.
+    """
+    parts = split_animation_blocks(code, scene_name)
+    fingerprints = block_fingerprints(code, scene_name, config_key)
+    plan = {
+        "block_lines": parts.block_lines,
+        "fingerprints": fingerprints,
+        "start_animation": 0,
+        "reuse_partials": [],
+        "first_changed_block": 0,
+    }
+    if not manifest or manifest.get("config_key") != config_key or not fingerprints:
+        return plan
+
+    old = manifest.get("fingerprints", [])
+    first_changed = 0
+    while first_changed < min(len(old), len(fingerprints)) and old[first_changed] == fingerprints[first_changed]:
+        first_changed += 1
+    plan["first_changed_block"] = first_changed
+    if first_changed == 0:
+        return plan
+
+    reuse = []
+    for play in manifest.get("plays", []):
+        if play["block"] >= first_changed or not play.get("partial") or not os.path.exists(play["partial"]):
+            break
+        reuse.append(play["partial"])
+    plan["start_animation"] = len(reuse)
+    plan["reuse_partials"] = reuse
+    return plan
+
+
+def save_manifest(
+    output_dir: Path, scene_name: str, config_key: str, fingerprints: List[str], block_of_play: List[int], partials: List[str]
+):
+    """Keep a private copy of every partial movie file of this render and record which block produced it"""
+    store_dir = Path(output_dir) / "media" / "block_partials" / scene_name
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    plays, keep = [], set()
+    for idx, (block, partial) in enumerate(zip(block_of_play, partials)):
+        stored = None
+        if partial and os.path.exists(partial):
+            if Path(partial).parent == store_dir:
+                stored = Path(partial)
+            else:
+                stored = store_dir / f"{fingerprints[block] if 0 <= block < len(fingerprints) else 'header'}_{idx:05d}.mp4"
+                # manim overwrites uncached_*.mp4 in place, so keep a real copy rather than a hard link
+                shutil.copyfile(partial, stored)
+            keep.add(stored.name)
+        plays.append({"block": block, "partial": str(stored) if stored else None})
+
+    for stale in store_dir.glob("*.mp4"):
+        if stale.name not in keep:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+    path = manifest_path_for(output_dir, scene_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"config_key": config_key, "fingerprints": fingerprints, "plays": plays}, f, indent=2)
+
+
+def _block_for_line(block_lines: List[Tuple[int, int]], lineno: int) -> int:
+    for idx, (start, end) in enumerate(block_lines):
+        if start <= lineno <= end:
+            return idx
+    return -1
+
+
+def make_block_tracking_renderer(
+    code_path: str, block_lines: List[Tuple[int, int]], reuse_partials: List[str], skip_animations: bool = False
+):
+    """CairoRenderer that attributes every play()/wait() to a lecture-line block and
+    substitutes the partial movie files of skipped (reused) animations"""
+    from manim.renderer.cairo_renderer import CairoRenderer
+    from manim.scene.scene_file_writer import SceneFileWriter
+
+    code_path = os.path.realpath(code_path)
+
+    class ReusingFileWriter(SceneFileWriter):
+        def add_partial_movie_file(self, hash_animation):
+            containers = [getattr(self, "partial_movie_files", None)]
+            containers += [s.partial_movie_files for s in getattr(self, "sections", [])[-1:]]
+            containers = [c for c in containers if isinstance(c, list)]
+            sizes = [len(c) for c in containers]
+            super().add_partial_movie_file(hash_animation)
+            if hash_animation is not None:
+                return
+            play_idx = self.renderer.num_plays
+            if play_idx < len(reuse_partials):
+                for container, size in zip(containers, sizes):
+                    if len(container) > size and container[-1] is None:
+                        container[-1] = reuse_partials[play_idx]
+
+    class BlockTrackingRenderer(CairoRenderer):
+        def __init__(self, **kwargs):
+            super().__init__(file_writer_class=ReusingFileWriter, skip_animations=skip_animations, **kwargs)
+            self.block_of_play = []
+
+        def play(self, scene, *args, **kwargs):
+            block = -1
+            frame = sys._getframe(1)
+            while frame is not None:
+                if frame.f_code.co_name == "construct" and os.path.realpath(frame.f_code.co_filename) == code_path:
+                    block = _block_for_line(block_lines, frame.f_lineno)
+                    break
+                frame = frame.f_back
+            self.block_of_play.append(block)
+            return super().play(scene, *args, **kwargs)
+
+    return BlockTrackingRenderer()
+
+
+def collect_partial_movie_files(file_writer) -> List[Optional[str]]:
+    files = getattr(file_writer, "partial_movie_files", None)
+    if not isinstance(files, list) or not files:
+        files = [f for section in getattr(file_writer, "sections", []) for f in section.partial_movie_files]
+    return [str(f) if f else None for f in files]
+
+
+def plan_split_ranges(block_of_play: List[int], num_parts: int, min_plays: int = 8) -> List[Tuple[int, int]]:
+    """Cut the animation sequence into at most num_parts inclusive (first, last) play ranges.
+
+    Cuts only fall where a new lecture-line block starts, and are chosen to balance the number of plays.
+    """
+    total = len(block_of_play)
+    if num_parts < 2 or total < min_plays:
+        return [(0, total - 1)] if total else []
+
+    # A range must not end at play 0: manim treats upto_animation_number=0 as "no limit"
+    cuts = [i for i in range(2, total) if block_of_play[i] != block_of_play[i - 1]]
+    chosen = []
+    for part in range(1, num_parts):
+        target = total * part / num_parts
+        candidates = [c for c in cuts if not chosen or c > chosen[-1]]
+        if not candidates:
+            break
+        best = min(candidates, key=lambda c: abs(c - target))
+        if best not in chosen:
+            chosen.append(best)
+
+    bounds = [0] + chosen + [total]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(len(bounds) - 1)]
+
+
+def concat_videos(video_paths: List[str], output_path) -> bool:
+    """Lossless concat of videos that share one encoding (ffmpeg concat demuxer, -c copy)"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    list_file = output_path.with_name(f".{output_path.stem}_concat.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for path in video_paths:
+            f.write(f"file '{Path(path).resolve().as_posix()}'\n")
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy", str(output_path)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        list_file.unlink(missing_ok=True)
+    return result.returncode == 0 and output_path.exists()
@@ -4,9 +4,12 @@ from typing import List, Dict, Any
 from dataclasses import dataclass
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import asyncio
 from threading import Lock
 
 from gpt_request import request_gemini_with_video
+from async_gpt_request import arequest_gemini_with_video, run_all
+from video_proxy import proxy_video
 from prompts import get_prompt_aes
 from utils import extract_answer_from_response, eva_video_list
 
@@ -24,11 +27,16 @@ class EvaluationResult:
 
 
 class VideoEvaluator:
-    def __init__(self, request_gemini_function):
+    def __init__(self, request_gemini_function, arequest_gemini_function=None):
         """
         Initialize the video evaluator
+
+        Args:
+            request_gemini_function: Blocking video request function
+            arequest_gemini_function: Optional async counterpart, used by batch evaluation with use_async=True
         """
         self.request_gemini_with_video = request_gemini_function
+        self.arequest_gemini_with_video = arequest_gemini_function
         self._progress_lock = Lock()
 
     def evaluate_video(self, video_path: str, knowledge_point: str, log_id: str = None) -> EvaluationResult:
@@ -47,7 +55,24 @@ class VideoEvaluator:
 
         try:
             response = self.request_gemini_with_video(
-                prompt=evaluation_prompt, video_path=video_path, log_id=log_id, max_tokens=10000, max_retries=3
+                prompt=evaluation_prompt, video_path=proxy_video(video_path, "eval"), log_id=log_id, max_tokens=10000, max_retries=3
+            )
+            result = self._parse_evaluation_response(response)
+            result.knowledge_point = knowledge_point
+            return result
+
+        except Exception as e:
+            print(f"视频评估期间出错: {str(e)}")
+            return self._create_error_result(str(e))
+
+    async def aevaluate_video(self, video_path: str, knowledge_point: str, log_id: str = None) -> EvaluationResult:
+        """Async version of evaluate_video"""
+        evaluation_prompt = get_prompt_aes(knowledge_point)
+
+        try:
+            proxy_path = await asyncio.to_thread(proxy_video, video_path, "eval")
+            response = await self.arequest_gemini_with_video(
+                prompt=evaluation_prompt, video_path=proxy_path, log_id=log_id, max_tokens=10000, max_retries=3
             )
             result = self._parse_evaluation_response(response)
             result.knowledge_point = knowledge_point
@@ -58,7 +83,12 @@ class VideoEvaluator:
             return self._create_error_result(str(e))
 
     def evaluate_video_batch(
-        self, video_list: List[Dict[str, Any]], log_id: str = None, max_workers: int = 3, use_parallel: bool = True
+        self,
+        video_list: List[Dict[str, Any]],
+        log_id: str = None,
+        max_workers: int = 3,
+        use_parallel: bool = True,
+        use_async: bool = False,
     ) -> List[EvaluationResult]:
         """
         Evaluate multiple teaching videos in batch (supports parallel processing)
@@ -68,10 +98,15 @@ class VideoEvaluator:
             log_id: Log ID
             max_workers: Maximum number of parallel worker threads (suggest 2-5 to avoid API call frequency issues)
             use_parallel: Whether to use parallel processing, default True
+            use_async: Send all videos at once on the asyncio event loop (needs arequest_gemini_function);
+                concurrency is then bounded by the provider's max_concurrency instead of max_workers
 
         Returns:
             List[EvaluationResult]: List of evaluation results (in the same order as input)
         """
+        if use_async and self.arequest_gemini_with_video is not None:
+            return self._evaluate_video_batch_async(video_list, log_id)
+
         if not use_parallel or len(video_list) == 1:
             return self._evaluate_video_batch_sequential(video_list, log_id)
 
@@ -161,6 +196,34 @@ class VideoEvaluator:
 
         return results
 
+    def _evaluate_video_batch_async(self, video_list: List[Dict[str, Any]], log_id: str = None) -> List[EvaluationResult]:
+        """Async mode: one coroutine per video instead of one blocked thread per video"""
+        print(f"开始异步评估 {len(video_list)} 个视频...")
+        start_time = time.time()
+
+        coros = []
+        for i, video_info in enumerate(video_list):
+            if not video_info.get("knowledge_point", ""):
+                print(f"警告: 视频 {i+1} 缺少知识点信息，可能会影响评估准确性")
+            coros.append(
+                self.aevaluate_video(
+                    video_path=video_info.get("path", ""),
+                    knowledge_point=video_info.get("knowledge_point", ""),
+                    log_id=f"{log_id}_video_{i+1}" if log_id else None,
+                )
+            )
+
+        results = []
+        for i, result in enumerate(run_all(coros)):
+            if isinstance(result, Exception):
+                print(f"警告: 视频 {i+1} 评估出错: {result}")
+                result = self._create_error_result(f"异步评估错误: {str(result)}")
+            results.append(result)
+
+        total_time = time.time() - start_time
+        print(f"\n异步评估完成！总耗时: {total_time:.1f}s, 平均每视频: {total_time/max(1, len(video_list)):.1f}s")
+        return results
+
     def _parse_evaluation_response(self, response: str) -> EvaluationResult:
         """Parse the evaluation response from MLLM"""
         try:
@@ -339,7 +402,7 @@ def evaluate_main():
     with open(json_file, "r", encoding="utf-8") as f:
         knowledge_points = json.load(f)
 
-    evaluator = VideoEvaluator(request_gemini_with_video)
+    evaluator = VideoEvaluator(request_gemini_with_video, arequest_gemini_with_video)
 
     # ----------------------------------------------------------------------------------------
     # TODO: target folder
@@ -10,9 +10,12 @@ from scipy import stats
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import functools
 import random
+import asyncio
 
 from utils import extract_answer_from_response, eva_video_list
 from gpt_request import request_gemini_with_video, request_gemini
+from async_gpt_request import arequest_gemini_with_video, arequest_gemini, run_all
+from video_proxy import proxy_video
 from prompts import get_unlearning_and_video_learning_prompt, get_unlearning_prompt
 
 
@@ -37,6 +40,27 @@ def retry(max_retries=3, base_delay=0.5, jitter=0.2):
     return deco
 
 
+def aretry(max_retries=3, base_delay=0.5, jitter=0.2):
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            attempt = 0
+            delay = base_delay
+            while True:
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception as e:
+                    attempt += 1
+                    if attempt > max_retries:
+                        raise
+                    await asyncio.sleep(delay + random.uniform(0, jitter))
+                    delay *= 2
+
+        return wrapper
+
+    return deco
+
+
 @dataclass
 class Question:
     """Educational question with multiple choice options"""
@@ -106,11 +130,27 @@ def _call_text_api(prompt: str) -> str:
 
 @retry(max_retries=3, base_delay=0.6, jitter=0.3)
 def _call_video_api(prompt: str, video_path: str) -> str:
-    response = request_gemini_with_video(prompt=prompt, video_path=video_path)
+    response = request_gemini_with_video(prompt=prompt, video_path=proxy_video(video_path, "eval"))
+    return extract_answer_from_response(response)
+
+
+@aretry(max_retries=3, base_delay=0.6, jitter=0.3)
+async def _acall_text_api(prompt: str) -> str:
+    response = await arequest_gemini(prompt=prompt)
     return extract_answer_from_response(response)
 
 
-def make_mllm_api(video_path: Optional[str]) -> Callable[[str], str]:
+@aretry(max_retries=3, base_delay=0.6, jitter=0.3)
+async def _acall_video_api(prompt: str, video_path: str) -> str:
+    proxy_path = await asyncio.to_thread(proxy_video, video_path, "eval")
+    response = await arequest_gemini_with_video(prompt=prompt, video_path=proxy_path)
+    return extract_answer_from_response(response)
+
+
+def make_mllm_api(video_path: Optional[str], use_async: bool = False) -> Callable[[str], str]:
+    if use_async:
+        # partial keeps it recognisable as a coroutine function for _assess_stage_parallel
+        return functools.partial(_acall_video_api, video_path=video_path) if video_path else _acall_text_api
     if video_path:
         return lambda prompt: _call_video_api(prompt, video_path)
     else:
@@ -150,6 +190,12 @@ class SelectiveKnowledgeUnlearning:
             # 统一要求使用中文简要解释
             return f"{prefix}\n\n{self._format_mcq_prompt_block(i, q)}请用单个字母 (A|B|C|D) 回答，然后附上一句简短的中文解释。"
 
+        if asyncio.iscoroutinefunction(api):
+            # Every question of the stage is in flight at once on the shared event loop
+            results = run_all([api(build_prompt(i, q)) for i, q in enumerate(questions, 1)])
+            responses = ["" if isinstance(r, Exception) or r is None else r for r in results]
+            return self._grade_batch(questions, responses)
+
         responses: List[Optional[str]] = [None] * len(questions)
         with ThreadPoolExecutor(max_workers=self.per_question_workers) as pool:
             futures = {}
@@ -288,9 +334,11 @@ SKU 教育视频效果评估报告 (选择性遗忘测试)
     return report
 
 
-def run_one_concept(concept: str, questions: List[Question], video_path: str, per_question_workers: int) -> EvaluationResult:
-    text_api = make_mllm_api(video_path=None)
-    video_api = make_mllm_api(video_path=video_path)
+def run_one_concept(
+    concept: str, questions: List[Question], video_path: str, per_question_workers: int, use_async: bool = False
+) -> EvaluationResult:
+    text_api = make_mllm_api(video_path=None, use_async=use_async)
+    video_api = make_mllm_api(video_path=video_path, use_async=use_async)
     sku = SelectiveKnowledgeUnlearning(mllm_api_function=text_api, per_question_workers=per_question_workers)
     return sku.evaluate_educational_video(concept=concept, questions=questions, video_api_fn=video_api)
 
@@ -321,6 +369,9 @@ def main():
     )
     # TODO: Test the number of knowledge points. If None, test all of them
     parser.add_argument("--max_concepts", default=None)
+    parser.add_argument(
+        "--use_async", action="store_true", default=False, help="Send each stage's questions concurrently on one asyncio event loop."
+    )
     args = parser.parse_args()
     # 1) Load the question set
     concept_questions = load_questions_from_json(args.questions_json)
@@ -349,7 +400,7 @@ def main():
                 continue
             if not Path(vpath).exists():
                 print(f"[WARN] Video file not found: {vpath} (concept '{concept}'). API may fail.")
-            fut = pool.submit(run_one_concept, concept, qs, vpath, args.per_question_workers)
+            fut = pool.submit(run_one_concept, concept, qs, vpath, args.per_question_workers, args.use_async)
             futures[fut] = concept
         for fut in as_completed(futures):
             concept = futures[fut]
@@ -0,0 +1,290 @@
+import re
+import sys
+import json
+import time
+import sqlite3
+import difflib
+import hashlib
+import argparse
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from fix_memo import ERROR_LINE
+
+DEFAULT_FIX_KB_PATH = Path(__file__).resolve().parent / "CASES" / "fix_knowledge_base.sqlite"
+MAX_PATCH_LINES = 12  # changed lines; bigger fixes are rewrites, not reusable patches
+MAX_EXAMPLE_CHARS = 1200
+
+
+@dataclass(frozen=True)
+class ErrorFingerprint:
+    exc_type: str
+    template: str  # message with quoted names and numbers masked
+    api: str  # offending call / attribute / name, e.g. "Code(code=)", "Code.code", "ShowCreation"
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha1(f"{self.exc_type}|{self.template}|{self.api}".encode("utf-8")).hexdigest()
+
+
+def _offending_api(message: str, code: str, error_msg: str) -> str:
+    patterns = (
+        (r"(\w+)(?:\.__init__)?\(\) got an unexpected keyword argument '(\w+)'", "{0}({1}=)"),
+        (r"'(\w+)' object has no attribute '(\w+)'", "{0}.{1}"),
+        (r"name '(\w+)' is not defined", "{0}"),
+        (r"cannot import name '(\w+)'", "{0}"),
+    )
+    for pattern, fmt in patterns:
+        match = re.search(pattern, message)
+        if match:
+            return fmt.format(*match.groups())
+    # Otherwise the outermost call on the last traceback line that points into the scene code
+    lines = code.split("\n")
+    for number in reversed(re.findall(r"line (\d+)", error_msg)):
+        if 1 <= int(number) <= len(lines):
+            call = re.search(r"([A-Za-z_][\w.]*)\(", lines[int(number) - 1])
+            if call:
+                return call.group(1).removeprefix("self.")
+    return ""
+
+
+def error_fingerprint(code: str, error_msg: str) -> Optional[ErrorFingerprint]:
+    """None when the message carries no Python exception (timeouts, crashes)"""
+    matches = [m for m in map(ERROR_LINE.search, (error_msg or "").splitlines()) if m]
+    if not matches:
+        return None
+    exc_type, message = matches[-1].group(1), matches[-1].group(2).strip()
+    template = re.sub(r"'[^']*'|\"[^\"]*\"", "'{}'", message)
+    template = re.sub(r"\d+", "N", template)
+    return ErrorFingerprint(exc_type, template, _offending_api(message, code, error_msg))
+
+
+def make_patch(old_code: str, new_code: str) -> Optional[List[Dict[str, Any]]]:
+    """Line hunks (anchor, old, new) compared without indentation; None if the fix is too large to be a patch"""
+    old_lines = [line.strip() for line in old_code.split("\n")]
+    new_lines = [line.strip() for line in new_code.split("\n")]
+    hunks, changed = [], 0
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        changed += max(i2 - i1, j2 - j1)
+        # Pure insertions are placed after the preceding line
+        anchor = old_lines[i1 - 1] if tag == "insert" and i1 > 0 else None
+        hunks.append({"anchor": anchor, "old": old_lines[i1:i2], "new": new_code.split("\n")[j1:j2]})
+    if not hunks or changed > MAX_PATCH_LINES:
+        return None
+    return hunks
+
+
+def _find_block(lines: List[str], block: List[str], start: int = 0) -> int:
+    stripped = [line.strip() for line in lines]
+    for i in range(start, len(lines) - len(block) + 1):
+        if stripped[i : i + len(block)] == block:
+            return i
+    return -1
+
+
+def _reindent(new_lines: List[str], indent: str) -> List[str]:
+    if not new_lines:
+        return []
+    base = min((len(l) - len(l.lstrip()) for l in new_lines if l.strip()), default=0)
+    return [indent + line[base:] if line.strip() else line for line in new_lines]
+
+
+def apply_patch(code: str, hunks: List[Dict[str, Any]]) -> Optional[str]:
+    """Apply a stored patch to other code; None unless every hunk finds its lines"""
+    lines = code.split("\n")
+    for hunk in hunks:
+        if hunk["old"]:
+            at = _find_block(lines, hunk["old"])
+            if at < 0:
+                return None
+            indent = lines[at][: len(lines[at]) - len(lines[at].lstrip())]
+            lines[at : at + len(hunk["old"])] = _reindent(hunk["new"], indent)
+        else:
+            at = _find_block(lines, [hunk["anchor"]]) if hunk["anchor"] is not None else -1
+            if hunk["anchor"] is not None and at < 0:
+                return None
+            indent = lines[at][: len(lines[at]) - len(lines[at].lstrip())] if at >= 0 else ""
+            if at >= 0 and lines[at].rstrip().endswith(":"):
+                indent += "    "
+            lines[at + 1 : at + 1] = _reindent(hunk["new"], indent)
+    return "\n".join(lines)
+
+
+def patch_text(hunks: List[Dict[str, Any]]) -> str:
+    """Diff-like rendering of a patch for fix prompts"""
+    out = []
+    for hunk in hunks:
+        if hunk["anchor"] is not None:
+            out.append(f"  {hunk['anchor']}")
+        out += [f"- {line}" for line in hunk["old"]] + [f"+ {line.strip()}" for line in hunk["new"]]
+    return "\n".join(out)[:MAX_EXAMPLE_CHARS]
+
+
+@dataclass
+class KnownFix:
+    id: int
+    fingerprint: ErrorFingerprint
+    hunks: List[Dict[str, Any]]
+    successes: int
+    exact: bool  # same offending API, not just the same message template
+
+
+class FixKnowledgeBase:
+    """SQLite map from error fingerprint to the minimal patches that fixed it, shared across topics and runs.
+
+    A patch is learned when the render after an LLM fix no longer fails with the fixed error;
+    it is reused by applying it before the next LLM call for the same fingerprint, and shown
+    to the LLM as an example otherwise.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else DEFAULT_FIX_KB_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS patches ("
+                "id INTEGER PRIMARY KEY, fingerprint TEXT, exc_type TEXT, template TEXT, api TEXT, "
+                "patch_hash TEXT, patch TEXT, learned INTEGER DEFAULT 1, applied INTEGER DEFAULT 0, "
+                "successes INTEGER DEFAULT 0, created REAL, last_used REAL, UNIQUE (fingerprint, patch_hash))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS patches_template ON patches (exc_type, template)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    @contextmanager
+    def _connect(self):
+        """A connection per operation (safe across threads, forked workers and concurrent processes):
+        committed when the block succeeds, rolled back otherwise, always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump(self, conn, name: str, by: int = 1):
+        conn.execute(
+            "INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, by)
+        )
+
+    def learn(self, old_code: str, error_msg: str, new_code: str) -> bool:
+        """Store the patch old_code -> new_code under the fingerprint of error_msg; False if it is not reusable"""
+        fingerprint = error_fingerprint(old_code, error_msg)
+        hunks = make_patch(old_code, new_code)
+        if fingerprint is None or hunks is None:
+            return False
+        blob = json.dumps(hunks, ensure_ascii=False, sort_keys=True)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO patches (fingerprint, exc_type, template, api, patch_hash, patch, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(fingerprint, patch_hash) DO UPDATE SET learned = learned + 1, last_used = excluded.last_used",
+                (
+                    fingerprint.key,
+                    fingerprint.exc_type,
+                    fingerprint.template,
+                    fingerprint.api,
+                    hashlib.sha1(blob.encode("utf-8")).hexdigest(),
+                    blob,
+                    now,
+                    now,
+                ),
+            )
+        return True
+
+    def matches(self, code: str, error_msg: str, limit: int = 3) -> List[KnownFix]:
+        """Patches for the same fingerprint first, then for the same exception template, best track record first"""
+        fingerprint = error_fingerprint(code, error_msg)
+        if fingerprint is None:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, exc_type, template, api, patch, successes, fingerprint = ? AS exact FROM patches "
+                "WHERE exc_type = ? AND template = ? "
+                "ORDER BY exact DESC, successes + learned DESC, last_used DESC LIMIT ?",
+                (fingerprint.key, fingerprint.exc_type, fingerprint.template, limit),
+            ).fetchall()
+        return [
+            KnownFix(id, ErrorFingerprint(exc_type, template, api), json.loads(patch), successes, bool(exact))
+            for id, exc_type, template, api, patch, successes, exact in rows
+        ]
+
+    def record_lookup(self, hit: bool):
+        # A hit skips a whole fix_code_smart round, counted as one LLM call although a failing
+        # local repair would have been followed by up to three more
+        with self._connect() as conn:
+            self._bump(conn, "lookups")
+            if hit:
+                self._bump(conn, "hits")
+
+    def record_applied(self, fix_id: int, ok: bool):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE patches SET applied = applied + 1, successes = successes + ?, last_used = ? WHERE id = ?",
+                (int(ok), time.time(), fix_id),
+            )
+
+    def counters(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            values = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        return {"lookups": values.get("lookups", 0), "hits": values.get("hits", 0)}
+
+    def stats(self) -> Dict[str, Any]:
+        counters = self.counters()
+        with self._connect() as conn:
+            patches, fingerprints = conn.execute("SELECT COUNT(*), COUNT(DISTINCT fingerprint) FROM patches").fetchone()
+            top = conn.execute(
+                "SELECT exc_type, api, SUM(successes), SUM(applied) FROM patches GROUP BY fingerprint "
+                "ORDER BY SUM(successes) DESC LIMIT 10"
+            ).fetchall()
+        return {
+            "path": str(self.path),
+            "patches": patches,
+            "fingerprints": fingerprints,
+            **counters,
+            "hit_rate": round(counters["hits"] / counters["lookups"], 3) if counters["lookups"] else 0.0,
+            "llm_calls_saved": counters["hits"],
+            "top": [{"error": f"{exc}: {api}", "successes": s, "applied": a} for exc, api, s, a in top],
+        }
+
+
+_KBS: Dict[str, FixKnowledgeBase] = {}
+
+
+def get_fix_knowledge_base(path=None) -> FixKnowledgeBase:
+    key = str(path or DEFAULT_FIX_KB_PATH)
+    if key not in _KBS:
+        _KBS[key] = FixKnowledgeBase(key)
+    return _KBS[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the error fingerprint -> patch knowledge base.")
+    parser.add_argument("--path", type=str, default=str(DEFAULT_FIX_KB_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    show_parser = sub.add_parser("show", help="list stored patches matching an error for a scene file")
+    show_parser.add_argument("code_file")
+    show_parser.add_argument("error_msg")
+    args = parser.parse_args()
+
+    kb = FixKnowledgeBase(args.path)
+    if args.command == "stats":
+        print(json.dumps(kb.stats(), ensure_ascii=False, indent=2))
+        return 0
+    code = Path(args.code_file).read_text(encoding="utf-8")
+    print(f"指纹: {error_fingerprint(code, args.error_msg)}")
+    for fix in kb.matches(code, args.error_msg, limit=10):
+        applies = apply_patch(code, fix.hunks) is not None
+        print(f"\n#{fix.id} {'精确' if fix.exact else '同类'} 成功 {fix.successes} 次 {'可直接应用' if applies else ''}")
+        print(patch_text(fix.hunks))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+MAX_FIX_ROUNDS_PER_SIGNATURE = 2  # fix rounds spent on one error signature before regenerating the section
+
+ERROR_LINE = re.compile(r"\b(\w*(?:Error|Exception)): (.*)")
+
+
+def code_hash(code: str) -> str:
+    # Trailing whitespace and blank-line churn from the LLM does not make a new version
+    normalized = "\n".join(line.rstrip() for line in code.strip().splitlines())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def error_signature(error_msg: Optional[str]) -> str:
+    """Exception type + message with line numbers, addresses and paths masked"""
+    lines = [line.strip() for line in (error_msg or "").splitlines() if line.strip()]
+    matches = [m for m in map(ERROR_LINE.search, lines) if m]
+    text = f"{matches[-1].group(1)}: {matches[-1].group(2)}" if matches else (lines[-1] if lines else "")
+    text = re.sub(r"0x[0-9a-fA-F]+", "<addr>", text)
+    text = re.sub(r"(/|[A-Za-z]:\\)[^\s'\"]+", "<path>", text)
+    return re.sub(r"\d+", "N", text)
+
+
+@dataclass
+class ValidationOutcome:
+    ok: bool
+    error_msg: Optional[str]
+    signature: Optional[str]
+
+
+class SectionFixMemo:
+    """Per-section record of every code version the fix loops have checked.
+
+    Outcomes are keyed by (code hash, stage), stage being "dry_run" or "render:<profile>", so
+    a version the LLM hands back again is never validated or rendered twice. A fix that
+    returns a version that already failed is a cycle; an error signature that survived
+    MAX_FIX_ROUNDS_PER_SIGNATURE fix rounds is not worth more LLM calls. Both end the fix
+    loop so the section is regenerated instead.
+    """
+
+    def __init__(self):
+        self.outcomes: Dict[Tuple[str, str], ValidationOutcome] = {}
+        self.failed_hashes = set()
+        self.fix_rounds: Dict[str, int] = {}
+        self.skipped_checks = 0
+        self.cycles = 0
+
+    def lookup(self, code: str, stage: str) -> Optional[ValidationOutcome]:
+        outcome = self.outcomes.get((code_hash(code), stage))
+        if outcome is not None:
+            self.skipped_checks += 1
+        return outcome
+
+    def record(self, code: str, stage: str, ok: bool, error_msg: Optional[str] = None) -> ValidationOutcome:
+        key = code_hash(code)
+        outcome = ValidationOutcome(ok, None if ok else error_msg, None if ok else error_signature(error_msg))
+        if not ok and not ERROR_LINE.search(error_msg or ""):
+            return outcome  # timeouts, memory-pressure aborts: not a property of the code
+        self.outcomes[(key, stage)] = outcome
+        if not ok:
+            self.failed_hashes.add(key)
+        return outcome
+
+    def is_cycle(self, code: str) -> bool:
+        """True for a candidate identical to a version that already failed some check"""
+        if code_hash(code) in self.failed_hashes:
+            self.cycles += 1
+            return True
+        return False
+
+    def start_fix_round(self, error_msg: Optional[str]) -> bool:
+        """Count a fix round against the error's signature; False once that signature is exhausted"""
+        signature = error_signature(error_msg)
+        self.fix_rounds[signature] = self.fix_rounds.get(signature, 0) + 1
+        return self.fix_rounds[signature] <= MAX_FIX_ROUNDS_PER_SIGNATURE
+
+    def exhausted(self, error_msg: Optional[str]) -> bool:
+        return self.fix_rounds.get(error_signature(error_msg), 0) >= MAX_FIX_ROUNDS_PER_SIGNATURE
+
+    def new_generation(self):
+        """A regenerated section gets fresh fix rounds; known outcomes stay valid, they are keyed by code"""
+        self.fix_rounds.clear()
+
+    def summary(self) -> Dict[str, int]:
+        return {"versions": len({key for key, _ in self.outcomes}), "skipped_checks": self.skipped_checks, "cycles": self.cycles}
@@ -0,0 +1,389 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from pathlib import Path
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+
+from render_slots import RenderSlots, exclusive_lock
+
+
+DEFAULT_GLYPH_CACHE_DIR = Path(__file__).resolve().parent / "CASES" / "glyph_cache"
+INTERMEDIATE_SUFFIXES = (".tex", ".dvi", ".xdv", ".pdf", ".log", ".aux")
+INTERMEDIATE_MAX_AGE = 3600  # LaTeX leftovers of finished compiles
+PRUNE_INTERVAL = 600
+LOCK_SHARDS = 256
+
+_INSTALLED: Optional["GlyphCache"] = None
+GLYPH_STATS = {"compiled": 0, "reused": 0}  # per process
+_PREBUILD_SLOTS: Optional[RenderSlots] = None  # per prebuild worker
+
+GLYPH_CLASSES = {"MathTex", "Tex", "Text", "MarkupText"}
+CONSTANT_NAME = re.compile(r"^[A-Z][A-Z0-9_]*$")  # WHITE, BOLD, ... resolved from the manim namespace
+
+
+def _valid_svg(path) -> bool:
+    """A crash in dvisvgm / Pango can leave a truncated svg behind"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - 256))
+            return b"</svg>" in f.read()
+    except OSError:
+        return False
+
+
+class GlyphCache:
+    """Cross-topic cache of compiled MathTex/Tex (LaTeX -> svg) and Text (Pango -> svg) glyphs.
+
+    manim already names these svgs by a hash of the tex template / text settings and the string,
+    so sharing tex_dir / text_dir across runs is enough for reuse. What this adds is a per-key file
+    lock around check-and-compile, validation of half-written svgs, and LRU eviction by size.
+    """
+
+    def __init__(self, cache_dir=None, max_size_mb: int = 2000):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_GLYPH_CACHE_DIR
+        self.tex_dir = self.cache_dir / "Tex"
+        self.text_dir = self.cache_dir / "texts"
+        self.locks_dir = self.cache_dir / "locks"
+        for d in (self.tex_dir, self.text_dir, self.locks_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+    def manim_config(self) -> Dict[str, Any]:
+        # manim's own cleanup deletes every non-svg file in tex_dir, including other processes' in-flight compiles
+        return {"tex_dir": str(self.tex_dir), "text_dir": str(self.text_dir), "no_latex_cleanup": True}
+
+    def lock_path(self, key: str) -> Path:
+        return self.locks_dir / f"{int(key[:8], 16) % LOCK_SHARDS:03d}.lock"
+
+    def entries(self) -> List[Tuple[Path, int, float]]:
+        result = []
+        for d in (self.tex_dir, self.text_dir):
+            for path in d.glob("*.svg"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                result.append((path, st.st_size, st.st_mtime))
+        return result
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """Drop stale LaTeX intermediates, then evict least recently used svgs until the cache fits"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed, freed = 0, 0
+        with exclusive_lock(self.locks_dir / "prune.lock"):
+            now = time.time()
+            for path in self.tex_dir.iterdir():
+                try:
+                    if path.suffix in INTERMEDIATE_SUFFIXES and now - path.stat().st_mtime > INTERMEDIATE_MAX_AGE:
+                        path.unlink()
+                except OSError:
+                    continue
+
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= limit:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                freed += size
+            (self.locks_dir / ".last_prune").touch()
+        return removed, freed
+
+    def maybe_prune(self):
+        marker = self.locks_dir / ".last_prune"
+        try:
+            if time.time() - marker.stat().st_mtime < PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+        self.prune()
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        return {
+            "cache_dir": str(self.cache_dir),
+            "tex_glyphs": sum(1 for p, _, _ in entries if p.parent == self.tex_dir),
+            "text_glyphs": sum(1 for p, _, _ in entries if p.parent == self.text_dir),
+            "size_mb": sum(size for _, size, _ in entries) / 1024 / 1024,
+            "max_size_mb": self.max_bytes / 1024 / 1024,
+        }
+
+
+def _locked_compile(key: str, compile_func, *args, **kwargs):
+    with exclusive_lock(_INSTALLED.lock_path(key)):
+        start = time.time()
+        svg = compile_func(*args, **kwargs)
+        if not _valid_svg(svg):
+            Path(svg).unlink(missing_ok=True)
+            svg = compile_func(*args, **kwargs)
+        try:
+            # ctime of a reused svg is its last utime(), i.e. older than this call
+            GLYPH_STATS["compiled" if os.stat(svg).st_ctime >= start else "reused"] += 1
+        except OSError:
+            pass
+        try:
+            os.utime(svg)  # LRU: mtime is the last use
+        except OSError:
+            pass
+        return svg
+
+
+def _patch_tex():
+    from manim import config
+    from manim.utils import tex_file_writing
+    from manim.mobject.text import tex_mobject
+
+    original = tex_file_writing.tex_to_svg_file
+
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        template = tex_template or config["tex_template"]
+        body = getattr(template, "body", None) or str(template)
+        key = hashlib.sha256(f"{body}\0{environment}\0{expression}".encode("utf-8")).hexdigest()
+        return _locked_compile(key, original, expression, environment=environment, tex_template=tex_template)
+
+    tex_file_writing.tex_to_svg_file = tex_to_svg_file
+    if getattr(tex_mobject, "tex_to_svg_file", None) is original:
+        tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+
+def _patch_text():
+    from manim.mobject.text.text_mobject import Text, MarkupText
+
+    for cls in (Text, MarkupText):
+        original = cls._text2svg
+
+        def _text2svg(self, *args, _original=original, **kwargs):
+            try:
+                key = self._text2hash(*args, **kwargs)
+            except Exception:
+                key = hashlib.sha256(repr(getattr(self, "original_text", self.text)).encode("utf-8")).hexdigest()
+            key = hashlib.sha256(key.encode("utf-8")).hexdigest()
+            return _locked_compile(key, _original, self, *args, **kwargs)
+
+        cls._text2svg = _text2svg
+
+
+def install_glyph_cache(cache_dir=None, max_size_mb: int = 2000) -> GlyphCache:
+    """Point manim's tex_dir / text_dir at the shared cache and make glyph compilation process-safe"""
+    global _INSTALLED
+    from manim import config
+
+    cache = GlyphCache(cache_dir, max_size_mb)
+    for key, value in cache.manim_config().items():
+        config[key] = value
+    if _INSTALLED is None:
+        _patch_tex()
+        _patch_text()
+    _INSTALLED = cache
+    cache.maybe_prune()
+    return cache
+
+
+def _literal_arg(node: ast.AST):
+    """("lit", value) for literals, ("name", NAME) for manim constants like WHITE, else None"""
+    try:
+        return ("lit", ast.literal_eval(node))
+    except (ValueError, SyntaxError, TypeError):
+        pass
+    if isinstance(node, ast.Name) and CONSTANT_NAME.match(node.id):
+        return ("name", node.id)
+    return None
+
+
+def extract_glyph_literals(code: str) -> List[Tuple]:
+    """Every MathTex/Tex/Text/MarkupText the scene builds from literals only, as hashable specs.
+
+    Calls with any computed argument are skipped: their glyph cannot be known before the render.
+    setup_layout(title, lines) is expanded into the Text calls TeachingScene makes for it.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    specs = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else func.id if isinstance(func, ast.Name) else None
+
+        if name == "setup_layout" and len(node.args) >= 2:
+            title, lines = _literal_arg(node.args[0]), _literal_arg(node.args[1])
+            white = ("color", ("name", "WHITE"))
+            if title and title[0] == "lit" and isinstance(title[1], str):
+                specs.append(("Text", (title[1],), (white, ("font_size", ("lit", 28)))))
+            if lines and lines[0] == "lit" and isinstance(lines[1], (list, tuple)):
+                for line in lines[1]:
+                    if isinstance(line, str):
+                        specs.append(("Text", (line,), (white, ("font_size", ("lit", 22)))))
+            continue
+
+        if name not in GLYPH_CLASSES or not node.args:
+            continue
+        args = [_literal_arg(a) for a in node.args]
+        if any(a is None or a[0] != "lit" or not isinstance(a[1], str) for a in args):
+            continue
+        kwargs = [(kw.arg, _literal_arg(kw.value)) for kw in node.keywords]
+        if any(kw is None or value is None for kw, value in kwargs):
+            continue
+        try:
+            spec = (name, tuple(a[1] for a in args), tuple(sorted(kwargs)))
+            hash(spec)
+        except TypeError:  # e.g. t2c={...}: dict literal
+            continue
+        specs.append(spec)
+    return specs
+
+
+def _init_prebuild_worker(cache_dir, max_size_mb: int, render_slots: Optional[RenderSlots]):
+    global _PREBUILD_SLOTS
+    _PREBUILD_SLOTS = render_slots
+    install_glyph_cache(cache_dir, max_size_mb)
+
+
+def _build_glyph(spec) -> Tuple[bool, int, int]:
+    """Construct one mobject so its svg lands in the cache; returns (ok, # compiled, # reused)"""
+    import manim
+
+    cls_name, args, kwargs = spec
+    before = dict(GLYPH_STATS)
+    # A LaTeX / Pango compile competes with renders for the same cores: take a render slot for it
+    with _PREBUILD_SLOTS.acquire() if _PREBUILD_SLOTS is not None else nullcontext():
+        try:
+            resolved = {k: getattr(manim, v) if kind == "name" else v for k, (kind, v) in kwargs}
+            getattr(manim, cls_name)(*args, **resolved)
+            ok = True
+        except Exception:
+            ok = False
+    return ok, GLYPH_STATS["compiled"] - before["compiled"], GLYPH_STATS["reused"] - before["reused"]
+
+
+def prebuild_glyphs(
+    code_groups: Dict[str, List[str]],
+    cache_dir=None,
+    max_size_mb: int = 2000,
+    max_workers: Optional[int] = None,
+    render_slots: Optional[RenderSlots] = None,
+) -> Dict[str, int]:
+    """Compile every literal glyph of the given scenes (grouped by topic folder) into the cache in parallel.
+
+    With `render_slots` every compile holds a host-wide render slot and the pool is no larger
+    than the slot count, so topics prebuilding side by side do not oversubscribe the host.
+    """
+    group_specs = {group: set(s for code in codes for s in extract_glyph_literals(code)) for group, codes in code_groups.items()}
+    unique = sorted(set().union(*group_specs.values()), key=repr) if group_specs else []
+    report = {
+        "occurrences": sum(len(extract_glyph_literals(code)) for codes in code_groups.values() for code in codes),
+        "unique": len(unique),
+        "compiled": 0,
+        "already_cached": 0,
+        "failed": 0,
+        "saved": 0,
+    }
+    if not unique:
+        return report
+
+    ok_specs = set()
+    max_workers = max_workers or os.cpu_count()
+    if render_slots is not None:
+        max_workers = min(max_workers, render_slots.num_slots)
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(unique)),
+        initializer=_init_prebuild_worker,
+        initargs=(cache_dir, max_size_mb, render_slots),
+        mp_context=multiprocessing.get_context("spawn"),  # callers may have live threads (streaming codegen)
+    ) as executor:
+        for spec, (ok, compiled, reused) in zip(unique, executor.map(_build_glyph, unique, chunksize=8)):
+            if not ok:
+                report["failed"] += 1
+                continue
+            ok_specs.add(spec)
+            report["compiled"] += compiled
+            report["already_cached"] += 1 if not compiled else 0
+
+    # With per-folder media/Tex every topic compiled each of its glyphs once during its renders
+    render_time = sum(len(specs & ok_specs) for specs in group_specs.values())
+    report["saved"] = render_time - report["compiled"]
+    return report
+
+
+def launcher_cmd(glyph_cache: Dict[str, Any], manim_args: List[str]) -> List[str]:
+    """Command line equivalent to `manim <manim_args>` rendering through the shared glyph cache"""
+    return [
+        sys.executable,
+        str(Path(__file__).resolve()),
+        "--cache_dir",
+        str(glyph_cache.get("cache_dir") or DEFAULT_GLYPH_CACHE_DIR),
+        "--max_size_mb",
+        str(glyph_cache.get("max_size_mb", 2000)),
+        "manim",
+        *manim_args,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared Tex/Text glyph cache for manim renders.")
+    parser.add_argument("--cache_dir", type=str, default=str(DEFAULT_GLYPH_CACHE_DIR))
+    parser.add_argument("--max_size_mb", type=int, default=2000)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("prune")
+    sub.add_parser("clear")
+    manim_parser = sub.add_parser("manim", help="run the manim CLI with the glyph cache installed")
+    manim_parser.add_argument("manim_args", nargs=argparse.REMAINDER)
+    prebuild_parser = sub.add_parser("prebuild", help="compile all literal glyphs of generated scenes under the given folders")
+    prebuild_parser.add_argument("folders", nargs="+")
+    prebuild_parser.add_argument("--max_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "prebuild":
+        code_groups = {}
+        for folder in args.folders:
+            for code_file in Path(folder).rglob("*.py"):
+                if "media" in code_file.parts:
+                    continue
+                code_groups.setdefault(str(code_file.parent), []).append(code_file.read_text(encoding="utf-8"))
+        report = prebuild_glyphs(code_groups, args.cache_dir, args.max_size_mb, args.max_workers)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command == "manim":
+        install_glyph_cache(args.cache_dir, args.max_size_mb)
+        from manim.__main__ import main as manim_main
+
+        # The CLI re-applies its own --no_latex_cleanup default (False) over config while parsing;
+        # pass the flag so manim never cleans the tex_dir shared with concurrent renders
+        manim_args = list(args.manim_args)
+        if "--no_latex_cleanup" not in manim_args:
+            manim_args.insert(1 if manim_args[:1] == ["render"] else 0, "--no_latex_cleanup")
+        sys.argv = ["manim", *manim_args]
+        return manim_main()
+
+    cache = GlyphCache(args.cache_dir, args.max_size_mb)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "prune":
+        removed, freed = cache.prune()
+        print(f"已清理 {removed} 个字形缓存，释放 {freed / 1024 / 1024:.1f} MB")
+    else:
+        removed, freed = cache.prune(max_bytes=0)
+        print(f"已清空字形缓存: {removed} 个文件，{freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,19 @@
 import openai
 import time
-import random
 import os
-import base64
 from openai import OpenAI
-import time
 import json
 import pathlib
+import threading
+import httpx
+
+from openai.types.chat import ChatCompletion
+
+from rate_limiter import RateLimiter, estimate_tokens
+from llm_cache import get_llm_cache, cache_counters
+from retry_policy import RetryPolicy, breaker, record_outcome
+from media_encoding import encoded_data_url
+from hedging import call_hedged
 
 
 # Read and cache once
@@ -19,6 +26,123 @@ def cfg(svc: str, key: str, default=None):
     return os.getenv(f"{svc}_{key}".upper(), _CFG.get(svc, {}).get(key, default))
 
 
+# Pooled clients: one per (base_url, api_key, timeout, api_version) and process, reused across calls and threads
+HTTP_POOL_LIMITS = {
+    "max_connections": int(cfg("http", "max_connections", 100)),
+    "max_keepalive_connections": int(cfg("http", "max_keepalive_connections", 20)),
+    "keepalive_expiry": float(cfg("http", "keepalive_expiry", 60)),
+}
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _reset_clients_after_fork():
+    # A forked ProcessPoolExecutor worker must not share the parent's sockets (or a lock held mid-creation)
+    global _CLIENTS, _CLIENTS_LOCK
+    _CLIENTS = {}
+    _CLIENTS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def get_client(base_url, api_key, timeout=None, api_version=None):
+    """Shared OpenAI / AzureOpenAI client with a keep-alive connection pool"""
+    key = (base_url, api_key, timeout, api_version, os.getpid())
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            http_client = openai.DefaultHttpxClient(limits=httpx.Limits(**HTTP_POOL_LIMITS))
+            kwargs = {"api_key": api_key, "http_client": http_client}
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            if api_version is not None:
+                client = openai.AzureOpenAI(azure_endpoint=base_url, api_version=api_version, **kwargs)
+            else:
+                client = OpenAI(base_url=base_url, **kwargs)
+            _CLIENTS[key] = client
+        return client
+
+
+def _build_rate_limiter():
+    # "rpm" / "tpm" in a provider's api_config section (or e.g. GEMINI_RPM in the environment) turn limiting on
+    limits = {}
+    for svc in _CFG:
+        rpm, tpm = float(cfg(svc, "rpm", 0) or 0), float(cfg(svc, "tpm", 0) or 0)
+        if rpm or tpm:
+            limits[svc] = (rpm, tpm)
+    return RateLimiter(limits) if limits else None
+
+
+RATE_LIMITER = _build_rate_limiter()
+
+
+def _create_completion(svc, client, **create_kwargs):
+    """chat.completions.create served from the LLM response cache when it is enabled"""
+    cache = get_llm_cache(cfg)
+    if cache is None:
+        return _create_completion_hedged(svc, client, **create_kwargs)
+
+    key, body = cache.lookup(svc, create_kwargs)
+    if body is not None:
+        completion = ChatCompletion.model_validate_json(body)
+        completion.usage = None  # nothing was spent on this call
+        return completion
+    completion = _create_completion_hedged(svc, client, **create_kwargs)
+    if completion is not None and completion.choices:
+        cache.put(key, svc, create_kwargs.get("model"), completion.model_dump_json())
+    return completion
+
+
+def _create_completion_hedged(svc, client, **create_kwargs):
+    """Duplicates the call if it is slower than usual for its kind and hedging is enabled"""
+    key = (svc, create_kwargs.get("model"), create_kwargs.get("max_tokens"))
+
+    def hedge(hedge_svc):
+        if hedge_svc == svc:
+            return _create_completion_limited(svc, client, **create_kwargs)
+        hedge_client = get_client(cfg(hedge_svc, "base_url"), cfg(hedge_svc, "api_key"), timeout=300.0)
+        return _create_completion_limited(hedge_svc, hedge_client, **dict(create_kwargs, model=cfg(hedge_svc, "model")))
+
+    return call_hedged(cfg, svc, key, lambda: _create_completion_limited(svc, client, **create_kwargs), hedge)
+
+
+def _create_completion_limited(svc, client, **create_kwargs):
+    """chat.completions.create that first waits for host-wide RPM / TPM quota of `svc`, if it has limits"""
+    if RATE_LIMITER is None or svc not in RATE_LIMITER.limits:
+        return _create_completion_guarded(svc, client, **create_kwargs)
+
+    model = create_kwargs.get("model")
+    reserved = estimate_tokens(create_kwargs.get("messages")) + (create_kwargs.get("max_tokens") or 0)
+    waited = RATE_LIMITER.acquire(svc, model, reserved)
+    if waited > 1:
+        print(f"⏳ {svc}/{model} 等待限流配额 {waited:.1f} 秒")
+    used = 0
+    try:
+        completion = _create_completion_guarded(svc, client, **create_kwargs)
+        usage = getattr(completion, "usage", None)
+        used = usage.total_tokens if usage else reserved
+        return completion
+    finally:
+        RATE_LIMITER.settle(svc, model, reserved, used)
+
+
+def _create_completion_guarded(svc, client, **create_kwargs):
+    """chat.completions.create behind the provider's circuit breaker"""
+    ticket = breaker(svc).before_call()
+    try:
+        completion = client.chat.completions.create(**create_kwargs)
+    except Exception as e:
+        record_outcome(svc, ticket, e)
+        raise
+    record_outcome(svc, ticket)
+    return completion
+
+
 def generate_log_id():
     """Generate a log ID with 'tkb' prefix and current timestamp."""
     return f"tkb{int(time.time() * 1000)}"
@@ -27,17 +151,19 @@ def generate_log_id():
 def request_claude(prompt, log_id=None, max_tokens=16384, max_retries=3):
     base_url = cfg("claude", "base_url")
     api_key = cfg("claude", "api_key")
-    client = OpenAI(base_url=base_url, api_key=api_key)
+    client = get_client(base_url, api_key)
 
     if log_id is None:
         log_id = generate_log_id()
 
     extra_headers = {"X-TT-LOGID": log_id}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("claude", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            response = client.chat.completions.create(
+            response = _create_completion(
+                "claude",
+                client,
                 model="claude-4-opus",
                 messages=[
                     {
@@ -57,22 +183,13 @@ def request_claude(prompt, log_id=None, max_tokens=16384, max_retries=3):
             return response.choices[0].message.content.strip()
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
     base_url = cfg("claude", "base_url")
     api_key = cfg("claude", "api_key")
-    client = OpenAI(base_url=base_url, api_key=api_key)
+    client = get_client(base_url, api_key)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -80,10 +197,12 @@ def request_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
     extra_headers = {"X-TT-LOGID": log_id}
     usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("claude", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "claude",
+                client,
                 model="claude-4-opus",
                 messages=[
                     {
@@ -104,19 +223,11 @@ def request_claude_token(prompt, log_id=None, max_tokens=10000, max_retries=3):
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
     return None, usage_info
 
@@ -130,11 +241,7 @@ def request_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tok
     model_name = cfg("gemini", "model")
 
     # 修改点：使用 base_url 初始化标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=300.0,
-    )
+    client = get_client(base_url, api_key, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -145,16 +252,14 @@ def request_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tok
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
 
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
-
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    data_url = f"data:video/mp4;base64,{video_base64}"
+    data_url = encoded_data_url(video_path, "video/mp4")
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gemini", max_retries, base_delay=0.2)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gemini",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -171,12 +276,7 @@ def request_gemini_with_video(prompt: str, video_path: str, log_id=None, max_tok
             return completion
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.2 + random.random() * 0.2
-            print(f"Retry {retry_count}/{max_retries} after error: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_gemini_video_img(
@@ -191,11 +291,7 @@ def request_gemini_video_img(
     model_name = cfg("gemini", "model")
 
     # 修改点：使用 base_url 初始化标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=300.0,
-    )
+    client = get_client(base_url, api_key, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -205,21 +301,18 @@ def request_gemini_video_img(
     # Load and base64-encode video
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    video_data_url = f"data:video/mp4;base64,{video_base64}"
+    video_data_url = encoded_data_url(video_path, "video/mp4")
 
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    image_data_url = f"data:image/png;base64,{base64_image}"
+    image_data_url = encoded_data_url(image_path, "image/png")
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gemini", max_retries, base_delay=0.2)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gemini",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -245,12 +338,7 @@ def request_gemini_video_img(
             return completion
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.2 + random.random() * 0.2
-            print(f"Retry {retry_count}/{max_retries} after error: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
     return None
 
 
@@ -266,11 +354,7 @@ def request_gemini_video_img_token(
     model_name = cfg("gemini", "model")
 
     # 修改点：使用 base_url 初始化标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=300.0,
-    )
+    client = get_client(base_url, api_key, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -282,21 +366,18 @@ def request_gemini_video_img_token(
     # Load and base64-encode video
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    video_data_url = f"data:video/mp4;base64,{video_base64}"
+    video_data_url = encoded_data_url(video_path, "video/mp4")
 
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    image_data_url = f"data:image/png;base64,{base64_image}"
+    image_data_url = encoded_data_url(image_path, "image/png")
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gemini", max_retries, base_delay=0.2)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gemini",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -325,15 +406,11 @@ def request_gemini_video_img_token(
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.2 + random.random() * 0.2
-            print(f"Retry {retry_count}/{max_retries} after error: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
     return None, usage_info
 
 
@@ -347,21 +424,19 @@ def request_gemini(prompt, log_id=None, max_tokens=8000, max_retries=10):
     model_name = cfg("gemini", "model")
 
     # 修改点：使用 base_url 初始化标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=300.0,
-    )
+    client = get_client(base_url, api_key, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
 
     extra_headers = {"X-TT-LOGID": log_id}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gemini", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gemini",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -369,16 +444,7 @@ def request_gemini(prompt, log_id=None, max_tokens=8000, max_retries=10):
             )
             return completion
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=10):
@@ -392,11 +458,7 @@ def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=10):
     model_name = cfg("gemini", "model")
 
     # 修改点：使用 base_url 初始化标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=300.0,
-    )
+    client = get_client(base_url, api_key, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -405,10 +467,12 @@ def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=10):
 
     usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gemini", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gemini",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -419,19 +483,11 @@ def request_gemini_token(prompt, log_id=None, max_tokens=8000, max_retries=10):
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
     return None, usage_info
 
 def request_gpt4o(prompt, log_id=None, max_tokens=8000, max_retries=3):
@@ -453,21 +509,19 @@ def request_gpt4o(prompt, log_id=None, max_tokens=8000, max_retries=3):
     ak = cfg("gpt4o", "api_key")
     model_name = cfg("gpt4o", "model")
 
-    client = openai.AzureOpenAI(
-        azure_endpoint=base_url,
-        api_version=api_version,
-        api_key=ak,
-    )
+    client = get_client(base_url, ak, api_version=api_version)
 
     if log_id is None:
         log_id = generate_log_id()
 
     extra_headers = {"X-TT-LOGID": log_id}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt4o", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt4o",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -485,16 +539,7 @@ def request_gpt4o(prompt, log_id=None, max_tokens=8000, max_retries=3):
             )
             return completion.choices[0].message.content
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
@@ -513,11 +558,7 @@ def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
     model_name = cfg("gpt4o", "model")
 
     # --- MODIFIED: Use standard OpenAI client & 5 min timeout ---
-    client = OpenAI(
-        base_url=base_url,
-        api_key=ak,
-        timeout=300.0,
-    )
+    client = get_client(base_url, ak, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -526,10 +567,12 @@ def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
 
     usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt4o", max_retries, base_delay=1.0)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt4o",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -551,20 +594,12 @@ def request_gpt4o_token(prompt, log_id=None, max_tokens=8000, max_retries=3):
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                print(f"Failed after {max_retries} attempts. Last error: {str(e)}")
+            if not retry.wait(e, raise_on_give_up=False):
                 return None, usage_info
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 1.0 + (random.random() * 0.5)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
     return None, usage_info
 
 
@@ -587,11 +622,7 @@ def request_o4mini(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking
     ak = cfg("gpt4omini", "api_key")
     model_name = cfg("gpt4omini", "model")
 
-    client = openai.AzureOpenAI(
-        azure_endpoint=base_url,
-        api_version=api_version,
-        api_key=ak,
-    )
+    client = get_client(base_url, ak, api_version=api_version)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -603,10 +634,12 @@ def request_o4mini(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking
     if thinking:
         extra_body = {"thinking": {"type": "enabled", "budget_tokens": 2000}}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt4omini", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt4omini",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -615,16 +648,7 @@ def request_o4mini(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking
             )
             return completion
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, thinking=False):
@@ -646,11 +670,7 @@ def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, th
     ak = cfg("gpt4omini", "api_key")
     model_name = cfg("gpt4omini", "model")
 
-    client = openai.AzureOpenAI(
-        azure_endpoint=base_url,
-        api_version=api_version,
-        api_key=ak,
-    )
+    client = get_client(base_url, ak, api_version=api_version)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -664,10 +684,12 @@ def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, th
     if thinking:
         extra_body = {"thinking": {"type": "enabled", "budget_tokens": 2000}}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt4omini", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt4omini",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -679,19 +701,11 @@ def request_o4mini_token(prompt, log_id=None, max_tokens=8000, max_retries=3, th
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
     return None, usage_info
 
 
@@ -706,21 +720,19 @@ def request_gpt5(prompt, log_id=None, max_tokens=1000, max_retries=10):
     model_name = cfg("gpt5", "model")
 
     # 2. ✅ 修正点：改为标准 OpenAI 客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=ak,
-        timeout=300.0,
-    )
+    client = get_client(base_url, ak, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
 
     extra_headers = {"X-TT-LOGID": log_id}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -729,15 +741,7 @@ def request_gpt5(prompt, log_id=None, max_tokens=1000, max_retries=10):
             )
             return completion
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=10):
     """
@@ -749,11 +753,7 @@ def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=10):
     model_name = cfg("gpt5", "model")
 
     # 2. ✅ 修正点：标准 OpenAI 客户端使用 base_url，而不是 azure_endpoint
-    client = OpenAI(
-        base_url=base_url,  # 👈 注意这里改成了 base_url
-        api_key=ak,
-        timeout=300.0,      # 设置 5 分钟超时
-    )
+    client = get_client(base_url, ak, timeout=300.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -761,10 +761,12 @@ def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=10):
     extra_headers = {"X-TT-LOGID": log_id}
     usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=1.0)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -776,19 +778,12 @@ def request_gpt5_token(prompt, log_id=None, max_tokens=1000, max_retries=10):
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                print(f"Failed after {max_retries} attempts. Last error: {str(e)}")
+            if not retry.wait(e, raise_on_give_up=False):
                 return None, usage_info
-
-            delay = (2**retry_count) * 1.0 + (random.random() * 0.5)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
     return None, usage_info
 
 def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_retries=10):
@@ -802,11 +797,7 @@ def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_
     model_name = cfg("gpt5", "model")
 
     # 2. 初始化标准客户端
-    client = OpenAI(
-        base_url=base_url,
-        api_key=ak,
-        timeout=300.0,
-    )
+    client = get_client(base_url, ak, timeout=300.0)
     
     if log_id is None:
         log_id = generate_log_id()
@@ -821,8 +812,7 @@ def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_
             raise FileNotFoundError(f"Image file not found: {image_path}")
 
         # 读取并转为 Base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        image_data_url = encoded_data_url(image_path, "image/png")
 
         messages = [
             {
@@ -832,7 +822,7 @@ def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_
                     {
                         "type": "image_url", 
                         "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}",
+                            "url": image_data_url,
                             "detail": "high" # 强制高清模式
                         }
                     },
@@ -844,10 +834,12 @@ def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_
         messages = [{"role": "user", "content": prompt}]
 
     # 4. 发送请求
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=1.0)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=messages,
                 max_tokens=max_tokens,
@@ -857,15 +849,7 @@ def request_gpt5_img(prompt, image_path=None, log_id=None, max_tokens=1000, max_
             return completion
             
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            
-            delay = (2**retry_count) * 1.0 + (random.random() * 0.5)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 def request_gpt5_with_video(prompt: str, video_path: str, log_id=None, max_tokens: int = 10000, max_retries: int = 10):
     """
@@ -878,11 +862,7 @@ def request_gpt5_with_video(prompt: str, video_path: str, log_id=None, max_token
     api_key = cfg("gpt5", "api_key")
     model_name = cfg("gpt5", "model")
 
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=600.0, # 视频处理通常需要更长时间，建议设为 600s
-    )
+    client = get_client(base_url, api_key, timeout=600.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -893,16 +873,14 @@ def request_gpt5_with_video(prompt: str, video_path: str, log_id=None, max_token
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
 
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
+    data_url = encoded_data_url(video_path, "video/mp4")
 
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    data_url = f"data:video/mp4;base64,{video_base64}"
-
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=0.5)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -927,13 +905,7 @@ def request_gpt5_with_video(prompt: str, video_path: str, log_id=None, max_token
             return completion
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            
-            delay = (2**retry_count) * 0.5 + (random.random() * 0.5)
-            print(f"GPT-5 Video Retry {retry_count}/{max_retries}: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_gpt5_video_img(
@@ -947,11 +919,7 @@ def request_gpt5_video_img(
     api_key = cfg("gpt5", "api_key")
     model_name = cfg("gpt5", "model")
 
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=600.0,
-    )
+    client = get_client(base_url, api_key, timeout=600.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -961,22 +929,19 @@ def request_gpt5_video_img(
     # 1. Process Video
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    video_data_url = f"data:video/mp4;base64,{video_base64}"
+    video_data_url = encoded_data_url(video_path, "video/mp4")
 
     # 2. Process Image
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    image_data_url = f"data:image/png;base64,{base64_image}"
+    image_data_url = encoded_data_url(image_path, "image/png")
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=0.5)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -1001,12 +966,7 @@ def request_gpt5_video_img(
             return completion
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.5 + (random.random() * 0.5)
-            print(f"GPT-5 Video+Img Retry {retry_count}/{max_retries}: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
     return None
 
 
@@ -1021,11 +981,7 @@ def request_gpt5_video_img_token(
     api_key = cfg("gpt5", "api_key")
     model_name = cfg("gpt5", "model")
 
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-        timeout=600.0,
-    )
+    client = get_client(base_url, api_key, timeout=600.0)
 
     if log_id is None:
         log_id = generate_log_id()
@@ -1036,22 +992,19 @@ def request_gpt5_video_img_token(
     # 1. Process Video
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
-    with open(video_path, "rb") as f:
-        video_bytes = f.read()
-    video_base64 = base64.b64encode(video_bytes).decode("utf-8")
-    video_data_url = f"data:video/mp4;base64,{video_base64}"
+    video_data_url = encoded_data_url(video_path, "video/mp4")
 
     # 2. Process Image
     if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image file not found: {image_path}")
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    image_data_url = f"data:image/png;base64,{base64_image}"
+    image_data_url = encoded_data_url(image_path, "image/png")
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt5", max_retries, base_delay=0.5)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt5",
+                client,
                 model=model_name,
                 messages=[
                     {
@@ -1078,15 +1031,11 @@ def request_gpt5_video_img_token(
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.5 + (random.random() * 0.5)
-            print(f"GPT-5 Video+Img+Token Retry {retry_count}/{max_retries}: {e}, waiting {delay:.2f}s...")
-            time.sleep(delay)
+            retry.wait(e)
     return None, usage_info
 
 def request_gpt41(prompt, log_id=None, max_tokens=1000, max_retries=3):
@@ -1107,21 +1056,19 @@ def request_gpt41(prompt, log_id=None, max_tokens=1000, max_retries=3):
     api_key = cfg("gpt41", "api_key")
     model_name = cfg("gpt41", "model")
 
-    client = openai.AzureOpenAI(
-        azure_endpoint=base_url,
-        api_version=api_version,
-        api_key=api_key,
-    )
+    client = get_client(base_url, api_key, api_version=api_version)
 
     if log_id is None:
         log_id = generate_log_id()
 
     extra_headers = {"X-TT-LOGID": log_id}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt41", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt41",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -1129,16 +1076,7 @@ def request_gpt41(prompt, log_id=None, max_tokens=1000, max_retries=3):
             )
             return completion
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-
-            # Exponential backoff with jitter
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
@@ -1148,11 +1086,7 @@ def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     model_name = cfg("gpt41", "model")
 
     # --- MODIFIED: Use standard OpenAI client & 5 min timeout ---
-    client = OpenAI(
-        base_url=base_url,
-        api_key=ak,
-        timeout=300.0,
-    )
+    client = get_client(base_url, ak, timeout=300.0)
     # ------------------------------------
 
     if log_id is None:
@@ -1162,10 +1096,12 @@ def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
     extra_headers = {"X-TT-LOGID": log_id} 
     usage_info = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt41", max_retries, base_delay=1.0)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt41",
+                client,
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_tokens,
@@ -1177,19 +1113,12 @@ def request_gpt41_token(prompt, log_id=None, max_tokens=1000, max_retries=3):
                 usage_info["prompt_tokens"] = completion.usage.prompt_tokens
                 usage_info["completion_tokens"] = completion.usage.completion_tokens
                 usage_info["total_tokens"] = completion.usage.total_tokens
+            usage_info.update(cache_counters())
             return completion, usage_info
 
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                # 即使失败也返回，以免程序崩溃
-                print(f"Failed after {max_retries} attempts. Last error: {str(e)}")
+            if not retry.wait(e, raise_on_give_up=False):
                 return None, usage_info
-            
-            # 增加重试等待时间
-            delay = (2**retry_count) * 1.0 + (random.random() * 0.5)
-            print(f"Retry {retry_count} error: {str(e)}. Waiting {delay:.2f}s...")
-            time.sleep(delay)
 
     return None, usage_info
 
@@ -1211,11 +1140,7 @@ def request_gpt41_img(prompt, image_path=None, log_id=None, max_tokens=1000, max
     ak = cfg("gpt41", "api_key")
     model_name = cfg("gpt41", "model")
 
-    client = openai.AzureOpenAI(
-        azure_endpoint=base_url,
-        api_version=api_version,
-        api_key=ak,
-    )
+    client = get_client(base_url, ak, api_version=api_version)
     if log_id is None:
         log_id = generate_log_id()
     extra_headers = {"X-TT-LOGID": log_id}
@@ -1225,25 +1150,26 @@ def request_gpt41_img(prompt, image_path=None, log_id=None, max_tokens=1000, max
         if not os.path.isfile(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
 
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        image_data_url = encoded_data_url(image_path, "image/png")
 
         messages = [
             {
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}},
+                    {"type": "image_url", "image_url": {"url": image_data_url}},
                 ],
             }
         ]
 
     else:
         messages = [{"role": "user", "content": prompt}]
-    retry_count = 0
-    while retry_count < max_retries:
+    retry = RetryPolicy("gpt41", max_retries, base_delay=0.1)
+    while retry.pending():
         try:
-            completion = client.chat.completions.create(
+            completion = _create_completion(
+                "gpt41",
+                client,
                 model=model_name,
                 messages=messages,
                 max_tokens=max_tokens,
@@ -1251,14 +1177,7 @@ def request_gpt41_img(prompt, image_path=None, log_id=None, max_tokens=1000, max
             )
             return completion
         except Exception as e:
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise Exception(f"Failed after {max_retries} attempts. Last error: {str(e)}")
-            delay = (2**retry_count) * 0.1 + (random.random() * 0.1)
-            print(
-                f"Request failed with error: {str(e)}. Retrying in {delay:.2f} seconds... (Attempt {retry_count}/{max_retries})"
-            )
-            time.sleep(delay)
+            retry.wait(e)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+"""Hedged LLM requests: when a call is slower than the usual p95 for its kind, send a duplicate
+(to the same provider or its "hedge_to" secondary) and take whichever succeeds first.
+
+Settings come from the "hedging" api_config section or HEDGING_* env vars:
+    enabled      off by default
+    percentile   latency percentile after which a call is hedged (95)
+    budget       hedges allowed per primary request, e.g. 0.05 = at most 5% extra requests
+    min_samples  latencies needed for a call kind before it is ever hedged (20)
+    min_delay    never hedge earlier than this many seconds (5)
+"""
+import os
+import time
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Dict, Any, Callable, Optional, Tuple
+
+WINDOW = 200  # recent latencies kept per call kind
+BUDGET_BURST = 3.0  # hedges that may be spent back to back
+
+
+class LatencyTracker:
+    def __init__(self):
+        self._samples: Dict[Tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Tuple, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=WINDOW)).append(seconds)
+
+    def percentile(self, key: Tuple, pct: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class HedgeBudget:
+    """Every primary request earns `ratio` hedge credit (capped at a small burst); a hedge costs one.
+
+    During an incident every call is slow, but the budget still only allows `ratio` extra load.
+    """
+
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self._credit = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def earn(self):
+        with self._lock:
+            self.requests += 1
+            self._credit = min(BUDGET_BURST, self._credit + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            self.hedges += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+
+_TRACKER = LatencyTracker()
+_BUDGET: Optional[HedgeBudget] = None
+_BUDGET_LOCK = threading.Lock()
+
+
+def _reset_after_fork():
+    global _TRACKER, _BUDGET, _BUDGET_LOCK
+    _TRACKER, _BUDGET, _BUDGET_LOCK = LatencyTracker(), None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hedging_settings(cfg) -> Optional[Dict[str, float]]:
+    if str(cfg("hedging", "enabled", "")).lower() not in ("1", "true", "on", "yes"):
+        return None
+    return {
+        "percentile": float(cfg("hedging", "percentile", 95)),
+        "budget": float(cfg("hedging", "budget", 0.05)),
+        "min_samples": int(cfg("hedging", "min_samples", 20)),
+        "min_delay": float(cfg("hedging", "min_delay", 5)),
+    }
+
+
+def _budget(ratio: float) -> HedgeBudget:
+    global _BUDGET
+    with _BUDGET_LOCK:
+        if _BUDGET is None or _BUDGET.ratio != ratio:
+            _BUDGET = HedgeBudget(ratio)
+        return _BUDGET
+
+
+def hedge_plan(cfg, svc: str, key: Tuple) -> Optional[Tuple[float, str]]:
+    """(seconds to wait before hedging, provider that receives the hedge), or None to send the call plainly"""
+    settings = hedging_settings(cfg)
+    if settings is None:
+        return None
+    _budget(settings["budget"]).earn()
+    delay = _TRACKER.percentile(key, settings["percentile"], settings["min_samples"])
+    if delay is None:
+        return None
+    return max(settings["min_delay"], delay), cfg(svc, "hedge_to", None) or svc
+
+
+def record_latency(key: Tuple, seconds: float):
+    _TRACKER.record(key, seconds)
+
+
+def _timed(key: Tuple, fn: Callable[[], Any]) -> Any:
+    start = time.time()
+    result = fn()
+    record_latency(key, time.time() - start)
+    return result
+
+
+def _in_thread(fn: Callable[[], Any]) -> concurrent.futures.Future:
+    # A plain daemon thread per call: an abandoned loser must never hold a pool slot a later call needs
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def call_hedged(cfg, svc: str, key: Tuple, primary: Callable[[], Any], hedge: Callable[[str], Any]) -> Any:
+    """Blocking hedged call. The losing request cannot be interrupted; it finishes in the background and is dropped."""
+    plan = hedge_plan(cfg, svc, key)
+    if plan is None:
+        return _timed(key, primary)
+    delay, hedge_svc = plan
+
+    first = _in_thread(lambda: _timed(key, primary))
+    done, _ = concurrent.futures.wait([first], timeout=delay)
+    budget = _BUDGET
+    if done or budget is None or not budget.try_spend():
+        return first.result()
+
+    print(f"🪁 {svc} 请求超过 {delay:.1f}s 未返回，向 {hedge_svc} 发送对冲请求")
+    second = _in_thread(lambda: _timed(key, lambda: hedge(hedge_svc)))
+    last_error = None
+    for future in concurrent.futures.as_completed([first, second]):
+        try:
+            result = future.result()
+        except Exception as e:
+            last_error = e
+            continue
+        if future is second:
+            budget.won()
+        return result
+    raise last_error
+
+
+async def acall_hedged(cfg, svc: str, key: Tuple, primary: Callable, hedge: Callable) -> Any:
+    """Async hedged call; the losing request is cancelled"""
+
+    async def timed(coro_fn):
+        start = time.time()
+        result = await coro_fn()
+        record_latency(key, time.time() - start)
+        return result
+
+    plan = hedge_plan(cfg, svc, key)
+    if plan is None:
+        return await timed(primary)
+    delay, hedge_svc = plan
+
+    first = asyncio.ensure_future(timed(primary))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    budget = _BUDGET
+    if done or budget is None or not budget.try_spend():
+        return await first
+
+    print(f"🪁 {svc} 请求超过 {delay:.1f}s 未返回，向 {hedge_svc} 发送对冲请求")
+    second = asyncio.ensure_future(timed(lambda: hedge(hedge_svc)))
+    pending, last_error = {first, second}, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                if task is second:
+                    budget.won()
+                return task.result()
+            last_error = task.exception()
+    raise last_error
+
+
+def hedge_stats() -> Dict[str, Any]:
+    budget = _BUDGET
+    if budget is None:
+        return {"requests": 0, "hedges": 0, "hedge_wins": 0}
+    return {"requests": budget.requests, "hedges": budget.hedges, "hedge_wins": budget.hedge_wins}
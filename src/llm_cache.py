@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from contextlib import contextmanager
+import contextvars
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+DEFAULT_LLM_CACHE_PATH = Path(__file__).resolve().parent / "CASES" / "llm_cache.sqlite"
+MODES = ("off", "readwrite", "replay")
+EVICT_EVERY = 50  # puts between size checks
+
+# Outcome of the last cache lookup in the current thread / asyncio task, read by the *_token functions
+_LAST_OUTCOME = contextvars.ContextVar("llm_cache_outcome", default=None)
+
+
+class LLMCacheMiss(Exception):
+    """Raised in replay mode when a request has no recorded response"""
+
+
+def cache_key(svc: str, create_kwargs: Dict[str, Any]) -> str:
+    """Hash of provider, model, max_tokens, the full messages (inline media included) and remaining options"""
+    material = {k: v for k, v in create_kwargs.items() if k not in ("extra_headers", "timeout")}
+    material["svc"] = svc
+    blob = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite store of chat completions shared by all processes of a run.
+
+    readwrite: hits are served from the store, misses call the API and are recorded.
+    replay:    read-only; a miss raises LLMCacheMiss so regression runs never hit the network.
+    """
+
+    def __init__(self, path=None, mode: str = "readwrite", ttl_days: float = 30, max_size_mb: int = 1000):
+        if mode not in MODES:
+            raise ValueError(f"unknown llm cache mode: {mode}")
+        self.path = Path(path) if path else DEFAULT_LLM_CACHE_PATH
+        self.mode = mode
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self._puts = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, svc TEXT, model TEXT, created REAL, last_used REAL, size INTEGER, body TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """A connection per operation (safe across threads, forked workers and concurrent processes):
+        committed when the block succeeds, rolled back otherwise, always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            created, body = row
+            if self.ttl and time.time() - created > self.ttl:
+                if self.mode != "replay":
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            if self.mode != "replay":
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return body
+
+    def put(self, key: str, svc: str, model: str, body: str):
+        if self.mode == "replay":
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, svc, model, now, now, len(body.encode("utf-8")), body),
+            )
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Drop expired entries, then least recently used ones until the store fits; returns entries removed"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with self._connect() as conn:
+            if self.ttl:
+                removed += conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > limit:
+                # Evict down to 90% so the next few puts do not trigger another pass
+                freed = 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                    if total - freed <= limit * 0.9 and limit > 0:
+                        break
+                    victims.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+        return removed
+
+    def lookup(self, svc: str, create_kwargs: Dict[str, Any]):
+        """(key, cached completion json or None); raises LLMCacheMiss on a replay miss"""
+        key = cache_key(svc, create_kwargs)
+        return key, self.record(svc, create_kwargs, key, self.get(key))
+
+    def record(self, svc: str, create_kwargs: Dict[str, Any], key: str, body: Optional[str]) -> Optional[str]:
+        """Note the lookup outcome for the caller's usage counters; must run in the caller's thread / task"""
+        _LAST_OUTCOME.set("hit" if body is not None else "miss")
+        if body is None and self.mode == "replay":
+            raise LLMCacheMiss(f"no recorded response for {svc}/{create_kwargs.get('model')} ({key[:12]})")
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT svc, model, COUNT(*), SUM(size) FROM responses GROUP BY svc, model").fetchall()
+        return {
+            "path": str(self.path),
+            "mode": self.mode,
+            "entries": sum(r[2] for r in rows),
+            "size_mb": round(sum(r[3] or 0 for r in rows) / 1024 / 1024, 1),
+            "by_model": {f"{svc}/{model}": count for svc, model, count, _ in rows},
+        }
+
+
+_CACHES: Dict[Any, LLMCache] = {}
+
+
+def get_llm_cache(cfg) -> Optional[LLMCache]:
+    """Cache configured by the "llm_cache" api_config section or LLM_CACHE_* env vars; None when off"""
+    mode = cfg("llm_cache", "mode", "off") or "off"
+    if mode == "off":
+        return None
+    path = cfg("llm_cache", "path", None) or str(DEFAULT_LLM_CACHE_PATH)
+    ttl_days = float(cfg("llm_cache", "ttl_days", 30))
+    max_size_mb = int(cfg("llm_cache", "max_size_mb", 1000))
+    key = (mode, path, ttl_days, max_size_mb, os.getpid())
+    if key not in _CACHES:
+        _CACHES[key] = LLMCache(path, mode, ttl_days, max_size_mb)
+    return _CACHES[key]
+
+
+def cache_counters() -> Dict[str, int]:
+    """Hit / miss counters of the last lookup, merged into a *_token function's usage dict"""
+    outcome = _LAST_OUTCOME.get()
+    _LAST_OUTCOME.set(None)
+    if outcome is None:
+        return {}
+    return {"cache_hits": int(outcome == "hit"), "cache_misses": int(outcome == "miss")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or trim the persistent LLM response cache.")
+    parser.add_argument("--path", type=str, default=str(DEFAULT_LLM_CACHE_PATH))
+    parser.add_argument("--max_size_mb", type=int, default=1000)
+    parser.add_argument("--ttl_days", type=float, default=30)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("evict")
+    sub.add_parser("clear")
+    args = parser.parse_args()
+
+    cache = LLMCache(args.path, "readwrite", args.ttl_days, args.max_size_mb)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "evict":
+        print(f"已清理 {cache.evict()} 条缓存响应")
+    else:
+        print(f"已清空 {cache.evict(max_bytes=0)} 条缓存响应")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""Static checks of generated scene code against an introspected index of the installed Manim CE.
+
+The index (exported names, class attributes, constructor keywords) is built once per manim
+version in a subprocess and stored as JSON; validation is a pure AST pass that reports the
+NameError / AttributeError / TypeError failures a render would hit, worded like Python's own
+messages so the error analyzer and the rule-based fixer treat them the same way.
+"""
+import re
+import ast
+import sys
+import json
+import inspect
+import argparse
+import builtins
+import subprocess
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from render_slots import exclusive_lock
+
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parent / "CASES" / "manim_api_index"
+MAX_REPORTED_ISSUES = 5
+SELF_ATTR = re.compile(r"self\.(\w+)\s*(?::[^=\n]+)?=(?!=)")
+
+_LOADED: Dict[str, Dict[str, Any]] = {}
+
+
+def installed_manim_version() -> Optional[str]:
+    try:
+        return metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def index_path_for(version: str, index_dir=None) -> Path:
+    return Path(index_dir or DEFAULT_INDEX_DIR) / f"manim-{version}.json"
+
+
+def _type_key(cls) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _instance_attrs(cls) -> Set[str]:
+    """Attributes a class sets on self; dir() only sees class-level ones"""
+    try:
+        return set(SELF_ATTR.findall(inspect.getsource(cls)))
+    except (OSError, TypeError):
+        return set()
+
+
+def _params(fn) -> Tuple[Set[str], bool]:
+    """(keyword-passable parameter names, accepts **kwargs)"""
+    sig = inspect.signature(fn)
+    names = {
+        p.name
+        for p in sig.parameters.values()
+        if p.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+    }
+    return names - {"self", "cls"}, any(p.kind == inspect.Parameter.VAR_KEYWORD for p in sig.parameters.values())
+
+
+def _returns_self(fn) -> bool:
+    # manim annotates fluent methods (shift, scale, to_edge, ...) with `-> Self`
+    return inspect.isfunction(fn) and str(fn.__annotations__.get("return", "")).split(".")[-1] == "Self"
+
+
+def _init_params(cls) -> Tuple[List[str], bool]:
+    """Constructor keywords along the MRO: **kwargs is followed up to the first __init__ that closes it"""
+    params: Set[str] = set()
+    for klass in cls.__mro__:
+        init = klass.__dict__.get("__init__")
+        if init is None:
+            continue
+        if klass is object:
+            return sorted(params), False
+        try:
+            names, var_kwargs = _params(init)
+        except (TypeError, ValueError):
+            return sorted(params), True
+        params |= names
+        if not var_kwargs:
+            return sorted(params), False
+    return sorted(params), True
+
+
+def build_index() -> Dict[str, Any]:
+    """Introspect the importable manim; run in a throwaway process, importing manim is slow and global"""
+    import manim
+
+    names = getattr(manim, "__all__", None) or [n for n in dir(manim) if not n.startswith("_")]
+    classes, functions, types = {}, {}, {}
+    for name in names:
+        obj = getattr(manim, name, None)
+        if inspect.isclass(obj):
+            params, var_kwargs = _init_params(obj)
+            classes[name] = {"type": _type_key(obj), "init_params": params, "init_var_kwargs": var_kwargs}
+            for klass in obj.__mro__:
+                key = _type_key(klass)
+                if key in types:
+                    continue
+                own = {n for n in klass.__dict__ if not n.startswith("__") or n == "__getattr__"}
+                types[key] = {
+                    "mro": [_type_key(k) for k in klass.__mro__],
+                    "attrs": sorted(own | _instance_attrs(klass)),
+                    "returns_self": sorted(n for n, v in klass.__dict__.items() if _returns_self(v)),
+                }
+        elif inspect.isfunction(obj) or inspect.isbuiltin(obj):
+            try:
+                params, var_kwargs = _params(obj)
+            except (TypeError, ValueError):
+                continue
+            functions[name] = {"params": sorted(params), "var_kwargs": var_kwargs}
+    return {
+        "manim_version": installed_manim_version(),
+        "python": sys.version.split()[0],
+        "names": sorted(names),
+        "classes": classes,
+        "functions": functions,
+        "types": types,
+    }
+
+
+def load_index(index_dir=None, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Index of the installed manim, built on first use; None when manim is missing or cannot be introspected"""
+    version = version or installed_manim_version()
+    if version is None:
+        return None
+    if version in _LOADED:
+        return _LOADED[version]
+    path = index_path_for(version, index_dir)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent workers on a fresh install would all introspect manim; one builds, the rest wait
+        with exclusive_lock(path.with_suffix(".lock")):
+            if not path.exists():
+                print(f"🔍 正在为 manim {version} 生成 API 索引...")
+                result = subprocess.run(
+                    [sys.executable, __file__, "--index_dir", str(path.parent), "build"], capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    print(f"⚠️ 生成 manim API 索引失败，跳过静态检查: {result.stderr.strip()[-300:]}")
+                    return None
+    with open(path, "r", encoding="utf-8") as f:
+        _LOADED[version] = json.load(f)
+    return _LOADED[version]
+
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """Every name the module binds anywhere; scopes are not told apart, so a name is never flagged wrongly"""
+    bound = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != "*":
+                    bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+    return bound
+
+
+class ManimAPIValidator:
+    """Undefined names, unknown attributes on variables holding a known mobject type, invalid constructor keywords"""
+
+    def __init__(self, index: Dict[str, Any]):
+        self.index = index
+        self.names = set(index["names"])
+        self._cache: Dict[Tuple[str, str], Set[str]] = {}
+
+    def _inherited(self, type_key: str, field: str) -> Set[str]:
+        """Union of an index field ("attrs", "returns_self") over the type's MRO"""
+        if (type_key, field) not in self._cache:
+            values = set()
+            for key in self.index["types"].get(type_key, {}).get("mro", [type_key]):
+                values.update(self.index["types"].get(key, {}).get(field, ()))
+            self._cache[(type_key, field)] = values
+        return self._cache[(type_key, field)]
+
+    def _constructed_class(self, node: ast.AST, classes) -> Optional[str]:
+        """Class built by `Circle(...)` or a fluent chain on it like `Circle(...).scale(2).to_edge(UP)`"""
+        if not isinstance(node, ast.Call):
+            return None
+        if isinstance(node.func, ast.Name):
+            return node.func.id if node.func.id in classes else None
+        if isinstance(node.func, ast.Attribute):
+            inner = self._constructed_class(node.func.value, classes)
+            if inner and node.func.attr in self._inherited(classes[inner]["type"], "returns_self"):
+                return inner
+        return None
+
+    def validate(self, code: str) -> List[str]:
+        """Python-style error lines ("line N: NameError: ..."); empty when nothing was found"""
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return []  # compile() reports these
+        issues = []
+        manim_names, star_from_other = set(), False
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+                if (node.module or "").split(".")[0] == "manim":
+                    manim_names = self.names
+                else:
+                    star_from_other = True
+        bound = _bound_names(tree)
+        known = bound | manim_names | set(dir(builtins)) | {"__file__", "__name__"}
+
+        if not star_from_other:
+            seen = set()
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in known and node.id not in seen:
+                    seen.add(node.id)
+                    issues.append((node.lineno, f"NameError: name '{node.id}' is not defined"))
+
+        # Manim names the scene did not shadow with its own definitions
+        classes = {n: c for n, c in self.index["classes"].items() if n in manim_names and n not in bound}
+        functions = {n: f for n, f in self.index["functions"].items() if n in manim_names and n not in bound}
+        issues += self._check_calls(tree, classes, functions)
+        issues += self._check_attributes(tree, classes)
+        return [f"line {line}: {msg}" for line, msg in sorted(set(issues))]
+
+    def _check_calls(self, tree, classes, functions) -> List[Tuple[int, str]]:
+        issues = []
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)):
+                continue
+            name = node.func.id
+            if name in classes:
+                params, open_kwargs, label = classes[name]["init_params"], classes[name]["init_var_kwargs"], f"{name}.__init__()"
+            elif name in functions:
+                params, open_kwargs, label = functions[name]["params"], functions[name]["var_kwargs"], f"{name}()"
+            else:
+                continue
+            if open_kwargs:
+                continue
+            for kw in node.keywords:
+                if kw.arg is not None and kw.arg not in params:
+                    issues.append((node.lineno, f"TypeError: {label} got an unexpected keyword argument '{kw.arg}'"))
+        return issues
+
+    def _check_attributes(self, tree, classes) -> List[Tuple[int, str]]:
+        # Only names stored exactly once, by a constructor call, have a known type
+        stores: Dict[str, int] = {}
+        typed: Dict[str, str] = {}
+        assigned_attrs = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                stores[node.id] = stores.get(node.id, 0) + 1
+            elif isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store) and isinstance(node.value, ast.Name):
+                assigned_attrs.add((node.value.id, node.attr))
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                cls = self._constructed_class(node.value, classes)
+                if cls:
+                    typed[node.targets[0].id] = cls
+
+        issues = []
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name)):
+                continue
+            var, attr = node.value.id, node.attr
+            if var not in typed or stores.get(var) != 1 or (var, attr) in assigned_attrs or attr.startswith("__"):
+                continue
+            attrs = self._inherited(classes[typed[var]]["type"], "attrs")
+            if attr in attrs:
+                continue
+            if "__getattr__" in attrs and attr.startswith(("get_", "set_")):
+                continue  # Mobject generates get_x / set_x accessors on the fly
+            issues.append((node.lineno, f"AttributeError: '{typed[var]}' object has no attribute '{attr}'"))
+        return issues
+
+
+_VALIDATORS: Dict[Any, Optional[ManimAPIValidator]] = {}
+
+
+def get_api_validator(index_dir=None) -> Optional[ManimAPIValidator]:
+    """Process-wide validator for the installed manim, or None when no index is available"""
+    key = str(index_dir or DEFAULT_INDEX_DIR)
+    if key not in _VALIDATORS:
+        index = load_index(index_dir)
+        _VALIDATORS[key] = ManimAPIValidator(index) if index else None
+    return _VALIDATORS[key]
+
+
+def format_issues(issues: List[str]) -> str:
+    shown = issues[:MAX_REPORTED_ISSUES]
+    more = len(issues) - len(shown)
+    return "\n".join(shown + ([f"... and {more} more"] if more > 0 else []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the manim API index or statically check scene files against it.")
+    parser.add_argument("--index_dir", type=str, default=str(DEFAULT_INDEX_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="introspect the installed manim and write its index")
+    check_parser = sub.add_parser("check")
+    check_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index()
+        path = index_path_for(index["manim_version"], args.index_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        tmp.replace(path)
+        print(f"已写入 {path}: {len(index['classes'])} 个类, {len(index['functions'])} 个函数")
+        return 0
+
+    validator = get_api_validator(args.index_dir)
+    if validator is None:
+        print("未安装 manim 或无法生成 API 索引")
+        return 1
+    failed = 0
+    for file in args.files:
+        issues = validator.validate(Path(file).read_text(encoding="utf-8"))
+        failed += bool(issues)
+        print(f"{file}: {'OK' if not issues else ''}")
+        for issue in issues:
+            print(f"  {issue}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
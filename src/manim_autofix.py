@@ -0,0 +1,342 @@
+"""Deterministic rewrites for mechanical Manim errors, tried before any LLM fix call.
+
+Rules are keyed on the error type from ManimCodeErrorAnalyzer; adding one is a decorated function:
+
+    @autofix_rule("my_rule", "AttributeError")
+    def _my_rule(code, error_info, error_msg):
+        return rewritten_code or None  # None: rule does not apply
+"""
+import io
+import os
+import re
+import ast
+import sys
+import json
+import uuid
+import argparse
+import tempfile
+import tokenize
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+from render_slots import exclusive_lock
+from scope_refine import ManimCodeErrorAnalyzer
+
+
+DEFAULT_STATS_FILE = Path(tempfile.gettempdir()) / "code2video_autofix_stats.json"
+
+# ManimGL / pre-CE names that Manim CE v0.19 no longer exports
+DEPRECATED_NAMES = {
+    "ShowCreation": "Create",
+    "TextMobject": "Text",
+    "TexMobject": "MathTex",
+    "TexText": "Tex",
+    "OldTex": "Tex",
+    "OldTexText": "Tex",
+}
+
+# Code(...) keywords renamed in v0.19, and the ones that moved into paragraph_config / background_config
+CODE_KWARG_RENAMES = {
+    "code": "code_string",
+    "file_name": "code_file",
+    "style": "formatter_style",
+    "insert_line_no": "add_line_numbers",
+    "line_no_from": "line_numbers_from",
+    "indentation_chars": None,
+    "warn_missing_font": None,
+    "generate_html_file": None,
+}
+CODE_PARAGRAPH_KWARGS = {"font": "font", "font_size": "font_size", "line_spacing": "line_spacing"}
+CODE_BACKGROUND_KWARGS = {
+    "background_stroke_width": "stroke_width",
+    "background_stroke_color": "stroke_color",
+    "corner_radius": "corner_radius",
+    "margin": "buff",
+}
+
+# Undefined names that only need an import line
+KNOWN_IMPORTS = {
+    "np": "import numpy as np",
+    "numpy": "import numpy",
+    "math": "import math",
+    "random": "import random",
+    "itertools": "import itertools",
+    "Path": "from pathlib import Path",
+}
+
+
+@dataclass(frozen=True)
+class AutofixRule:
+    name: str
+    error_types: Tuple[str, ...]
+    apply: Callable[[str, Dict[str, Any], str], Optional[str]]
+
+
+RULES: List[AutofixRule] = []
+
+
+def autofix_rule(name: str, *error_types: str):
+    """Register a rewrite for the given analyzer error types; rules run in registration order"""
+
+    def register(fn):
+        RULES.append(AutofixRule(name, tuple(error_types), fn))
+        return fn
+
+    return register
+
+
+def _char_offset(lines: List[str], lineno: int, col: int) -> int:
+    # ast columns are UTF-8 byte offsets; Chinese narration makes them differ from str indices
+    line = lines[lineno - 1]
+    return sum(len(l) for l in lines[: lineno - 1]) + len(line.encode("utf-8")[:col].decode("utf-8", errors="ignore"))
+
+
+def _splice(code: str, edits: List[Tuple[int, int, int, int, str]]) -> str:
+    """Apply (lineno, col, end_lineno, end_col, text) replacements given in ast coordinates"""
+    lines = io.StringIO(code).readlines()
+    spans = [(_char_offset(lines, l, c), _char_offset(lines, el, ec), text) for l, c, el, ec, text in edits]
+    for start, end, text in sorted(spans, reverse=True):
+        code = code[:start] + text + code[end:]
+    return code
+
+
+def _rename_names(code: str, mapping: Dict[str, str]) -> Optional[str]:
+    """Rename identifier tokens only, leaving strings, comments and formatting untouched"""
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    lines = io.StringIO(code).readlines()
+    spans = []
+    for tok in tokens:
+        if tok.type == tokenize.NAME and tok.string in mapping:
+            (row, col), (_, end_col) = tok.start, tok.end
+            start = sum(len(l) for l in lines[: row - 1]) + col
+            spans.append((start, start + end_col - col, mapping[tok.string]))
+    for start, end, text in reversed(spans):
+        code = code[:start] + text + code[end:]
+    return code if spans else None
+
+
+def _is_code_call(node: ast.AST) -> bool:
+    return isinstance(node, ast.Call) and (
+        (isinstance(node.func, ast.Name) and node.func.id == "Code")
+        or (isinstance(node.func, ast.Attribute) and node.func.attr == "Code")
+    )
+
+
+def _builds_code(node: ast.AST) -> bool:
+    """`Code(...)` or a chain on it such as `Code(...).scale(0.8).to_edge(LEFT)`"""
+    while isinstance(node, ast.Call):
+        if _is_code_call(node):
+            return True
+        if not isinstance(node.func, ast.Attribute):
+            return False
+        node = node.func.value
+    return False
+
+
+def _config_dict(existing: Optional[ast.expr], items: Dict[str, ast.expr]) -> ast.expr:
+    keys = [ast.Constant(k) for k in items]
+    values = list(items.values())
+    if existing is None:
+        return ast.Dict(keys=keys, values=values)
+    if isinstance(existing, ast.Dict):
+        return ast.Dict(keys=existing.keys + keys, values=existing.values + values)
+    return ast.Dict(keys=[None] + keys, values=[existing] + values)
+
+
+@autofix_rule("deprecated_names", "NameError", "ImportError")
+def _deprecated_names(code: str, error_info: Dict[str, Any], error_msg: str) -> Optional[str]:
+    if not any(re.search(rf"\b{old}\b", error_msg) for old in DEPRECATED_NAMES):
+        return None
+    # Rewrite every deprecated name at once, not only the one the traceback stopped at
+    return _rename_names(code, DEPRECATED_NAMES)
+
+
+@autofix_rule("code_kwargs_v019", "TypeError")
+def _code_kwargs(code: str, error_info: Dict[str, Any], error_msg: str) -> Optional[str]:
+    match = re.search(r"unexpected keyword argument '(\w+)'", error_msg)
+    moved = {**CODE_KWARG_RENAMES, **CODE_PARAGRAPH_KWARGS, **CODE_BACKGROUND_KWARGS}
+    if not match or match.group(1) not in moved:
+        return None
+    tree = ast.parse(code)
+    edits = []
+    for node in ast.walk(tree):
+        if not _is_code_call(node):
+            continue
+        if not any(kw.arg in moved for kw in node.keywords):
+            continue
+        keywords, paragraph, background = [], {}, {}
+        for kw in node.keywords:
+            if kw.arg in CODE_PARAGRAPH_KWARGS:
+                paragraph[CODE_PARAGRAPH_KWARGS[kw.arg]] = kw.value
+            elif kw.arg in CODE_BACKGROUND_KWARGS:
+                background[CODE_BACKGROUND_KWARGS[kw.arg]] = kw.value
+            elif kw.arg in CODE_KWARG_RENAMES:
+                if CODE_KWARG_RENAMES[kw.arg] is not None:
+                    keywords.append(ast.keyword(arg=CODE_KWARG_RENAMES[kw.arg], value=kw.value))
+            else:
+                keywords.append(kw)
+        for arg, extra in (("paragraph_config", paragraph), ("background_config", background)):
+            if extra:
+                current = next((kw for kw in keywords if kw.arg == arg), None)
+                merged = ast.keyword(arg=arg, value=_config_dict(current.value if current else None, extra))
+                keywords = [kw for kw in keywords if kw is not current] + [merged]
+        new_call = ast.Call(func=node.func, args=node.args, keywords=keywords)
+        edits.append((node.lineno, node.col_offset, node.end_lineno, node.end_col_offset, ast.unparse(new_call)))
+    return _splice(code, edits) if edits else None
+
+
+@autofix_rule("code_lines_index", "AttributeError")
+def _code_lines_index(code: str, error_info: Dict[str, Any], error_msg: str) -> Optional[str]:
+    if error_info.get("object_type") != "Code" or error_info.get("attribute_name") != "code":
+        return None
+    tree = ast.parse(code)
+    code_vars = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and _builds_code(node.value):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    code_vars.add(target.id)
+                elif isinstance(target, ast.Attribute):
+                    code_vars.add(ast.unparse(target))
+    edits = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr == "code" and ast.unparse(node.value) in code_vars:
+            # The attribute name is the last thing in the node's span
+            edits.append((node.end_lineno, node.end_col_offset - len("code"), node.end_lineno, node.end_col_offset, "code_lines"))
+    return _splice(code, edits) if edits else None
+
+
+@autofix_rule("missing_import", "NameError")
+def _missing_import(code: str, error_info: Dict[str, Any], error_msg: str) -> Optional[str]:
+    name = error_info.get("undefined_variable")
+    if name is None:
+        match = re.search(r"name '(\w+)' is not defined", error_msg)
+        name = match.group(1) if match else None
+    if name is None or name in DEPRECATED_NAMES:
+        return None
+    if name in KNOWN_IMPORTS:
+        line = KNOWN_IMPORTS[name]
+    elif not re.search(r"^\s*from manim import \*", code, re.MULTILINE) and name[:1].isupper():
+        # A Manim class used without the star import
+        line = "from manim import *"
+    else:
+        return None
+    if re.search(rf"^\s*{re.escape(line)}\s*$", code, re.MULTILINE):
+        return None
+    lines = code.split("\n")
+    insert_at = 0
+    while insert_at < len(lines) and lines[insert_at].startswith(("#!", "# -*-", "from __future__")):
+        insert_at += 1
+    return "\n".join(lines[:insert_at] + [line] + lines[insert_at:])
+
+
+def _error_line(error_msg: str) -> str:
+    lines = [line.strip() for line in (error_msg or "").splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+
+class ManimAutoFixer:
+    """Runs the registered rules for a classified error and keeps per-rule outcome stats.
+
+    A rule counts as resolving an error when the next render no longer fails with the same
+    error line. Stats are shared by all processes on the host through a locked JSON file.
+    """
+
+    def __init__(self, analyzer: Optional[ManimCodeErrorAnalyzer] = None, stats_file=None):
+        self.analyzer = analyzer or ManimCodeErrorAnalyzer()
+        self.stats_file = Path(stats_file) if stats_file else DEFAULT_STATS_FILE
+        self.lock_file = self.stats_file.with_suffix(".lock")
+
+    def fix(self, code: str, error_msg: str) -> Tuple[Optional[str], List[str]]:
+        """(rewritten code, names of the rules applied), or (None, []) if no rule produced compilable code"""
+        error_info = self.analyzer.analyze_error(code, error_msg)
+        applied = []
+        for rule in RULES:
+            if error_info.get("error_type") not in rule.error_types:
+                continue
+            try:
+                fixed = rule.apply(code, error_info, error_msg)
+            except (SyntaxError, ValueError):
+                continue
+            if fixed is None or fixed == code:
+                continue
+            try:
+                compile(fixed, "<autofix>", "exec")
+            except SyntaxError:
+                continue
+            code = fixed
+            applied.append(rule.name)
+        if applied:
+            self._update(applied, "applied")
+        return (code, applied) if applied else (None, [])
+
+    def record_outcome(self, applied: List[str], old_error: str, new_error: Optional[str]):
+        """Report the render after an autofix; new_error is None when it succeeded"""
+        if applied and (new_error is None or _error_line(new_error) != _error_line(old_error)):
+            self._update(applied, "resolved")
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _update(self, rules: List[str], field: str):
+        try:
+            with exclusive_lock(self.lock_file):
+                stats = self._load()
+                for name in rules:
+                    entry = stats.setdefault(name, {"applied": 0, "resolved": 0})
+                    entry[field] += 1
+                tmp = self.stats_file.with_name(f".{self.stats_file.name}.{uuid.uuid4().hex}.tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(stats, f, ensure_ascii=False)
+                os.replace(tmp, self.stats_file)
+        except OSError as e:
+            print(f"⚠️ 无法更新自动修复统计: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with exclusive_lock(self.lock_file):
+            stats = self._load()
+        return {
+            "stats_file": str(self.stats_file),
+            "rules": {rule.name: stats.get(rule.name, {"applied": 0, "resolved": 0}) for rule in RULES},
+            "llm_calls_saved": sum(entry["resolved"] for entry in stats.values()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply rule-based Manim fixes or show how often they resolved errors.")
+    parser.add_argument("--stats_file", type=str, default=str(DEFAULT_STATS_FILE))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("reset")
+    fix_parser = sub.add_parser("fix", help="rewrite a scene file in place for the given error message")
+    fix_parser.add_argument("code_file")
+    fix_parser.add_argument("error_msg")
+    args = parser.parse_args()
+
+    fixer = ManimAutoFixer(stats_file=args.stats_file)
+    if args.command == "stats":
+        print(json.dumps(fixer.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "reset":
+        Path(args.stats_file).unlink(missing_ok=True)
+        print("已重置自动修复统计")
+    else:
+        code = Path(args.code_file).read_text(encoding="utf-8")
+        fixed, applied = fixer.fix(code, args.error_msg)
+        if fixed is None:
+            print("没有适用的修复规则")
+            return 1
+        Path(args.code_file).write_text(fixed, encoding="utf-8")
+        print(f"已应用规则: {', '.join(applied)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
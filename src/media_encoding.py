@@ -0,0 +1,114 @@
+import os
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+CHUNK_BYTES = 3 * 1024 * 1024  # multiple of 3, so chunk encodings concatenate without padding in between
+DEFAULT_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", 512))
+PIN_MAX_BYTES = 8 * 1024 * 1024  # small reference images (GRID.png) stay encoded for the whole process
+
+
+def _encode_file(path: str, mime: str) -> str:
+    """Data URL of a file, base64-encoded chunk by chunk so the raw bytes are never held in full"""
+    parts = [f"data:{mime};base64,"]
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+    return "".join(parts)
+
+
+class EncodedMediaCache:
+    """Per-process LRU of base64 data URLs keyed by (path, mtime, size, mime).
+
+    Feedback rounds and evaluation questions re-send the same video and GRID.png many times;
+    each distinct file version is read and encoded once. Re-rendering a video changes its
+    mtime / size, so stale encodings are never served.
+    """
+
+    def __init__(self, max_mb: int = DEFAULT_MAX_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self._entries: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._pinned: Dict[Tuple, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def data_url(self, path, mime: str) -> str:
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, mime)
+        with self._lock:
+            url = self._lookup(key)
+            if url is not None:
+                return url
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # One encoder per file version; concurrent callers wait for it instead of encoding again
+        with key_lock:
+            with self._lock:
+                url = self._lookup(key)
+                if url is not None:
+                    return url
+            url = _encode_file(path, mime)
+            with self._lock:
+                self.misses += 1
+                self._store(key, url, pin=st.st_size <= PIN_MAX_BYTES and mime.startswith("image/"))
+                self._key_locks.pop(key, None)
+            return url
+
+    def _lookup(self, key):
+        url = self._pinned.get(key)
+        if url is None and key in self._entries:
+            self._entries.move_to_end(key)
+            url = self._entries[key]
+        if url is not None:
+            self.hits += 1
+        return url
+
+    def _store(self, key, url: str, pin: bool):
+        if pin:
+            self._pinned[key] = url
+            return
+        if len(url) > self.max_bytes:
+            return  # larger than the whole budget: hand it out uncached
+        self._entries[key] = url
+        self._bytes += len(url)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries) + len(self._pinned),
+                "cached_mb": round((self._bytes + sum(len(u) for u in self._pinned.values())) / 1024 / 1024, 1),
+            }
+
+
+_CACHE = EncodedMediaCache()
+
+
+def _reset_after_fork():
+    global _CACHE
+    # A lock may have been held by another thread mid-fork; start the child with a fresh cache
+    _CACHE = EncodedMediaCache(_CACHE.max_bytes // (1024 * 1024))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def encoded_data_url(path, mime: str) -> str:
+    """Memoized `data:<mime>;base64,...` URL for a media file"""
+    return _CACHE.data_url(path, mime)
+
+
+def media_cache_stats() -> Dict[str, Any]:
+    return _CACHE.stats()
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import uuid
+import tempfile
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+import psutil
+
+from render_slots import exclusive_lock
+
+
+DEFAULT_STATE_FILE = Path(tempfile.gettempdir()) / "code2video_render_memory.json"
+DEFAULT_PEAK_MB = 1024  # prediction for a scene that has never been rendered
+PEAK_DECAY = 0.9  # learned peaks fade slowly so one bloated attempt does not pin a scene forever
+MB = 1024 * 1024
+
+
+def _process_trees(pids) -> List[psutil.Process]:
+    """The given processes and all their descendants (ffmpeg, latex, ...)"""
+    procs = []
+    for pid in pids:
+        try:
+            proc = psutil.Process(pid)
+            procs += [proc, *proc.children(recursive=True)]
+        except psutil.Error:
+            continue
+    return procs
+
+
+def _total_rss(procs: List[psutil.Process]) -> int:
+    rss = 0
+    for proc in procs:
+        try:
+            rss += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return rss
+
+
+class _RssSampler(threading.Thread):
+    """Samples the RSS of the processes running one render, registered through track().
+
+    Only those processes (the manim subprocess, or the render worker while it serves this
+    render's job) are measured, and only they are killed when host memory drops below
+    `critical_mb`, so the render can be requeued instead of the kernel OOM-killing a random
+    process of the batch. Other renders of the same agent process are left alone.
+    """
+
+    def __init__(self, critical_mb: float, interval: float = 0.2, on_pids_changed=None):
+        super().__init__(daemon=True)
+        self.critical_mb = critical_mb
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.killed_for_pressure = False
+        self.waited = 0.0
+        self._pids: Dict[int, int] = {}  # pid -> number of jobs of this render it is running
+        self._pids_lock = threading.Lock()
+        self._on_pids_changed = on_pids_changed
+        self._stop_event = threading.Event()
+
+    @contextmanager
+    def track(self, pid: int):
+        """Count `pid` (and its children) towards this render while the block runs"""
+        with self._pids_lock:
+            self._pids[pid] = self._pids.get(pid, 0) + 1
+            pids = list(self._pids)
+        if self._on_pids_changed:
+            self._on_pids_changed(pids)
+        try:
+            yield
+        finally:
+            with self._pids_lock:
+                self._pids[pid] -= 1
+                if not self._pids[pid]:
+                    del self._pids[pid]
+                pids = list(self._pids)
+            if self._on_pids_changed:
+                self._on_pids_changed(pids)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._pids_lock:
+                procs = _process_trees(list(self._pids))
+            self.peak_mb = max(self.peak_mb, _total_rss(procs) / MB)
+
+            if procs and psutil.virtual_memory().available / MB < self.critical_mb:
+                self.killed_for_pressure = True
+                for proc in procs:
+                    try:
+                        proc.kill()
+                    except psutil.Error:
+                        pass
+                break
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2)
+
+
+class MemoryAdmission:
+    """Host-wide admission control for renders based on learned per-scene memory peaks.
+
+    A render is admitted only if its predicted peak fits into the available memory minus the
+    memory still promised to renders that are running but have not reached their peak yet.
+    State (learned peaks and live reservations) lives in one JSON file guarded by a file lock.
+    """
+
+    def __init__(self, reserve_mb: int = 1024, state_file=None, poll_interval: float = 1.0, max_wait: float = 900):
+        self.reserve_mb = reserve_mb
+        self.state_file = Path(state_file) if state_file else DEFAULT_STATE_FILE
+        self.lock_file = self.state_file.with_suffix(".lock")
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("peaks", {})
+        state.setdefault("reservations", {})
+        return state
+
+    def _save(self, state: Dict[str, Any]):
+        tmp = self.state_file.with_name(f".{self.state_file.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_file)
+
+    def predict_mb(self, key: str, state: Optional[Dict[str, Any]] = None) -> float:
+        state = state or self._load()
+        if key in state["peaks"]:
+            return state["peaks"][key]
+        # Unknown scene: assume it is as heavy as the heavier renders seen so far
+        peaks = sorted(state["peaks"].values())
+        return max(DEFAULT_PEAK_MB, peaks[int(len(peaks) * 0.9)]) if peaks else DEFAULT_PEAK_MB
+
+    def _outstanding_mb(self, reservations: Dict[str, Any]) -> float:
+        """Memory promised to live renders beyond what their processes already use"""
+        outstanding = 0.0
+        for token, res in list(reservations.items()):
+            if not psutil.pid_exists(res["pid"]):
+                reservations.pop(token)
+                continue
+            used = _total_rss(_process_trees(res.get("pids", [])))
+            outstanding += max(0.0, res["mb"] - used / MB)
+        return outstanding
+
+    def _try_admit(self, key: str) -> Optional[str]:
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            need = self.predict_mb(key, state)
+            free = psutil.virtual_memory().available / MB - self._outstanding_mb(state["reservations"]) - self.reserve_mb
+            # Always let a render through when nothing else holds a reservation, otherwise an
+            # over-predicted scene would wait forever
+            if need > free and state["reservations"]:
+                self._save(state)
+                return None
+            token = uuid.uuid4().hex
+            state["reservations"][token] = {"pid": os.getpid(), "key": key, "mb": need, "since": time.time()}
+            self._save(state)
+            return token
+
+    def _set_pids(self, token: str, pids: List[int]):
+        """Record which processes a live render runs in, so others can tell how far it is from its peak"""
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            if token in state["reservations"]:
+                state["reservations"][token]["pids"] = pids
+                self._save(state)
+
+    def _release(self, token: str, key: str, peak_mb: Optional[float]):
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            state["reservations"].pop(token, None)
+            if peak_mb:
+                state["peaks"][key] = round(max(peak_mb, state["peaks"].get(key, 0.0) * PEAK_DECAY), 1)
+            self._save(state)
+
+    @contextmanager
+    def admit(self, key: str):
+        """Wait until the render of `key` fits in memory; yields the sampler, whose track() registers its processes"""
+        start = time.time()
+        token = self._try_admit(key)
+        while token is None and time.time() - start < self.max_wait:
+            time.sleep(self.poll_interval)
+            token = self._try_admit(key)
+        if token is None:
+            print(f"⚠️ 等待内存超过 {self.max_wait:.0f}s，强制放行渲染 {key}")
+            token = uuid.uuid4().hex
+
+        sampler = _RssSampler(critical_mb=self.reserve_mb / 2, on_pids_changed=lambda pids: self._set_pids(token, pids))
+        sampler.waited = time.time() - start
+        sampler.start()
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            self._release(token, key, None if sampler.killed_for_pressure else sampler.peak_mb)
+
+    def stats(self) -> Dict[str, Any]:
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            outstanding = self._outstanding_mb(state["reservations"])
+        vm = psutil.virtual_memory()
+        peaks: List[float] = sorted(state["peaks"].values())
+        return {
+            "state_file": str(self.state_file),
+            "available_mb": round(vm.available / MB),
+            "live_reservations": len(state["reservations"]),
+            "outstanding_mb": round(outstanding),
+            "learned_scenes": len(peaks),
+            "median_peak_mb": peaks[len(peaks) // 2] if peaks else None,
+            "max_peak_mb": peaks[-1] if peaks else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show learned render memory peaks and live reservations.")
+    parser.add_argument("--state_file", type=str, default=str(DEFAULT_STATE_FILE))
+    args = parser.parse_args()
+    print(json.dumps(MemoryAdmission(state_file=args.state_file).stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
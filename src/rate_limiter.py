@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+from render_slots import exclusive_lock
+
+
+DEFAULT_STATE_FILE = Path(tempfile.gettempdir()) / "code2video_rate_limits.json"
+MEDIA_TOKENS = 1500  # rough prompt cost of one image / video part when it cannot be measured up front
+MAX_POLL = 2.0
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], media_tokens: int = MEDIA_TOKENS) -> int:
+    """Prompt tokens guessed from text length: ~4 ASCII chars or 1 CJK char per token, plus a flat cost per media part"""
+    tokens = 0
+
+    def text_tokens(text: str) -> int:
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        return ascii_chars // 4 + (len(text) - ascii_chars)
+
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += text_tokens(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += text_tokens(part.get("text", ""))
+            else:
+                tokens += media_tokens
+    return tokens + 4 * len(messages or [])
+
+
+class RateLimiter:
+    """Host-wide token buckets for requests-per-minute and tokens-per-minute.
+
+    Limits are configured per provider (the api_config section) and enforced per
+    "<provider>/<model>" bucket. Buckets live in one JSON file guarded by a file lock, so
+    every worker process on the host draws from the same quota. A call reserves its estimated
+    tokens (prompt + max_tokens) before it is sent and the bucket is corrected with the real usage
+    afterwards, so over-estimates are refunded and under-estimates become debt for the next caller.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], state_file=None):
+        # limits: provider -> (rpm, tpm); 0 disables that bucket
+        self.limits = limits
+        self.state_file = Path(state_file) if state_file else DEFAULT_STATE_FILE
+        self.lock_file = self.state_file.with_suffix(".lock")
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, state: Dict[str, Any]):
+        tmp = self.state_file.with_name(f".{self.state_file.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_file)
+
+    def _refill(self, svc: str, key: str, state: Dict[str, Any], now: float) -> Dict[str, float]:
+        rpm, tpm = self.limits[svc]
+        bucket = state.setdefault(key, {"requests": rpm, "tokens": tpm, "ts": now})
+        elapsed = max(0.0, now - bucket["ts"])
+        bucket["requests"] = min(rpm, bucket["requests"] + elapsed * rpm / 60)
+        bucket["tokens"] = min(tpm, bucket["tokens"] + elapsed * tpm / 60)
+        bucket["ts"] = now
+        return bucket
+
+    def try_acquire(self, svc: str, model: str, tokens: int) -> float:
+        """Take one request and `tokens` from the bucket; returns 0 on success, else the seconds to wait"""
+        if svc not in self.limits:
+            return 0.0
+        rpm, tpm = self.limits[svc]
+        # A single call bigger than the whole minute budget could never fit; let it run against a full bucket
+        tokens = min(tokens, tpm) if tpm else 0
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            bucket = self._refill(svc, f"{svc}/{model}", state, time.time())
+            wait = 0.0
+            if rpm and bucket["requests"] < 1:
+                wait = max(wait, (1 - bucket["requests"]) * 60 / rpm)
+            if tpm and bucket["tokens"] < tokens:
+                wait = max(wait, (tokens - bucket["tokens"]) * 60 / tpm)
+            if wait == 0.0:
+                if rpm:
+                    bucket["requests"] -= 1
+                if tpm:
+                    bucket["tokens"] -= tokens
+            self._save(state)
+        return wait
+
+    def acquire(self, svc: str, model: str, tokens: int) -> float:
+        """Block until the call fits into the quota; returns the seconds spent waiting"""
+        start = time.time()
+        wait = self.try_acquire(svc, model, tokens)
+        while wait > 0:
+            time.sleep(min(wait, MAX_POLL))
+            wait = self.try_acquire(svc, model, tokens)
+        return time.time() - start
+
+    def settle(self, svc: str, model: str, reserved: int, used: int):
+        """Correct the token bucket once the real usage of a call is known (a failed call refunds everything)"""
+        if svc not in self.limits or not self.limits[svc][1] or reserved == used:
+            return
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+            bucket = self._refill(svc, f"{svc}/{model}", state, time.time())
+            bucket["tokens"] = min(self.limits[svc][1], bucket["tokens"] + min(reserved, self.limits[svc][1]) - used)
+            self._save(state)
+
+    def stats(self) -> Dict[str, Any]:
+        with exclusive_lock(self.lock_file):
+            state = self._load()
+        now = time.time()
+        report = {}
+        for key, bucket in state.items():
+            svc = key.split("/", 1)[0]
+            if svc not in self.limits:
+                continue
+            rpm, tpm = self.limits[svc]
+            bucket = self._refill(svc, key, state, now)
+            report[key] = {"rpm": rpm, "tpm": tpm, "requests_left": round(bucket["requests"], 1), "tokens_left": round(bucket["tokens"])}
+        return report
+
+
+def main():
+    from gpt_request import RATE_LIMITER as limiter
+
+    parser = argparse.ArgumentParser(description="Show the host-wide LLM rate limit buckets.")
+    parser.parse_args()
+    if limiter is None:
+        print("未配置 rpm / tpm 限流")
+        return 0
+    print(json.dumps(limiter.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import re
+import ast
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "CASES" / "render_cache"
+ASSET_EXTENSIONS = (".png", ".jpg", ".jpeg", ".svg", ".gif", ".mp3", ".wav")
+
+
+def get_manim_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("manim")
+    except Exception:
+        return "unknown"
+
+
+def normalize_scene_source(code: str) -> str:
+    """Formatting- and comment-insensitive form of the scene source"""
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return "\n".join(line.rstrip() for line in code.strip().splitlines())
+
+
+def hash_referenced_assets(code: str, base_dir: Path) -> Dict[str, str]:
+    """sha256 of every asset file the scene refers to by a string literal"""
+    asset_hashes = {}
+    for literal in re.findall(r'["\']([^"\'\n]+)["\']', code):
+        if not literal.lower().endswith(ASSET_EXTENSIONS):
+            continue
+        path = Path(literal)
+        if not path.is_absolute():
+            path = Path(base_dir) / path
+        if path.is_file():
+            with open(path, "rb") as f:
+                asset_hashes[literal] = hashlib.sha256(f.read()).hexdigest()
+        else:
+            asset_hashes[literal] = "missing"
+    return asset_hashes
+
+
+def compute_render_key(code: str, scene_name: str, render_flags: Dict[str, Any], base_dir: Path) -> str:
+    payload = {
+        "source": normalize_scene_source(code),
+        "scene": scene_name,
+        "manim": get_manim_version(),
+        "flags": render_flags,
+        "assets": hash_referenced_assets(code, base_dir),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Shared, content-addressed store of finished section videos with LRU eviction by size"""
+
+    def __init__(self, cache_dir=None, max_size_mb: int = 5000):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.objects_dir = self.cache_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+
+    def _object_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.mp4"
+
+    def get(self, key: str, dest_path) -> Optional[str]:
+        """Copy a cached video to dest_path; returns dest_path on a hit, None on a miss"""
+        obj = self._object_path(key)
+        if not obj.exists():
+            return None
+        try:
+            os.utime(obj)  # LRU: mtime is the last access time
+            dest_path = Path(dest_path)
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(obj, dest_path)
+            return str(dest_path)
+        except OSError:
+            return None
+
+    def put(self, key: str, video_path) -> bool:
+        obj = self._object_path(key)
+        if obj.exists():
+            os.utime(obj)
+            return True
+        try:
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            tmp = obj.with_name(f".{obj.name}.{uuid.uuid4().hex}.tmp")
+            shutil.copyfile(video_path, tmp)
+            os.replace(tmp, obj)  # atomic publish, safe with concurrent writers of the same key
+        except OSError as e:
+            print(f"⚠️ 渲染缓存写入失败: {e}")
+            return False
+        self.prune()
+        return True
+
+    def entries(self) -> List[Tuple[Path, int, float]]:
+        result = []
+        for obj in self.objects_dir.glob("*/*.mp4"):
+            try:
+                st = obj.stat()
+            except OSError:
+                continue
+            result.append((obj, st.st_size, st.st_mtime))
+        return result
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """Evict least recently used entries until the cache fits; returns (# removed, bytes freed)"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed, freed = 0, 0
+        for obj, size, _ in entries:
+            if total <= limit:
+                break
+            try:
+                obj.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        mtimes = [m for _, _, m in entries]
+        return {
+            "cache_dir": str(self.cache_dir),
+            "entries": len(entries),
+            "size_mb": sum(size for _, size, _ in entries) / 1024 / 1024,
+            "max_size_mb": self.max_bytes / 1024 / 1024,
+            "oldest_access": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(min(mtimes))) if mtimes else None,
+            "newest_access": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(max(mtimes))) if mtimes else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the shared section render cache.")
+    parser.add_argument("command", choices=["stats", "prune", "clear"])
+    parser.add_argument("--cache_dir", type=str, default=str(DEFAULT_CACHE_DIR))
+    parser.add_argument("--max_size_mb", type=int, default=5000, help="Size limit used by prune")
+    args = parser.parse_args()
+
+    cache = RenderCache(args.cache_dir, max_size_mb=args.max_size_mb)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "prune":
+        removed, freed = cache.prune()
+        print(f"已清理 {removed} 个缓存视频，释放 {freed / 1024 / 1024:.1f} MB")
+    else:
+        removed, freed = cache.prune(max_bytes=0)
+        print(f"已清空缓存: {removed} 个视频，{freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import ast
+import sys
+import json
+import time
+import argparse
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+
+# Cost model (seconds of wall-clock at 480p15); calibrate with `python render_cost.py summarize <CASES dir>`
+BASE_SECONDS = 8.0  # interpreter / manim startup and scene setup
+PER_PLAY_SECONDS = 0.4  # per play()/wait() call: animation setup, partial movie file
+PER_ANIMATION_SECOND = 1.5  # per second of animation at 854x480, 15 fps
+PER_TEX_SECONDS = 1.2  # LaTeX compile + dvisvgm per MathTex/Tex
+PER_CODE_SECONDS = 0.8  # Pygments + Paragraph per Code block
+PER_TEXT_SECONDS = 0.15  # Pango per Text
+DEFAULT_LOOP_ITERATIONS = 3  # loops whose bounds are not literal
+REFERENCE_PIXEL_RATE = 854 * 480 * 15
+
+TIMEOUT_FACTOR = 4.0
+MIN_TIMEOUT = 300  # the old fixed timeout: the untuned estimate may only raise it, never cut a render short
+MAX_TIMEOUT = 1200
+
+TEX_CLASSES = {"MathTex", "Tex", "SingleStringMathTex", "MathTable", "DecimalMatrix", "IntegerMatrix", "Matrix"}
+TEXT_CLASSES = {"Text", "MarkupText", "Paragraph"}
+CODE_CLASSES = {"Code"}
+
+
+@dataclass
+class RenderCostEstimate:
+    plays: float = 0
+    waits: float = 0
+    animation_seconds: float = 0.0
+    tex_objects: float = 0
+    text_objects: float = 0
+    code_objects: float = 0
+    estimated_seconds: float = BASE_SECONDS
+
+    def timeout(self) -> int:
+        return int(min(MAX_TIMEOUT, max(MIN_TIMEOUT, self.estimated_seconds * TIMEOUT_FACTOR)))
+
+
+def _literal_number(node: Optional[ast.AST]) -> Optional[float]:
+    try:
+        value = ast.literal_eval(node)
+    except Exception:
+        return None
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _loop_iterations(node: ast.AST) -> float:
+    """Literal trip count of a for loop when it can be read off the source"""
+    if isinstance(node, ast.For):
+        it = node.iter
+        if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == "range":
+            bounds = [_literal_number(a) for a in it.args]
+            if bounds and all(b is not None for b in bounds):
+                start, stop, step = (0, bounds[0], 1) if len(bounds) == 1 else (bounds + [1])[:3]
+                if step:
+                    return max(0, (stop - start) / step)
+        if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == "enumerate" and it.args:
+            it = it.args[0]
+        if isinstance(it, (ast.List, ast.Tuple, ast.Set)):
+            return len(it.elts)
+        if isinstance(it, ast.Constant) and isinstance(it.value, str):
+            return len(it.value)
+    return DEFAULT_LOOP_ITERATIONS
+
+
+class _CostVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.estimate = RenderCostEstimate()
+        self.multiplier = 1.0
+
+    def _visit_loop(self, node):
+        saved = self.multiplier
+        self.multiplier *= _loop_iterations(node)
+        self.generic_visit(node)
+        self.multiplier = saved
+
+    visit_For = _visit_loop
+    visit_While = _visit_loop
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else func.id if isinstance(func, ast.Name) else None
+        is_self = isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == "self"
+        est = self.estimate
+
+        if is_self and name == "play":
+            run_time = next((_literal_number(kw.value) for kw in node.keywords if kw.arg == "run_time"), None)
+            est.plays += self.multiplier
+            est.animation_seconds += self.multiplier * (run_time if run_time is not None else 1.0)
+        elif is_self and name == "wait":
+            duration = _literal_number(node.args[0]) if node.args else None
+            duration = duration if duration is not None else next(
+                (_literal_number(kw.value) for kw in node.keywords if kw.arg == "duration"), None
+            )
+            est.waits += self.multiplier
+            est.animation_seconds += self.multiplier * (duration if duration is not None else 1.0)
+        elif name in TEX_CLASSES:
+            est.tex_objects += self.multiplier
+        elif name in TEXT_CLASSES:
+            est.text_objects += self.multiplier
+        elif name in CODE_CLASSES:
+            est.code_objects += self.multiplier
+
+        self.generic_visit(node)
+
+
+def estimate_render_cost(code: str, profile: Optional[Dict[str, Any]] = None) -> RenderCostEstimate:
+    """Static wall-clock estimate for rendering a generated scene"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return RenderCostEstimate()
+
+    visitor = _CostVisitor()
+    visitor.visit(tree)
+    est = visitor.estimate
+
+    pixel_rate = REFERENCE_PIXEL_RATE
+    if profile:
+        pixel_rate = profile["pixel_width"] * profile["pixel_height"] * profile["frame_rate"]
+    est.estimated_seconds = (
+        BASE_SECONDS
+        + (est.plays + est.waits) * PER_PLAY_SECONDS
+        + est.animation_seconds * PER_ANIMATION_SECOND * pixel_rate / REFERENCE_PIXEL_RATE
+        + est.tex_objects * PER_TEX_SECONDS
+        + est.text_objects * PER_TEXT_SECONDS
+        + est.code_objects * PER_CODE_SECONDS
+    )
+    return est
+
+
+def log_render_time(
+    log_path, section_id: str, profile: str, estimate: RenderCostEstimate, actual_seconds: float, success: bool, aborted: bool = False
+):
+    """`aborted`: killed for host memory pressure and requeued; kept out of calibration"""
+    record = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "section": section_id,
+        "profile": profile,
+        "estimated_s": round(estimate.estimated_seconds, 2),
+        "actual_s": round(actual_seconds, 2),
+        "success": success,
+        "aborted": aborted,
+        "features": asdict(estimate),
+    }
+    try:
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def summarize(cases_dir: Path) -> Dict[str, Any]:
+    records: List[Dict[str, Any]] = []
+    for log_path in Path(cases_dir).rglob("render_times.jsonl"):
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    ok = [r for r in records if r.get("success") and r.get("estimated_s") and not r.get("aborted")]
+    ratios = sorted(r["actual_s"] / r["estimated_s"] for r in ok)
+    if not ratios:
+        return {"renders": len(records), "successful": 0}
+    return {
+        "renders": len(records),
+        "successful": len(ok),
+        "aborted": sum(1 for r in records if r.get("aborted")),
+        "actual_over_estimated_p50": ratios[len(ratios) // 2],
+        "actual_over_estimated_p90": ratios[int(len(ratios) * 0.9) - 1 if len(ratios) >= 10 else -1],
+        "total_estimated_s": sum(r["estimated_s"] for r in ok),
+        "total_actual_s": sum(r["actual_s"] for r in ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static render cost estimates for generated Manim scenes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    est_parser = sub.add_parser("estimate", help="Estimate the render cost of scene files")
+    est_parser.add_argument("files", nargs="+")
+    sum_parser = sub.add_parser("summarize", help="Compare estimated and actual render times from render_times.jsonl")
+    sum_parser.add_argument("cases_dir")
+    args = parser.parse_args()
+
+    if args.command == "estimate":
+        for file in args.files:
+            with open(file, "r", encoding="utf-8") as f:
+                est = estimate_render_cost(f.read())
+            print(f"{file}: ~{est.estimated_seconds:.1f}s (timeout {est.timeout()}s) {asdict(est)}")
+    else:
+        print(json.dumps(summarize(Path(args.cases_dir)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import traceback
+import threading
+import importlib.util
+import argparse
+import subprocess
+import multiprocessing
+import multiprocessing.util
+from queue import Queue
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Callable, ContextManager
+
+
+# -ql / -qm / -qh / -qk, expressed as explicit manim config values
+QUALITY_PRESETS = {
+    "l": {"pixel_width": 854, "pixel_height": 480, "frame_rate": 15},
+    "m": {"pixel_width": 1280, "pixel_height": 720, "frame_rate": 30},
+    "h": {"pixel_width": 1920, "pixel_height": 1080, "frame_rate": 60},
+    "k": {"pixel_width": 3840, "pixel_height": 2160, "frame_rate": 60},
+}
+
+
+# Named render profiles: draft for the fix loop, preview for MLLM feedback (= -ql), final for the promoted output
+RENDER_PROFILES = {
+    "draft": {"pixel_width": 480, "pixel_height": 270, "frame_rate": 10, "disable_caching": True},
+    "preview": {"pixel_width": 854, "pixel_height": 480, "frame_rate": 15},
+    "final": {"pixel_width": 1920, "pixel_height": 1080, "frame_rate": 30},
+}
+
+
+def get_render_profile(name: str, final_resolution: str = "1920,1080", final_fps: int = 30) -> Dict[str, Any]:
+    profile = dict(RENDER_PROFILES[name])
+    if name == "final":
+        width, height = (int(v) for v in final_resolution.split(","))
+        profile.update({"pixel_width": width, "pixel_height": height, "frame_rate": final_fps})
+    return profile
+
+
+def profile_quality_dir(profile: Dict[str, Any]) -> str:
+    """Folder manim puts the video in, e.g. 480p15"""
+    return f"{profile['pixel_height']}p{profile['frame_rate']:g}"
+
+
+def profile_cli_flags(profile: Dict[str, Any]) -> List[str]:
+    flags = ["-r", f"{profile['pixel_width']},{profile['pixel_height']}", "--fps", str(profile["frame_rate"])]
+    if profile.get("disable_caching"):
+        flags.append("--disable_caching")
+    return flags
+
+
+@dataclass
+class RenderJob:
+    code_file: str
+    scene_name: str
+    cwd: str
+    config: Dict[str, Any] = field(default_factory=dict)
+    timeout: float = 300
+    incremental: Optional[Dict[str, Any]] = None  # see block_render.plan_incremental_render
+    mode: str = "render"  # "render" or "probe" (run construct() only, nothing is written or encoded)
+    glyph_cache: Optional[Dict[str, Any]] = None  # kwargs of glyph_cache.install_glyph_cache
+
+
+@dataclass
+class RenderResult:
+    success: bool
+    video_path: Optional[str] = None
+    error_type: Optional[str] = None
+    error_message: Optional[str] = None
+    traceback: Optional[str] = None
+    duration: float = 0.0
+    crashed: bool = False
+    block_of_play: List[int] = field(default_factory=list)
+    partial_movie_files: List[Optional[str]] = field(default_factory=list)
+
+    @property
+    def stderr(self) -> str:
+        """Error text in the same shape as the stderr of a `manim` subprocess"""
+        return self.traceback or self.error_message or ""
+
+
+def build_render_config(code_file: str, scene_name: str, cwd: str, quality: str = "l", **overrides) -> Dict[str, Any]:
+    """Manim config for one job, equivalent to `manim -q<quality> <code_file> <scene_name>` run in cwd"""
+    config = dict(QUALITY_PRESETS[quality])
+    config.update(
+        {
+            "input_file": str(Path(cwd) / code_file),
+            "media_dir": str(Path(cwd) / "media"),
+            "output_file": scene_name,
+            "write_to_movie": True,
+            "verbosity": "WARNING",
+            "progress_bar": "none",
+        }
+    )
+    config.update(overrides)
+    return config
+
+
+def _execute_job(job: RenderJob) -> RenderResult:
+    """Load the scene file as a fresh module and render it with its own config"""
+    from manim import tempconfig
+
+    start = time.time()
+    cwd = str(Path(job.cwd).resolve())
+    module_name = f"_c2v_{Path(job.code_file).stem}_{uuid.uuid4().hex[:8]}"
+    modules_before = set(sys.modules)
+    path_before = list(sys.path)
+    cwd_before = os.getcwd()
+
+    try:
+        os.chdir(cwd)
+        sys.path.insert(0, cwd)
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(cwd, job.code_file))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        scene_cls = getattr(module, job.scene_name)
+
+        config = dict(job.config)
+        if job.glyph_cache is not None:
+            from glyph_cache import install_glyph_cache
+
+            config.update(install_glyph_cache(**job.glyph_cache).manim_config())
+        renderer = None
+        if job.mode == "probe":
+            from manim.renderer.cairo_renderer import CairoRenderer
+
+            config.update({"dry_run": True, "write_to_movie": False, "save_last_frame": False, "disable_caching": True})
+            if job.incremental:
+                from block_render import make_block_tracking_renderer
+
+                # Probe that also reports which lecture-line block every animation belongs to
+                renderer = make_block_tracking_renderer(spec.origin, job.incremental["block_lines"], [], skip_animations=True)
+            else:
+                renderer = CairoRenderer(skip_animations=True)
+        elif job.incremental:
+            from block_render import make_block_tracking_renderer
+
+            config["from_animation_number"] = job.incremental["start_animation"]
+            renderer = make_block_tracking_renderer(
+                spec.origin, job.incremental["block_lines"], job.incremental["reuse_partials"]
+            )
+
+        with tempconfig(config):
+            scene = scene_cls(renderer=renderer) if renderer is not None else scene_cls()
+            scene.render()
+            movie_file = getattr(scene.renderer.file_writer, "movie_file_path", None)
+            video_path = str(Path(movie_file).resolve()) if movie_file and job.mode == "render" else None
+
+        result = RenderResult(success=True, video_path=video_path, duration=time.time() - start)
+        if job.incremental:
+            result.block_of_play = list(renderer.block_of_play)
+        if job.incremental and job.mode == "render":
+            from block_render import collect_partial_movie_files
+
+            result.partial_movie_files = collect_partial_movie_files(renderer.file_writer)
+        return result
+
+    except (Exception, SystemExit) as e:
+        return RenderResult(
+            success=False,
+            error_type=type(e).__name__,
+            error_message=str(e),
+            traceback=traceback.format_exc(),
+            duration=time.time() - start,
+        )
+
+    finally:
+        os.chdir(cwd_before)
+        sys.path[:] = path_before
+        # Drop the scene module and anything it imported from the job folder, keep manim & friends warm
+        for name in set(sys.modules) - modules_before:
+            mod_file = getattr(sys.modules.get(name), "__file__", None) or ""
+            if name == module_name or mod_file.startswith(cwd):
+                sys.modules.pop(name, None)
+
+
+def _worker_main(conn):
+    import manim  # noqa: F401  (paid once per worker instead of once per attempt)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        conn.send(_execute_job(job))
+    conn.close()
+
+
+class _RenderWorker:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.process = None
+        self.conn = None
+        self.jobs_done = 0
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, args=(child_conn,))
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs_done = 0
+
+    def stop(self, graceful: bool = True):
+        try:
+            if graceful and self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout=5)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def restart(self, graceful: bool = True):
+        self.stop(graceful=graceful)
+        self.start()
+
+
+class ManimRenderServer:
+    """Pool of long-lived render workers that import manim once and render many jobs.
+
+    A worker is recycled after `max_jobs_per_worker` jobs, after a crash, or after a timeout.
+    """
+
+    def __init__(self, num_workers: int = 1, max_jobs_per_worker: int = 50):
+        self.num_workers = max(1, num_workers)
+        self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: List[_RenderWorker] = []
+        self._idle: Queue = Queue()
+        self._closed = False
+        self.owner_pid = os.getpid()
+        for _ in range(self.num_workers):
+            worker = _RenderWorker(self._ctx)
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+    def render(self, job: RenderJob, track: Optional[Callable[[int], ContextManager]] = None) -> RenderResult:
+        """Run a job on the next idle worker; `track(pid)` is entered while that worker runs the job"""
+        if self._closed:
+            raise RuntimeError("ManimRenderServer 已关闭")
+
+        worker = self._idle.get()
+        try:
+            if not worker.process.is_alive():
+                worker.restart(graceful=False)
+
+            start = time.time()
+            try:
+                with track(worker.process.pid) if track is not None else nullcontext():
+                    worker.conn.send(job)
+                    if not worker.conn.poll(job.timeout):
+                        worker.restart(graceful=False)
+                        return RenderResult(
+                            success=False,
+                            error_type="TimeoutExpired",
+                            error_message=f"Render timed out after {job.timeout}s",
+                            duration=time.time() - start,
+                            crashed=True,
+                        )
+                    result = worker.conn.recv()
+            except (EOFError, OSError, BrokenPipeError) as e:
+                exitcode = worker.process.exitcode
+                worker.restart(graceful=False)
+                return RenderResult(
+                    success=False,
+                    error_type="WorkerCrash",
+                    error_message=f"Render worker died (exit code {exitcode}): {e}",
+                    duration=time.time() - start,
+                    crashed=True,
+                )
+
+            worker.jobs_done += 1
+            if worker.jobs_done >= self.max_jobs_per_worker:
+                worker.restart()
+            return result
+
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            worker.stop()
+
+
+_SERVER: Optional[ManimRenderServer] = None
+_SERVER_LOCK = threading.Lock()
+
+
+def get_render_server(num_workers: int = 1, max_jobs_per_worker: int = 50) -> ManimRenderServer:
+    """Per-process render server, created lazily on first use"""
+    global _SERVER
+    with _SERVER_LOCK:
+        if _SERVER is None or _SERVER.owner_pid != os.getpid():  # a forked child must not use its parent's workers
+            _SERVER = ManimRenderServer(num_workers=num_workers, max_jobs_per_worker=max_jobs_per_worker)
+            # Pool workers never run atexit handlers; multiprocessing's own exit hook runs this
+            # finalizer before it joins the (non-daemon) render workers, so the process can exit
+            multiprocessing.util.Finalize(_SERVER, _SERVER.shutdown, exitpriority=10)
+            atexit.register(_SERVER.shutdown)
+        return _SERVER
+
+
+def run_probe(
+    code_file: str,
+    scene_name: str,
+    cwd,
+    timeout: float = 60,
+    server: Optional[ManimRenderServer] = None,
+    glyph_cache: Optional[Dict[str, Any]] = None,
+) -> RenderResult:
+    """Run construct() with animations skipped and no frame writing / ffmpeg, to surface runtime errors fast"""
+    cwd = str(cwd)
+    if server is not None:
+        config = build_render_config(code_file, scene_name, cwd, quality="l")
+        return server.render(
+            RenderJob(code_file, scene_name, cwd, config=config, timeout=timeout, mode="probe", glyph_cache=glyph_cache)
+        )
+
+    start = time.time()
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--probe", code_file, scene_name]
+    if glyph_cache is not None:
+        cmd += ["--glyph_cache", json.dumps(glyph_cache)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return RenderResult(
+            success=False,
+            error_type="TimeoutExpired",
+            error_message=f"Probe timed out after {timeout}s",
+            duration=time.time() - start,
+        )
+    if result.returncode == 0:
+        return RenderResult(success=True, duration=time.time() - start)
+    return RenderResult(success=False, traceback=result.stderr, duration=time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe a generated scene: run construct() without encoding.")
+    parser.add_argument("--probe", nargs=2, metavar=("CODE_FILE", "SCENE_NAME"), required=True)
+    parser.add_argument("--glyph_cache", type=json.loads, default=None, help="JSON kwargs of install_glyph_cache")
+    args = parser.parse_args()
+
+    code_file, scene_name = args.probe
+    cwd = os.getcwd()
+    config = build_render_config(code_file, scene_name, cwd, quality="l")
+    result = _execute_job(RenderJob(code_file, scene_name, cwd, config=config, mode="probe", glyph_cache=args.glyph_cache))
+    if result.success:
+        print(f"Probe OK ({result.duration:.2f}s)")
+        return 0
+    sys.stderr.write(result.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
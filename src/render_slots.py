@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+DEFAULT_SLOT_DIR = Path(tempfile.gettempdir()) / "code2video_render_slots"
+MEMORY_PER_RENDER_GB = 1.5
+
+
+def default_slot_count(memory_per_render_gb: float = MEMORY_PER_RENDER_GB) -> int:
+    """Concurrent manim processes this host can take: one per core, bounded by RAM"""
+    slots = os.cpu_count() or 4
+    try:
+        import psutil
+
+        slots = min(slots, int(psutil.virtual_memory().total / (memory_per_render_gb * 1024**3)))
+    except ImportError:
+        pass
+    return max(1, slots)
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+@contextmanager
+def exclusive_lock(path, poll_interval: float = 0.05):
+    """Blocking cross-process lock on a lock file"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        while not _try_lock(fd):
+            time.sleep(poll_interval)
+        yield
+    finally:
+        os.close(fd)
+
+
+class RenderSlots:
+    """Host-wide pool of render slots backed by lock files.
+
+    Every process that launches manim takes one slot for the duration of the render, so the
+    nested topic / section process pools never run more renders than the host has slots.
+    Locks are released by the OS when a holder dies, so a crashed worker never leaks a slot.
+    """
+
+    def __init__(self, num_slots: Optional[int] = None, slot_dir=None, poll_interval: float = 0.2):
+        self.num_slots = num_slots or default_slot_count()
+        self.slot_dir = Path(slot_dir) if slot_dir else DEFAULT_SLOT_DIR
+        self.slot_dir.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+
+    def _try_acquire(self) -> Optional[int]:
+        # Start at a random slot so waiters do not all hammer slot 0
+        offset = random.randrange(self.num_slots)
+        for i in range(self.num_slots):
+            path = self.slot_dir / f"slot_{(offset + i) % self.num_slots}.lock"
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            if _try_lock(fd):
+                return fd
+            os.close(fd)
+        return None
+
+    @contextmanager
+    def acquire(self):
+        """Block until a slot is free; yields the seconds spent waiting"""
+        start = time.time()
+        fd = self._try_acquire()
+        while fd is None:
+            time.sleep(self.poll_interval * random.uniform(0.5, 1.5))
+            fd = self._try_acquire()
+        try:
+            yield time.time() - start
+        finally:
+            os.close(fd)  # closing the descriptor drops the lock
+
+    @contextmanager
+    def acquire_nowait(self):
+        """Take a slot only if one is free right now; yields whether it was taken"""
+        fd = self._try_acquire()
+        try:
+            yield fd is not None
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def busy(self) -> int:
+        """Number of slots currently held (by any process)"""
+        held = 0
+        for i in range(self.num_slots):
+            fd = os.open(self.slot_dir / f"slot_{i}.lock", os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if not _try_lock(fd):
+                    held += 1
+            finally:
+                os.close(fd)
+        return held
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the host-wide manim render slot usage.")
+    parser.add_argument("--slots", type=int, default=0, help="0 = auto (cores, bounded by RAM)")
+    parser.add_argument("--slot_dir", type=str, default=str(DEFAULT_SLOT_DIR))
+    args = parser.parse_args()
+
+    slots = RenderSlots(args.slots or None, args.slot_dir)
+    print(f"渲染槽位: {slots.busy()}/{slots.num_slots} 正在使用 ({slots.slot_dir})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import time
+import random
+import threading
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+import openai
+
+from llm_cache import LLMCacheMiss
+
+
+RATE_LIMIT, TRANSIENT, TIMEOUT, PERMANENT, CIRCUIT_OPEN = "rate_limit", "transient", "timeout", "permanent", "circuit_open"
+
+MAX_DELAY = 60.0
+MAX_RETRY_AFTER = 120.0
+RATE_LIMIT_BASE_DELAY = 1.0
+TIMEOUT_RETRIES = 2  # a request that already ran into the (minutes long) timeout is re-sent at most this often
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose recent calls mostly failed"""
+
+
+def classify_error(e: Exception) -> str:
+    if isinstance(e, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(e, (LLMCacheMiss, FileNotFoundError)):
+        return PERMANENT
+    if isinstance(e, (openai.APITimeoutError, httpx.TimeoutException)):
+        return TIMEOUT
+    if isinstance(e, (openai.APIConnectionError, httpx.TransportError)):
+        return TRANSIENT
+    if isinstance(e, openai.APIStatusError):
+        status = e.status_code
+        if status == 429:
+            return RATE_LIMIT
+        if status == 408:
+            return TIMEOUT
+        if status in (409, 425) or status >= 500:
+            return TRANSIENT
+        # 400 / 401 / 403 / 404 / 422: sending the same request again cannot succeed
+        return PERMANENT
+    # Malformed proxy responses and the like: worth another try
+    return TRANSIENT
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """Server-requested wait from Retry-After / retry-after-ms, if the error carries a response"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class BreakerTicket:
+    """Handed out by CircuitBreaker.before_call; ties a call's outcome to the breaker state it started in"""
+
+    epoch: int
+    trial: bool = False
+
+
+class CircuitBreaker:
+    """Per-provider breaker: opens when most calls of the last `window` seconds failed.
+
+    After `cooldown` seconds one trial call is let through (half-open); only its outcome closes
+    the breaker or opens it again. Every open / close starts a new epoch, and outcomes of calls
+    started in an earlier epoch (still in flight when the breaker tripped) are ignored. State is
+    per process, each worker learns within a few calls.
+    """
+
+    def __init__(self, svc: str, window: float = 60.0, min_calls: int = 8, error_rate: float = 0.5, cooldown: float = 30.0):
+        self.svc = svc
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._events = deque()
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> BreakerTicket:
+        with self._lock:
+            if self._opened_at is None:
+                return BreakerTicket(self._epoch)
+            if time.time() - self._opened_at < self.cooldown or self._trial_running:
+                raise CircuitOpenError(f"{self.svc} circuit open: too many recent failures, failing fast")
+            self._trial_running = True
+            return BreakerTicket(self._epoch, trial=True)
+
+    def release(self, ticket: BreakerTicket):
+        """A call that ended without an outcome (cancelled): free the trial slot, keep the state"""
+        with self._lock:
+            if ticket.trial and ticket.epoch == self._epoch:
+                self._trial_running = False
+
+    def record(self, ticket: BreakerTicket, ok: bool):
+        now = time.time()
+        with self._lock:
+            if ticket.trial:
+                if ticket.epoch == self._epoch:
+                    self._trial_running = False
+                    self._opened_at = None if ok else now
+                    self._epoch += 1
+                    self._events.clear()
+                return
+            if self._opened_at is not None or ticket.epoch != self._epoch:
+                return  # started before the breaker tripped; says nothing about the provider now
+            self._events.append((now, ok))
+            while self._events and now - self._events[0][0] > self.window:
+                self._events.popleft()
+            failures = sum(1 for _, good in self._events if not good)
+            if len(self._events) >= self.min_calls and failures / len(self._events) >= self.error_rate:
+                self._opened_at = now
+                self._epoch += 1
+                print(f"⚡ {self.svc} 最近 {len(self._events)} 次请求失败 {failures} 次，熔断 {self.cooldown:.0f} 秒")
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker(svc: str) -> CircuitBreaker:
+    with _BREAKERS_LOCK:
+        if svc not in _BREAKERS:
+            _BREAKERS[svc] = CircuitBreaker(svc)
+        return _BREAKERS[svc]
+
+
+def record_outcome(svc: str, ticket: BreakerTicket, error: Optional[Exception] = None):
+    """Feed a call outcome to the provider's breaker; a permanent (4xx) error still means the provider answered"""
+    breaker(svc).record(ticket, ok=error is None or classify_error(error) == PERMANENT)
+
+
+class RetryPolicy:
+    """Retry state of one request: error classification, Retry-After and decorrelated-jitter backoff.
+
+        retry = RetryPolicy("gemini", max_retries, base_delay=0.2)
+        while retry.pending():
+            try:
+                return call()
+            except Exception as e:
+                retry.wait(e)  # sleeps, or raises once retrying cannot help
+    """
+
+    def __init__(self, svc: str, max_retries: int, base_delay: float = 0.1, max_delay: float = MAX_DELAY):
+        self.svc = svc
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempts = 0
+        self.timeouts = 0
+        self._prev_delay = base_delay
+
+    def pending(self) -> bool:
+        return self.attempts < self.max_retries
+
+    def next_delay(self, e: Exception) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up"""
+        self.attempts += 1
+        kind = classify_error(e)
+        if kind in (PERMANENT, CIRCUIT_OPEN) or self.attempts >= self.max_retries:
+            return None
+        if kind == TIMEOUT:
+            self.timeouts += 1
+            if self.timeouts > TIMEOUT_RETRIES:
+                return None
+
+        base = max(self.base_delay, RATE_LIMIT_BASE_DELAY) if kind == RATE_LIMIT else self.base_delay
+        # Decorrelated jitter: spreads out workers that failed together instead of retrying in lockstep
+        delay = min(self.max_delay, random.uniform(base, max(base, self._prev_delay * 3)))
+        self._prev_delay = delay
+        retry_after = retry_after_seconds(e)
+        if retry_after is not None:
+            delay = min(MAX_RETRY_AFTER, retry_after) + random.uniform(0, base)
+        print(
+            f"Request failed with error ({kind}): {str(e)}. Retrying in {delay:.2f} seconds... "
+            f"(Attempt {self.attempts}/{self.max_retries})"
+        )
+        return delay
+
+    def give_up_message(self, e: Exception) -> str:
+        return f"Failed after {self.attempts} attempts ({classify_error(e)}). Last error: {str(e)}"
+
+    def wait(self, e: Exception, raise_on_give_up: bool = True) -> bool:
+        """Sleep before the next attempt; on give-up raise, or print and return False"""
+        delay = self.next_delay(e)
+        if delay is None:
+            if raise_on_give_up:
+                raise Exception(self.give_up_message(e)) from e
+            print(self.give_up_message(e))
+            return False
+        time.sleep(delay)
+        return True
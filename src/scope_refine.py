@@ -1,11 +1,19 @@
 import re
 from pathlib import Path
 import json
+import time
+import uuid
+import threading
 from dataclasses import dataclass
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple, Optional, Any
 import logging
 
+from manim_api_index import format_issues
+from fix_memo import SectionFixMemo, MAX_FIX_ROUNDS_PER_SIGNATURE, error_signature
+from fix_knowledge_base import apply_patch, patch_text
+
 logger = logging.getLogger(__name__)
 
 
@@ -155,11 +163,11 @@ class ManimCodeErrorAnalyzer:
             end = min(len(lines), line_num + 5)
             return "\n".join(lines[start:end])
 
-        elif error_info["fix_scope"] == "function":
+        elif error_info["fix_scope"] == "function" and error_info["line_number"]:
             # Function level error: find the function containing the error
             return self._extract_function_containing_line(code, error_info["line_number"])
 
-        elif error_info["fix_scope"] == "section":
+        elif error_info["fix_scope"] == "section" and error_info["line_number"]:
             # Section level error: find the animation section containing the error
             return self._extract_animation_section(code, error_info["line_number"])
 
@@ -248,10 +256,29 @@ class ManimCodeErrorAnalyzer:
 
 class ScopeRefineFixer:
 
-    def __init__(self, gpt_request_func, MAX_CODE_TOKEN_LENGTH):
+    def __init__(
+        self,
+        gpt_request_func,
+        MAX_CODE_TOKEN_LENGTH,
+        probe_func=None,
+        api_validator=None,
+        use_fix_memo=False,
+        speculative_fixes=0,
+        fix_kb=None,
+    ):
         self.analyzer = ManimCodeErrorAnalyzer()
         self.request_gpt = gpt_request_func
         self.MAX_CODE_TOKEN_LENGTH = MAX_CODE_TOKEN_LENGTH
+        # probe_func(code_file, scene_name, cwd) -> (ok, error_msg): runs construct() without encoding
+        self.probe_func = probe_func
+        # manim_api_index.ManimAPIValidator: static name / attribute / keyword checks after compile()
+        self.api_validator = api_validator
+        # section_id -> SectionFixMemo: outcomes by code hash, cycle and repeated-error detection
+        self.fix_memos: Optional[Dict[str, SectionFixMemo]] = {} if use_fix_memo else None
+        # > 1: request this many fixes at once and keep the first that validates
+        self.speculative_fixes = speculative_fixes
+        # fix_knowledge_base.FixKnowledgeBase: patches that fixed the same error in earlier topics
+        self.fix_kb = fix_kb
 
         self.common_fixes = self._load_common_fixes()
         self.error_patterns = self._load_error_patterns()
@@ -331,15 +358,66 @@ class ScopeRefineFixer:
         """Validate code syntax correctness"""
         try:
             compile(code, "<string>", "exec")
-            return True, None
         except SyntaxError as e:
             return False, f"Syntax Error: {e}"
         except Exception as e:
             return False, f"Compilation Error: {e}"
+        if self.api_validator is not None:
+            issues = self.api_validator.validate(code)
+            if issues:
+                return False, f"Static Check Error:\n{format_issues(issues)}"
+        return True, None
+
+    def fix_memo(self, section_id: str) -> Optional[SectionFixMemo]:
+        if self.fix_memos is None:
+            return None
+        return self.fix_memos.setdefault(section_id, SectionFixMemo())
+
+    def _dry_run_memoized(self, code: str, section_id: str, output_dir: Path) -> Tuple[bool, Optional[str]]:
+        memo = self.fix_memo(section_id)
+        known = memo.lookup(code, "dry_run") if memo is not None else None
+        if known is not None:
+            return known.ok, known.error_msg
+        ok, error_msg = self.dry_run_test(code, section_id, output_dir)
+        if memo is not None:
+            memo.record(code, "dry_run", ok, error_msg)
+        return ok, error_msg
+
+    def _extract_scene_name(self, code: str, section_id: str) -> str:
+        # 代码里第一个类通常是注入的 TeachingScene，优先匹配 SectionXScene
+        class_names = re.findall(r"class\s+(\w+)\s*\(", code)
+        expected = f"{section_id.title().replace('_', '')}Scene"
+        if expected in class_names:
+            return expected
+        scene_classes = [name for name in class_names if name != "TeachingScene"]
+        if scene_classes:
+            return scene_classes[-1]
+        # Fallback (保底策略)
+        return expected
+
+    def probe_test(self, code: str, section_id: str, output_dir: Path) -> Tuple[bool, Optional[str]]:
+        """Run construct() with animations skipped and nothing encoded; surfaces runtime errors in seconds"""
+        # Unique per call: speculative candidates of one section are probed at the same time
+        probe_file = output_dir / f"probe_{section_id}_{uuid.uuid4().hex[:8]}.py"
+        scene_name = self._extract_scene_name(code, section_id)
+        try:
+            with open(probe_file, "w", encoding="utf-8") as f:
+                f.write(code)
+            ok, error_msg = self.probe_func(probe_file.name, scene_name, output_dir)
+            return ok, None if ok else f"Probe Error for class '{scene_name}': {error_msg}"
+        except Exception as e:
+            return False, str(e)
+        finally:
+            if probe_file.exists():
+                probe_file.unlink()
 
     def dry_run_test(self, code: str, section_id: str, output_dir: Path) -> Tuple[bool, Optional[str]]:
         """Execute dry run test (do not render video)"""
-        test_file = output_dir / f"test_{section_id}.py"
+        if self.probe_func is not None:
+            return self.probe_test(code, section_id, output_dir)
+
+        test_module = f"test_{section_id}_{uuid.uuid4().hex[:8]}"
+        test_file = output_dir / f"{test_module}.py"
 
         # Create test version of code (add quick exit)
         # 1. 动态获取类名：不要假设类名是 SectionXScene，而是从代码中正则提取
@@ -360,7 +438,7 @@ class ScopeRefineFixer:
                 f.write(test_code)
 
             # 2. 使用提取出的正确类名进行测试
-            cmd = ["python", "-c", f"from test_{section_id} import {scene_name}; scene = {scene_name}(); print('Syntax OK')"]
+            cmd = ["python", "-c", f"from {test_module} import {scene_name}; scene = {scene_name}(); print('Syntax OK')"]
 
             result = subprocess.run(cmd, capture_output=True, text=True, cwd=output_dir, timeout=20) # 稍微增加一点超时时间到 20s
 
@@ -461,6 +539,7 @@ class ScopeRefineFixer:
 
         **修复建议:**
         {chr(10).join(f"- {s}" for s in suggestions)}
+        {self._known_fix_examples(current_code, error_msg)}
         
         {specific_prompt}
 
@@ -475,8 +554,51 @@ class ScopeRefineFixer:
 
         return base_prompt
 
+    def _known_fix_examples(self, code: str, error_msg: str) -> str:
+        if self.fix_kb is None:
+            return ""
+        fixes = self.fix_kb.matches(code, error_msg)
+        if not fixes:
+            return ""
+        examples = "\n".join(f"```diff\n{patch_text(fix.hunks)}\n```" for fix in fixes)
+        return f"**历史修复参考 (其他主题中修复同类错误的最小改动):**\n{examples}"
+
+    def _apply_known_fixes(self, section_id: str, code: str, error_msg: str, output_dir: Path) -> Optional[str]:
+        """Apply patches that fixed the same error fingerprint before; the first one that validates skips the LLM"""
+        memo = self.fix_memo(section_id)
+        for fix in self.fix_kb.matches(code, error_msg):
+            if not fix.exact:
+                continue  # same message template, different API: only useful as a prompt example
+            patched = apply_patch(code, fix.hunks)
+            if not patched or patched == code or (memo is not None and memo.is_cycle(patched)):
+                continue
+            ok, _ = self.validate_code_syntax(patched)
+            if ok:
+                ok, _ = self._dry_run_memoized(patched, section_id, output_dir)
+            self.fix_kb.record_applied(fix.id, ok)
+            if ok:
+                print(f"📚 {section_id} 应用知识库补丁 #{fix.id} ({fix.fingerprint.exc_type}: {fix.fingerprint.api})，跳过 LLM 修复")
+                self.fix_kb.record_lookup(hit=True)
+                return patched
+        self.fix_kb.record_lookup(hit=False)
+        return None
+
+    def learn_fix(self, old_code: str, error_msg: str, new_code: str, new_error: Optional[str]):
+        """Report the render after a fix_code_smart fix (new_error None: it succeeded); fixes that cleared the error are stored"""
+        if self.fix_kb is None or (new_error is not None and error_signature(new_error) == error_signature(error_msg)):
+            return
+        self.fix_kb.learn(old_code, error_msg, new_code)
+
     def fix_code_smart(self, section_id: str, code: str, error_msg: str, output_dir: Path) -> Optional[str]:
         """Smart fix code, prioritize local fix, fallback to complete rewrite if failed"""
+        if self.fix_kb is not None:
+            patched = self._apply_known_fixes(section_id, code, error_msg, output_dir)
+            if patched:
+                return patched
+
+        if self.speculative_fixes > 1:
+            # The focused strategy is one of the candidates, no separate local repair round first
+            return self.fix_code_speculative(section_id, code, error_msg, output_dir)
 
         # Analyze error
         error_info = self.analyzer.analyze_error(code, error_msg)
@@ -488,10 +610,14 @@ class ScopeRefineFixer:
                 fixed_block = self._fix_code_block(section_id, relevant_code, error_msg, error_info)
                 if fixed_block:
                     merged_code = self._merge_fixed_block(code, relevant_code, fixed_block, error_info)
+                    memo = self.fix_memo(section_id)
+                    if merged_code and memo is not None and memo.is_cycle(merged_code):
+                        print(f"🔁 {section_id} 局部修复得到了已失败过的代码版本，转为重新生成")
+                        return None
                     if merged_code:
                         is_valid, syntax_error = self.validate_code_syntax(merged_code)
                         if is_valid:
-                            is_dry_run_ok, dry_run_error = self.dry_run_test(merged_code, section_id, output_dir)
+                            is_dry_run_ok, dry_run_error = self._dry_run_memoized(merged_code, section_id, output_dir)
                             if is_dry_run_ok:
                                 return merged_code
                             else:
@@ -515,6 +641,7 @@ class ScopeRefineFixer:
     ) -> Optional[str]:
         """Multi-stage validation code repair"""
         logger.info(f"Start fixing the code errors for {section_id}")
+        memo = self.fix_memo(section_id)
 
         for attempt in range(1, max_attempts + 1):
             logger.info(f"Start fixing the code errors for {section_id} attempt {attempt}/{max_attempts}")
@@ -524,13 +651,8 @@ class ScopeRefineFixer:
                 response = self.request_gpt(fix_prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)
                 response = get_completion_only(response)
 
-                if hasattr(response, "choices") and response.choices and len(response.choices) > 0:
-                    fixed_code = response.choices[0].message.content
-                elif hasattr(response, "candidates") and response.candidates: # 兼容 Gemini
-                    fixed_code = response.candidates[0].content.parts[0].text
-                elif isinstance(response, str):
-                    fixed_code = response
-                else:
+                fixed_code = self._response_text(response)
+                if fixed_code is None:
                     logger.warning(f"Attempt {attempt}: API response format unexpected: {response}")
                     continue # 跳过本次循环，而不是崩溃
 
@@ -540,10 +662,17 @@ class ScopeRefineFixer:
                     logger.warning(f"Attempt {attempt}: Failed to extract valid code")
                     continue
 
+                if memo is not None and memo.is_cycle(fixed_code):
+                    # The LLM is oscillating between broken versions; a fresh generation has better odds
+                    print(f"🔁 {section_id} 第 {attempt} 次修复返回了已失败过的代码版本，转为重新生成")
+                    return None
+
                 # Stage 1: Syntax validation
                 is_valid_syntax, syntax_error = self.validate_code_syntax(fixed_code)
                 if not is_valid_syntax:
                     logger.warning(f"Attempt {attempt}: Syntax error - {syntax_error}")
+                    if memo is not None:
+                        memo.record(fixed_code, "syntax", False, syntax_error)
                     error_msg = syntax_error  # Update the error message for the next fix
                     current_code = fixed_code  # Update the current code
                     continue
@@ -551,9 +680,12 @@ class ScopeRefineFixer:
                 logger.info(f"Attempt {attempt}: Syntax validation passed")
 
                 # Stage 2: Dry run test
-                is_dry_run_ok, dry_run_error = self.dry_run_test(fixed_code, section_id, output_dir)
+                is_dry_run_ok, dry_run_error = self._dry_run_memoized(fixed_code, section_id, output_dir)
                 if not is_dry_run_ok:
                     logger.warning(f"Attempt {attempt}: Dry run failed - {dry_run_error}")
+                    if memo is not None and memo.exhausted(dry_run_error):
+                        print(f"🛑 {section_id} 该错误已修复 {MAX_FIX_ROUNDS_PER_SIGNATURE} 轮仍未解决，转为重新生成")
+                        return None
                     error_msg = dry_run_error
                     current_code = fixed_code
                     continue
@@ -569,6 +701,74 @@ class ScopeRefineFixer:
         logger.error(f"{section_id} fix failed - Reached maximum attempts")
         return None
 
+    def _response_text(self, response) -> Optional[str]:
+        if hasattr(response, "choices") and response.choices and len(response.choices) > 0:
+            return response.choices[0].message.content
+        elif hasattr(response, "candidates") and response.candidates: # 兼容 Gemini
+            return response.candidates[0].content.parts[0].text
+        elif isinstance(response, str):
+            return response
+        return None
+
+    def fix_code_speculative(self, section_id: str, current_code: str, error_msg: str, output_dir: Path) -> Optional[str]:
+        """Request K fixes at once, validate them concurrently and keep the first that passes"""
+        k = self.speculative_fixes
+        memo = self.fix_memo(section_id)
+        stop = threading.Event()
+        start = time.time()
+
+        def candidate(idx: int) -> Tuple[int, Optional[str], Optional[str]]:
+            # Strategies of generate_fix_prompt in turn: focused fix, comprehensive review, rewrite
+            prompt = self.generate_fix_prompt(section_id, current_code, error_msg, idx % 3 + 1)
+            if idx >= 3:
+                # Same strategy again: a different prompt keeps the LLM cache from returning the same answer
+                prompt += f"\n\n(候选方案 #{idx + 1}：请给出与常见修法不同的另一种修复方式)"
+            fixed_code = self._clean_code_format(
+                self._response_text(get_completion_only(self.request_gpt(prompt, max_tokens=self.MAX_CODE_TOKEN_LENGTH)))
+            )
+            if not fixed_code:
+                return idx, None, "no code in response"
+            if stop.is_set():
+                return idx, None, "cancelled"
+            if memo is not None and memo.is_cycle(fixed_code):
+                return idx, None, "already failed before"
+            is_valid_syntax, syntax_error = self.validate_code_syntax(fixed_code)
+            if not is_valid_syntax:
+                if memo is not None:
+                    memo.record(fixed_code, "syntax", False, syntax_error)
+                return idx, None, syntax_error
+            if stop.is_set():
+                return idx, None, "cancelled"
+            is_dry_run_ok, dry_run_error = self._dry_run_memoized(fixed_code, section_id, output_dir)
+            return idx, fixed_code if is_dry_run_ok else None, dry_run_error
+
+        winner, winner_code = None, None
+        executor = ThreadPoolExecutor(max_workers=k)
+        futures = [executor.submit(candidate, idx) for idx in range(k)]
+        try:
+            for future in as_completed(futures):
+                try:
+                    idx, fixed_code, error = future.result()
+                except Exception as e:
+                    logger.warning(f"{section_id} speculative candidate failed: {e}")
+                    continue
+                if fixed_code:
+                    winner, winner_code = idx, fixed_code
+                    break
+                logger.warning(f"{section_id} speculative candidate {idx + 1}/{k} rejected: {error}")
+        finally:
+            # Validation of the remaining candidates stops; their in-flight LLM calls finish and are dropped
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.time() - start
+        log_fix_time(output_dir / "fix_times.jsonl", section_id, k, elapsed, winner)
+        if winner is None:
+            print(f"⚠️ {section_id} {k} 个并行修复候选均未通过验证 ({elapsed:.1f}s)")
+            return None
+        print(f"⚡ {section_id} 第 {winner + 1}/{k} 个修复候选在 {elapsed:.1f}s 内通过验证")
+        return winner_code
+
     def _fix_code_block(self, section_id: str, code_block: str, error_msg: str, error_info: Dict) -> Optional[str]:
         """Fix the code block"""
         # Enhanced error analysis information
@@ -656,6 +856,24 @@ class ScopeRefineFixer:
             return None
 
 
+def log_fix_time(log_path, section_id: str, candidates: int, seconds: float, winner: Optional[int]):
+    """Append time-to-first-passing-fix of one speculative round to fix_times.jsonl"""
+    record = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "section": section_id,
+        "candidates": candidates,
+        "seconds": round(seconds, 2),
+        "winner": winner,
+        "strategy": None if winner is None else winner % 3 + 1,
+        "success": winner is not None,
+    }
+    try:
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
 @dataclass
 class GridPosition:
     """Grid position information"""
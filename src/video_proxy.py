@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from render_slots import exclusive_lock
+
+
+DEFAULT_PROXY_DIR = Path(__file__).resolve().parent / "CASES" / "video_proxies"
+DEFAULT_PROXY_MAX_MB = 2000
+PRUNE_INTERVAL = 600
+
+
+@dataclass(frozen=True)
+class ProxyProfile:
+    max_height: int
+    fps: int
+    crf: int
+    preset: str = "veryfast"
+
+
+# Layout critique has to read labels and judge overlaps against GRID.png, so it keeps more pixels
+# and frames; teaching-quality evaluation only needs to follow the content.
+PROXY_PROFILES: Dict[str, ProxyProfile] = {
+    "layout": ProxyProfile(max_height=540, fps=5, crf=30),
+    "eval": ProxyProfile(max_height=360, fps=2, crf=34),
+}
+
+
+def proxy_enabled() -> bool:
+    return os.getenv("VIDEO_PROXY", "on").lower() not in ("0", "off", "false")
+
+
+def proxy_path_for(video_path, use_case: str, proxy_dir=None) -> Path:
+    """Cache location of a proxy; a new render (mtime / size change) or new profile gets a new file"""
+    src = Path(video_path).resolve()
+    st = src.stat()
+    profile = PROXY_PROFILES[use_case]
+    key = hashlib.sha1(f"{src}|{st.st_mtime_ns}|{st.st_size}|{sorted(asdict(profile).items())}".encode("utf-8")).hexdigest()
+    return Path(proxy_dir or DEFAULT_PROXY_DIR) / f"{src.stem}.{use_case}.{key[:16]}.mp4"
+
+
+def _proxy_max_bytes() -> int:
+    return int(float(os.getenv("VIDEO_PROXY_MAX_MB", DEFAULT_PROXY_MAX_MB)) * 1024 * 1024)
+
+
+def proxy_entries(proxy_dir=None) -> List[Tuple[Path, int, float]]:
+    result = []
+    for path in Path(proxy_dir or DEFAULT_PROXY_DIR).glob("*.mp4"):
+        if path.name.startswith("."):  # in-flight encode
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        result.append((path, st.st_size, st.st_mtime))
+    return result
+
+
+def prune_proxies(proxy_dir=None, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+    """Evict least recently used proxies until the directory fits; returns (# removed, bytes freed).
+
+    Every re-render gets a new proxy (the key includes the source mtime), so superseded ones
+    stop being touched and age out first.
+    """
+    limit = _proxy_max_bytes() if max_bytes is None else max_bytes
+    entries = sorted(proxy_entries(proxy_dir), key=lambda e: e[2])
+    total = sum(size for _, size, _ in entries)
+    removed, freed = 0, 0
+    for path, size, _ in entries:
+        if total <= limit:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        path.with_suffix(".lock").unlink(missing_ok=True)
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def _maybe_prune(proxy_dir: Path):
+    # Listing the directory on every new proxy is wasteful; prune at most every PRUNE_INTERVAL seconds
+    marker = proxy_dir / ".last_prune"
+    try:
+        if time.time() - marker.stat().st_mtime < PRUNE_INTERVAL:
+            return
+    except OSError:
+        pass
+    marker.touch()
+    prune_proxies(proxy_dir)
+
+
+def _ffmpeg_cmd(src: Path, dst: Path, profile: ProxyProfile):
+    vf = f"fps={profile.fps},scale=-2:'min({profile.max_height},ih)'"
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", str(src), "-vf", vf]
+    cmd += ["-c:v", "libx264", "-preset", profile.preset, "-crf", str(profile.crf), "-pix_fmt", "yuv420p"]
+    # Rendered scenes are silent; drop any stray audio track
+    cmd += ["-an", "-movflags", "+faststart", str(dst)]
+    return cmd
+
+
+def proxy_video(video_path, use_case: str, proxy_dir=None) -> str:
+    """Low-res / low-fps copy of `video_path` for MLLM upload; falls back to the original on any problem"""
+    if not proxy_enabled() or not video_path or not os.path.isfile(video_path) or shutil.which("ffmpeg") is None:
+        return video_path
+    dst = proxy_path_for(video_path, use_case, proxy_dir)
+    if dst.exists():
+        try:
+            os.utime(dst)  # LRU: mtime is the last access time
+        except OSError:
+            pass
+        return str(dst)
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # Every question thread / worker process asks for the same proxy at once; only one encodes it
+    with exclusive_lock(dst.with_suffix(".lock")):
+        if dst.exists():
+            return str(dst)
+        tmp = dst.with_name(f".{dst.stem}.{os.getpid()}.tmp.mp4")
+        try:
+            result = subprocess.run(_ffmpeg_cmd(Path(video_path), tmp, PROXY_PROFILES[use_case]), capture_output=True, text=True)
+            if result.returncode != 0 or not tmp.exists():
+                print(f"⚠️ 生成代理视频失败，改用原视频 {video_path}: {result.stderr.strip()[-300:]}")
+                return video_path
+            if tmp.stat().st_size >= os.path.getsize(video_path):
+                # Already small (short / low-res render): cache the original itself as its proxy
+                shutil.copyfile(video_path, tmp)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+    _maybe_prune(dst.parent)
+    return str(dst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or clear low-bitrate MLLM proxy videos.")
+    parser.add_argument("--proxy_dir", type=str, default=str(DEFAULT_PROXY_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    make_parser = sub.add_parser("make")
+    make_parser.add_argument("use_case", choices=sorted(PROXY_PROFILES))
+    make_parser.add_argument("videos", nargs="+")
+    prune_parser = sub.add_parser("prune", help="evict least recently used proxies down to a size limit")
+    prune_parser.add_argument("--max_size_mb", type=float, default=None, help="default: $VIDEO_PROXY_MAX_MB or 2000")
+    sub.add_parser("clear")
+    args = parser.parse_args()
+
+    if args.command == "make":
+        report = {}
+        for video in args.videos:
+            proxy = proxy_video(video, args.use_case, args.proxy_dir)
+            report[video] = {
+                "proxy": proxy,
+                "mb": round(os.path.getsize(video) / 1024 / 1024, 2),
+                "proxy_mb": round(os.path.getsize(proxy) / 1024 / 1024, 2),
+            }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    elif args.command == "prune":
+        max_bytes = None if args.max_size_mb is None else int(args.max_size_mb * 1024 * 1024)
+        removed, freed = prune_proxies(args.proxy_dir, max_bytes)
+        print(f"已清理 {removed} 个代理视频，释放 {freed / 1024 / 1024:.1f} MB")
+    else:
+        removed = 0
+        for path in Path(args.proxy_dir).glob("*.mp4"):
+            path.unlink(missing_ok=True)
+            path.with_suffix(".lock").unlink(missing_ok=True)
+            removed += 1
+        print(f"已删除 {removed} 个代理视频")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from block_render import block_fingerprints, plan_incremental_render, plan_split_ranges, split_animation_blocks
+
+SCENE = """from manim import *
+
+class DemoScene(Scene):
+    def construct(self):
+        title = Text("Demo")
+        # === Animation for Lecture Line 1 ===
+        self.play(Write(title))
+        # === Animation for Lecture Line 2 ===
+        self.play(FadeOut(title))
+        # === Animation for Lecture Line 3 ===
+        self.wait(1)
+"""
+
+
+def test_split_animation_blocks_at_lecture_line_markers():
+    parts = split_animation_blocks(SCENE, "DemoScene")
+    assert len(parts.blocks) == 3
+    assert parts.block_lines == [(6, 7), (8, 9), (10, 11)]
+    assert parts.blocks[1][1].strip() == "self.play(FadeOut(title))"
+
+
+def test_fingerprints_change_from_the_edited_block_on():
+    edited = SCENE.replace("FadeOut(title)", "FadeOut(title, shift=UP)")
+    old, new = block_fingerprints(SCENE, "DemoScene"), block_fingerprints(edited, "DemoScene")
+    assert old[0] == new[0]
+    assert old[1] != new[1] and old[2] != new[2]
+
+
+def test_fingerprints_ignore_trailing_whitespace_but_not_config():
+    assert block_fingerprints(SCENE.replace("Write(title))", "Write(title))   ")) == block_fingerprints(SCENE)
+    assert block_fingerprints(SCENE, config_key="a") != block_fingerprints(SCENE, config_key="b")
+
+
+def test_header_edit_invalidates_every_block():
+    edited = SCENE.replace('Text("Demo")', 'Text("Other")')
+    assert not set(block_fingerprints(SCENE)) & set(block_fingerprints(edited))
+
+
+def _manifest(tmp_path, code, config_key="cfg"):
+    partials = []
+    for i in range(3):
+        partial = tmp_path / f"partial_{i}.mp4"
+        partial.write_bytes(b"x")
+        partials.append(str(partial))
+    return {
+        "config_key": config_key,
+        "fingerprints": block_fingerprints(code, "DemoScene", config_key),
+        "plays": [{"block": i, "partial": p} for i, p in enumerate(partials)],
+    }
+
+
+def test_plan_reuses_partials_of_unchanged_leading_blocks(tmp_path):
+    manifest = _manifest(tmp_path, SCENE)
+    edited = SCENE.replace("self.wait(1)", "self.wait(2)")
+    plan = plan_incremental_render(edited, "DemoScene", manifest, "cfg")
+    assert plan["first_changed_block"] == 2
+    assert plan["start_animation"] == 2
+    assert plan["reuse_partials"] == [manifest["plays"][0]["partial"], manifest["plays"][1]["partial"]]
+
+
+def test_plan_renders_everything_without_a_matching_manifest(tmp_path):
+    manifest = _manifest(tmp_path, SCENE)
+    assert plan_incremental_render(SCENE, "DemoScene", None, "cfg")["start_animation"] == 0
+    assert plan_incremental_render(SCENE, "DemoScene", manifest, "other_cfg")["start_animation"] == 0
+
+
+def test_plan_stops_reusing_at_a_missing_partial(tmp_path):
+    manifest = _manifest(tmp_path, SCENE)
+    (tmp_path / "partial_1.mp4").unlink()
+    plan = plan_incremental_render(SCENE, "DemoScene", manifest, "cfg")
+    assert plan["start_animation"] == 1
+
+
+def test_plan_split_ranges_cuts_only_at_block_boundaries():
+    block_of_play = [0] * 6 + [1] * 6 + [2] * 6 + [3] * 6
+    ranges = plan_split_ranges(block_of_play, 2)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(block_of_play) - 1
+    for (_, last), (first, _) in zip(ranges, ranges[1:]):
+        assert first == last + 1
+        assert block_of_play[last] != block_of_play[first]
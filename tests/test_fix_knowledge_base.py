@@ -0,0 +1,62 @@
+from fix_knowledge_base import FixKnowledgeBase, apply_patch, error_fingerprint, make_patch
+
+OLD = """from manim import *
+
+class SceneA(Scene):
+    def construct(self):
+        circle = Circle()
+        self.play(ShowCreation(circle))
+"""
+NEW = OLD.replace("ShowCreation", "Create")
+ERROR = "Traceback (most recent call last):\n  File \"a.py\", line 6\nNameError: name 'ShowCreation' is not defined"
+
+
+def test_fingerprint_masks_names_and_keeps_the_offending_api():
+    fp = error_fingerprint(OLD, ERROR)
+    assert (fp.exc_type, fp.template, fp.api) == ("NameError", "name '{}' is not defined", "ShowCreation")
+    other = error_fingerprint(OLD, "NameError: name 'TextMobject' is not defined")
+    assert other.template == fp.template and other.key != fp.key
+    assert error_fingerprint(OLD, "Render timed out after 300s") is None
+
+
+def test_patch_applies_to_other_code_at_a_different_indentation():
+    patch = make_patch(OLD, NEW)
+    target = "class SceneB(Scene):\n    def construct(self):\n        if True:\n            self.play(ShowCreation(circle))\n"
+    assert apply_patch(target, patch) == target.replace("ShowCreation", "Create")
+
+
+def test_patch_is_rejected_when_its_lines_are_missing():
+    patch = make_patch(OLD, NEW)
+    assert apply_patch("self.play(Write(text))\n", patch) is None
+
+
+def test_insertion_is_anchored_after_the_preceding_line():
+    old = "from manim import *\nx = np.zeros(3)\n"
+    new = "from manim import *\nimport numpy as np\nx = np.zeros(3)\n"
+    patch = make_patch(old, new)
+    assert apply_patch("from manim import *\ny = np.ones(2)\n", patch) == "from manim import *\nimport numpy as np\ny = np.ones(2)\n"
+
+
+def test_large_rewrites_are_not_patches():
+    assert make_patch(OLD, "\n".join(f"line {i}" for i in range(40))) is None
+    assert make_patch(OLD, OLD) is None
+
+
+def test_knowledge_base_learns_matches_and_counts(tmp_path):
+    kb = FixKnowledgeBase(tmp_path / "kb.sqlite")
+    assert kb.learn(OLD, ERROR, NEW)
+    assert kb.learn(OLD, ERROR, NEW)  # same patch again: one row, learned twice
+
+    other_code = OLD.replace("SceneA", "SceneB")
+    [fix] = kb.matches(other_code, ERROR)
+    assert fix.exact and apply_patch(other_code, fix.hunks) == NEW.replace("SceneA", "SceneB")
+
+    [similar] = kb.matches(OLD, "NameError: name 'TextMobject' is not defined")
+    assert not similar.exact
+
+    kb.record_applied(fix.id, True)
+    kb.record_lookup(hit=True)
+    kb.record_lookup(hit=False)
+    stats = kb.stats()
+    assert stats["patches"] == 1 and stats["lookups"] == 2 and stats["hits"] == 1 and stats["hit_rate"] == 0.5
+    assert stats["top"][0]["successes"] == 1
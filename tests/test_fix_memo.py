@@ -0,0 +1,38 @@
+from fix_memo import MAX_FIX_ROUNDS_PER_SIGNATURE, SectionFixMemo, code_hash, error_signature
+
+
+def test_code_hash_ignores_trailing_whitespace_and_outer_blank_lines():
+    assert code_hash("a = 1\nb = 2\n") == code_hash("\na = 1   \nb = 2\n\n")
+    assert code_hash("a = 1") != code_hash("a = 2")
+
+
+def test_error_signature_masks_lines_addresses_and_paths():
+    a = 'File "/tmp/x/s1.py", line 12\nAttributeError: <Circle object at 0x7f00> has no attribute foo3'
+    b = 'File "/tmp/y/s2.py", line 40\nAttributeError: <Circle object at 0x7fab> has no attribute foo7'
+    assert error_signature(a) == error_signature(b)
+    assert error_signature(a).startswith("AttributeError:")
+    assert error_signature("Syntax Error: bad") != error_signature("NameError: bad")
+
+
+def test_failed_versions_are_remembered_and_detected_as_cycles():
+    memo = SectionFixMemo()
+    memo.record("v1", "dry_run", False, "NameError: name 'x' is not defined")
+    assert memo.lookup("v1  ", "dry_run").error_msg.startswith("NameError")
+    assert memo.lookup("v1", "render:draft") is None
+    assert memo.is_cycle("v1") and not memo.is_cycle("v2")
+    assert memo.summary() == {"versions": 1, "skipped_checks": 1, "cycles": 1}
+
+
+def test_timeouts_are_not_a_property_of_the_code():
+    memo = SectionFixMemo()
+    memo.record("v1", "render:draft", False, "Render timed out after 300s")
+    assert memo.lookup("v1", "render:draft") is None and not memo.is_cycle("v1")
+
+
+def test_fix_rounds_per_signature_run_out_until_regeneration():
+    memo = SectionFixMemo()
+    error = "TypeError: Code.__init__() got an unexpected keyword argument 'code'"
+    assert all(memo.start_fix_round(error) for _ in range(MAX_FIX_ROUNDS_PER_SIGNATURE))
+    assert memo.exhausted(error) and not memo.start_fix_round(error)
+    memo.new_generation()
+    assert memo.start_fix_round(error)
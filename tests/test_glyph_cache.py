@@ -0,0 +1,24 @@
+from glyph_cache import extract_glyph_literals
+
+
+def test_literal_glyphs_become_hashable_specs():
+    code = 'eq = MathTex(r"e^{i\\pi}", font_size=48, color=BLUE)\nt = Text("hello")\n'
+    specs = extract_glyph_literals(code)
+    assert ("MathTex", ("e^{i\\pi}",), (("color", ("name", "BLUE")), ("font_size", ("lit", 48)))) in specs
+    assert ("Text", ("hello",), ()) in specs
+    assert len({hash(spec) for spec in specs}) == 2
+
+
+def test_computed_arguments_are_skipped():
+    code = 'x = 3\na = Text(f"{x}")\nb = MathTex(str(x))\nc = Text("ok", color=my_color)\nd = Text("ok", t2c={"o": RED})\n'
+    assert extract_glyph_literals(code) == []
+
+
+def test_setup_layout_expands_to_its_text_calls():
+    code = 'self.setup_layout("Title", ["line one", "line two"])\n'
+    texts = [spec[1][0] for spec in extract_glyph_literals(code)]
+    assert texts == ["Title", "line one", "line two"]
+
+
+def test_unparsable_code_has_no_glyphs():
+    assert extract_glyph_literals("Text('a'") == []
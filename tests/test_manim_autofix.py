@@ -0,0 +1,57 @@
+import pytest
+
+from manim_autofix import ManimAutoFixer
+
+
+@pytest.fixture
+def fixer(tmp_path):
+    return ManimAutoFixer(stats_file=tmp_path / "stats.json")
+
+
+def _scene(body: str) -> str:
+    return "from manim import *\n\nclass S(Scene):\n    def construct(self):\n" + "".join(f"        {line}\n" for line in body.splitlines())
+
+
+def test_deprecated_names_are_renamed_everywhere_but_in_strings(fixer):
+    code = _scene('t = TextMobject("ShowCreation")\nself.play(ShowCreation(t))')
+    fixed, applied = fixer.fix(code, "NameError: name 'ShowCreation' is not defined")
+    assert applied == ["deprecated_names"]
+    assert 'Text("ShowCreation")' in fixed and "self.play(Create(t))" in fixed
+
+
+def test_code_kwargs_move_to_v019_names_and_configs(fixer):
+    code = _scene('c = Code(code="print(1)", language="python", font="Monospace", background_stroke_width=2, insert_line_no=False)')
+    fixed, applied = fixer.fix(code, "TypeError: Code.__init__() got an unexpected keyword argument 'code'")
+    assert applied == ["code_kwargs_v019"]
+    call = fixed.split("c = ", 1)[1]
+    assert "code_string='print(1)'" in call and "add_line_numbers=False" in call
+    assert "paragraph_config={'font': 'Monospace'}" in call
+    assert "background_config={'stroke_width': 2}" in call
+    compile(fixed, "<test>", "exec")
+
+
+def test_code_attribute_becomes_code_lines(fixer):
+    code = _scene('c = Code(code_string="x = 1", language="python")\nself.play(Indicate(c.code[0]))')
+    fixed, applied = fixer.fix(code, "AttributeError: 'Code' object has no attribute 'code'")
+    assert applied == ["code_lines_index"] and "c.code_lines[0]" in fixed
+
+
+def test_missing_import_is_added(fixer):
+    code = _scene("x = np.linspace(0, 1, 5)")
+    fixed, applied = fixer.fix(code, "NameError: name 'np' is not defined")
+    assert applied == ["missing_import"] and fixed.splitlines()[0] == "import numpy as np"
+
+
+def test_unrelated_errors_are_left_to_the_llm(fixer):
+    code = _scene("self.play(Write(Text('a')))")
+    assert fixer.fix(code, "ValueError: latex error converting to dvi") == (None, [])
+
+
+def test_outcomes_are_counted_per_rule(fixer):
+    error = "NameError: name 'ShowCreation' is not defined"
+    _, applied = fixer.fix(_scene("self.play(ShowCreation(Circle()))"), error)
+    fixer.record_outcome(applied, error, None)
+    fixer.record_outcome(applied, error, error)  # same error again: not resolved
+    stats = fixer.stats()
+    assert stats["rules"]["deprecated_names"]["applied"] == 1
+    assert stats["rules"]["deprecated_names"]["resolved"] == 1
@@ -0,0 +1,61 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def limiter(tmp_path, clock):
+    return RateLimiter({"gpt": (2, 6000)}, state_file=tmp_path / "buckets.json")
+
+
+def _tokens_left(limiter):
+    return limiter.stats()["gpt/m"]["tokens_left"]
+
+
+def test_reservation_is_taken_up_front(limiter):
+    assert limiter.try_acquire("gpt", "m", 4000) == 0
+    assert _tokens_left(limiter) == 2000
+    # 3000 more do not fit: wait until 1000 tokens refill at 100 tokens/s
+    assert limiter.try_acquire("gpt", "m", 3000) == pytest.approx(10)
+
+
+def test_settle_refunds_overestimates_and_charges_debt(limiter):
+    limiter.try_acquire("gpt", "m", 4000)
+    limiter.settle("gpt", "m", reserved=4000, used=1000)
+    assert _tokens_left(limiter) == 5000
+    limiter.try_acquire("gpt", "m", 1000)
+    limiter.settle("gpt", "m", reserved=1000, used=3000)
+    assert _tokens_left(limiter) == 2000
+
+
+def test_failed_call_refunds_everything_but_not_past_capacity(limiter):
+    limiter.try_acquire("gpt", "m", 4000)
+    limiter.settle("gpt", "m", reserved=4000, used=0)
+    limiter.settle("gpt", "m", reserved=4000, used=0)
+    assert _tokens_left(limiter) == 6000
+
+
+def test_requests_per_minute_and_refill(limiter, clock):
+    assert limiter.try_acquire("gpt", "m", 1) == 0
+    assert limiter.try_acquire("gpt", "m", 1) == 0
+    assert limiter.try_acquire("gpt", "m", 1) == pytest.approx(30)
+    clock[0] += 30
+    assert limiter.try_acquire("gpt", "m", 1) == 0
+
+
+def test_oversized_call_runs_against_a_full_bucket(limiter):
+    assert limiter.try_acquire("gpt", "m", 50_000) == 0
+
+
+def test_unlimited_providers_and_models_are_separate(limiter):
+    assert limiter.try_acquire("other", "m", 10**9) == 0
+    limiter.try_acquire("gpt", "a", 6000)
+    assert limiter.try_acquire("gpt", "b", 6000) == 0
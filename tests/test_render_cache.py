@@ -0,0 +1,54 @@
+import os
+import time
+
+from render_cache import RenderCache, compute_render_key
+
+SCENE = """from manim import *
+
+class DemoScene(Scene):
+    def construct(self):
+        self.add(ImageMobject("logo.png"))
+"""
+FLAGS = {"pixel_width": 854, "pixel_height": 480, "frame_rate": 15}
+
+
+def test_key_ignores_formatting_and_comments(tmp_path):
+    reformatted = SCENE.replace("self.add(", "# add the logo\n        self.add(  ").replace('"logo.png")', '"logo.png" )')
+    assert compute_render_key(SCENE, "DemoScene", FLAGS, tmp_path) == compute_render_key(reformatted, "DemoScene", FLAGS, tmp_path)
+
+
+def test_key_depends_on_scene_flags_and_code(tmp_path):
+    key = compute_render_key(SCENE, "DemoScene", FLAGS, tmp_path)
+    assert key != compute_render_key(SCENE, "OtherScene", FLAGS, tmp_path)
+    assert key != compute_render_key(SCENE, "DemoScene", {**FLAGS, "frame_rate": 30}, tmp_path)
+    assert key != compute_render_key(SCENE.replace("logo.png", "icon.png"), "DemoScene", FLAGS, tmp_path)
+
+
+def test_key_tracks_referenced_asset_content(tmp_path):
+    missing = compute_render_key(SCENE, "DemoScene", FLAGS, tmp_path)
+    (tmp_path / "logo.png").write_bytes(b"v1")
+    v1 = compute_render_key(SCENE, "DemoScene", FLAGS, tmp_path)
+    (tmp_path / "logo.png").write_bytes(b"v2")
+    v2 = compute_render_key(SCENE, "DemoScene", FLAGS, tmp_path)
+    assert len({missing, v1, v2}) == 3
+
+
+def test_put_get_roundtrip_and_lru_prune(tmp_path):
+    cache = RenderCache(tmp_path / "cache", max_size_mb=1)
+    videos = []
+    for i in range(3):
+        video = tmp_path / f"v{i}.mp4"
+        video.write_bytes(bytes([i]) * 400_000)
+        videos.append(video)
+
+    assert cache.put("a" * 64, videos[0])
+    assert cache.put("b" * 64, videos[1])
+    old = time.time() - 100
+    os.utime(cache._object_path("a" * 64), (old, old))
+    assert cache.get("a" * 64, tmp_path / "out" / "a.mp4") == str(tmp_path / "out" / "a.mp4")  # hit refreshes "a"
+    os.utime(cache._object_path("b" * 64), (old, old))
+
+    assert cache.put("c" * 64, videos[2])  # over 1 MB: evicts the least recently used entry, "b"
+    assert cache.get("b" * 64, tmp_path / "out" / "b.mp4") is None
+    assert cache.get("a" * 64, tmp_path / "out" / "a2.mp4") is not None
+    assert (tmp_path / "out" / "a.mp4").read_bytes() == videos[0].read_bytes()
@@ -0,0 +1,46 @@
+import textwrap
+
+from render_cost import MIN_TIMEOUT, MAX_TIMEOUT, RenderCostEstimate, estimate_render_cost
+
+
+def _scene(body: str) -> str:
+    lines = textwrap.indent(textwrap.dedent(body).strip(), " " * 8)
+    return f"from manim import *\n\nclass S(Scene):\n    def construct(self):\n{lines}\n"
+
+
+def test_counts_plays_waits_and_glyphs():
+    est = estimate_render_cost(
+        _scene(
+            """
+            eq = MathTex("a^2")
+            t = Text("hi")
+            self.play(Write(eq), run_time=2)
+            self.wait(3)
+            """
+        )
+    )
+    assert est.plays == 1 and est.waits == 1
+    assert est.tex_objects == 1 and est.text_objects == 1
+    assert est.animation_seconds == 5
+
+
+def test_literal_loop_bounds_multiply_the_body():
+    est = estimate_render_cost(_scene("for i in range(4):\n    self.play(FadeIn(Text(str(i))))"))
+    assert est.plays == 4 and est.text_objects == 4
+
+
+def test_higher_resolution_costs_more():
+    code = _scene("self.play(Create(Circle()), run_time=4)")
+    low = estimate_render_cost(code, {"pixel_width": 854, "pixel_height": 480, "frame_rate": 15})
+    high = estimate_render_cost(code, {"pixel_width": 1920, "pixel_height": 1080, "frame_rate": 30})
+    assert high.estimated_seconds > low.estimated_seconds
+
+
+def test_syntax_error_gives_the_base_estimate():
+    assert estimate_render_cost("def broken(:") == RenderCostEstimate()
+
+
+def test_timeout_only_raises_the_old_fixed_timeout():
+    assert MIN_TIMEOUT >= 300
+    assert RenderCostEstimate(estimated_seconds=1).timeout() == MIN_TIMEOUT
+    assert RenderCostEstimate(estimated_seconds=10_000).timeout() == MAX_TIMEOUT
@@ -0,0 +1,93 @@
+import sys
+import subprocess
+import textwrap
+
+import pytest
+
+from conftest import SRC_DIR
+
+
+@pytest.fixture
+def stub_manim(tmp_path):
+    """A manim package that imports instantly, enough for render workers to start and idle"""
+    (tmp_path / "manim").mkdir()
+    (tmp_path / "manim" / "__init__.py").write_text("")
+    return tmp_path
+
+
+def _run_script(script: str, stub_dir, timeout: float = 60) -> subprocess.CompletedProcess:
+    """Run in a fresh interpreter from a file (spawned children re-import __main__); a hang fails on timeout"""
+    script_file = stub_dir / "script.py"
+    script_file.write_text(textwrap.dedent(script))
+    env_path = f"{stub_dir}:{SRC_DIR}"
+    return subprocess.run(
+        [sys.executable, str(script_file)],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        env={"PYTHONPATH": env_path, "PATH": "/usr/bin:/bin"},
+    )
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_process_pool_exits_with_live_render_server(stub_manim, start_method):
+    # Pool workers skip atexit handlers; the server must still be shut down or the pool hangs
+    # joining its render workers
+    result = _run_script(
+        f"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from render_server import get_render_server
+
+        def task(_):
+            return get_render_server(2).num_workers
+
+        if __name__ == "__main__":
+            ctx = multiprocessing.get_context("{start_method}")
+            with ProcessPoolExecutor(max_workers=2, mp_context=ctx) as ex:
+                print(sum(ex.map(task, range(4))))
+        """,
+        stub_manim,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "8"
+
+
+def test_main_process_exits_with_live_render_server(stub_manim):
+    result = _run_script(
+        """
+        from render_server import get_render_server
+
+        server = get_render_server(2)
+        assert get_render_server() is server
+        print("ok")
+        """,
+        stub_manim,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
+
+
+def test_server_is_recreated_in_forked_child(stub_manim):
+    result = _run_script(
+        """
+        import os
+        import multiprocessing
+        from render_server import get_render_server
+
+        def child(queue):
+            queue.put(get_render_server(1).owner_pid == os.getpid())
+
+        if __name__ == "__main__":
+            get_render_server(1)
+            ctx = multiprocessing.get_context("fork")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=child, args=(queue,))
+            proc.start()
+            print(queue.get(timeout=30))
+            proc.join()
+        """,
+        stub_manim,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "True"
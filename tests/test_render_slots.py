@@ -0,0 +1,14 @@
+from contextlib import ExitStack
+
+from render_slots import RenderSlots
+
+
+def test_acquire_nowait_never_blocks_and_releases(tmp_path):
+    slots = RenderSlots(2, tmp_path)
+    with slots.acquire() as waited:
+        assert waited < 1
+        with ExitStack() as stack:
+            taken = [stack.enter_context(slots.acquire_nowait()) for _ in range(3)]
+            assert taken == [True, False, False]
+            assert slots.busy() == 2
+    assert slots.busy() == 0
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("openai")
+
+from retry_policy import CircuitBreaker, CircuitOpenError  # noqa: E402
+
+
+def _open(breaker):
+    tickets = [breaker.before_call() for _ in range(breaker.min_calls)]
+    for ticket in tickets:
+        breaker.record(ticket, False)
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("svc", min_calls=4, cooldown=0.05)
+
+
+def test_opens_after_mostly_failed_calls_and_fails_fast(breaker):
+    _open(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_outcome_of_an_in_flight_call_does_not_close_the_breaker(breaker):
+    in_flight = breaker.before_call()
+    _open(breaker)
+    breaker.record(in_flight, True)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_only_one_trial_and_only_its_outcome_counts(breaker):
+    in_flight = breaker.before_call()
+    _open(breaker)
+    time.sleep(0.06)
+    trial = breaker.before_call()
+    assert trial.trial
+    breaker.record(in_flight, False)  # late failure: neither ends the trial nor restarts the cooldown
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(trial, True)
+    assert not breaker.before_call().trial
+
+
+def test_failed_trial_reopens(breaker):
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.record(breaker.before_call(), False)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_try(breaker):
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.release(breaker.before_call())
+    assert breaker.before_call().trial